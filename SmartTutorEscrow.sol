@@ -28,10 +28,13 @@ contract SmartTutorEscrow {
         bool resolved;                 // true once funds have been paid or refunded
     }
 
+    /// @notice Minimum attendance (percent of the lesson) for the teacher to be paid
+    uint8 public constant ATTENDANCE_THRESHOLD_PCT = 95;
+
     /// @notice Platform wallet that receives the platformFee
     address payable public platformWallet;
 
-    /// @notice Trusted oracle address that can call resolveLesson()
+    /// @notice Trusted oracle address that can call resolveLesson() and resolveLessons()
     address public oracle;
 
     /// @notice Mapping of all lessons by their unique identifier
@@ -57,6 +60,10 @@ contract SmartTutorEscrow {
         uint8 studentPct
     );
 
+    /// @notice Emitted by resolveLessons() for a lesson it could not resolve
+    /// @param reason Revert data of the failed resolution (e.g. "Lesson already resolved")
+    event LessonResolutionFailed(bytes32 indexed lessonId, bytes reason);
+
     /// @notice Emitted when a lesson is cancelled before funding
     event LessonCancelled(bytes32 indexed lessonId);
 
@@ -197,6 +204,49 @@ contract SmartTutorEscrow {
         uint8 teacherPct,
         uint8 studentPct
     ) external onlyOracle {
+        _resolveLesson(lessonId, teacherPct, studentPct);
+    }
+
+    /// @notice Oracle resolves many lessons in one transaction
+    /// @dev Each lesson is resolved in its own call frame, so a lesson that fails
+    ///      (not funded, already resolved, payment failed) is rolled back alone and
+    ///      reported with LessonResolutionFailed instead of reverting the batch
+    /// @return resolved Number of lessons resolved
+    function resolveLessons(
+        bytes32[] calldata lessonIds,
+        uint8[] calldata teacherPct,
+        uint8[] calldata studentPct
+    ) external onlyOracle returns (uint256 resolved) {
+        require(
+            teacherPct.length == lessonIds.length && studentPct.length == lessonIds.length,
+            "Length mismatch"
+        );
+
+        for (uint256 i = 0; i < lessonIds.length; i++) {
+            try this.resolveLessonInBatch(lessonIds[i], teacherPct[i], studentPct[i]) {
+                resolved++;
+            } catch (bytes memory reason) {
+                emit LessonResolutionFailed(lessonIds[i], reason);
+            }
+        }
+    }
+
+    /// @dev One lesson of resolveLessons(); only the contract itself can call it
+    function resolveLessonInBatch(
+        bytes32 lessonId,
+        uint8 teacherPct,
+        uint8 studentPct
+    ) external {
+        require(msg.sender == address(this), "Only self");
+        _resolveLesson(lessonId, teacherPct, studentPct);
+    }
+
+    /// @dev Settlement rules shared by resolveLesson() and resolveLessons()
+    function _resolveLesson(
+        bytes32 lessonId,
+        uint8 teacherPct,
+        uint8 studentPct
+    ) internal {
         Lesson storage lesson = lessons[lessonId];
 
         require(lesson.status == LessonStatus.Funded, "Lesson not funded");
@@ -205,33 +255,7 @@ contract SmartTutorEscrow {
         // Mark as resolved so it cannot be processed twice
         lesson.resolved = true;
 
-        // If the student already approved, always pay the teacher
-        if (lesson.studentApproved) {
-            lesson.status = LessonStatus.ResolvedPaid;
-            _payOut(lesson, lessonId, teacherPct, studentPct);
-            return;
-        }
-
-        bool payTeacher;
-
-        // 1) Happy path: both attended >= 95%
-        if (teacherPct >= 95 && studentPct >= 95) {
-            payTeacher = true;
-        }
-        // 2) Student no-show: teacher >= 95%, student < 5%
-        else if (teacherPct >= 95 && studentPct < 5) {
-            payTeacher = true;
-        }
-        // 3) Teacher no-show: teacher < 5%, student >= 95%
-        else if (teacherPct < 5 && studentPct >= 95) {
-            payTeacher = false;
-        }
-        // 4) All other edge cases: default to refund in the MVP
-        else {
-            payTeacher = false;
-        }
-
-        if (payTeacher) {
+        if (paysTeacher(teacherPct, studentPct, lesson.studentApproved)) {
             lesson.status = LessonStatus.ResolvedPaid;
             _payOut(lesson, lessonId, teacherPct, studentPct);
         } else {
@@ -240,6 +264,27 @@ contract SmartTutorEscrow {
         }
     }
 
+    /// @notice Whether a resolution pays the teacher (true) or refunds the student (false)
+    /// @dev The settlement policy shared with the backend (backend/policy.py):
+    ///      Student Override: the student approved -> pay the teacher
+    ///      Teacher No-Show:  teacher < 95%        -> refund the student
+    ///      Student No-Show:  student < 95%        -> pay the teacher
+    ///      Happy Path:       both >= 95%          -> pay the teacher
+    ///      This intentionally changes the earlier on-chain rules, which paid only
+    ///      when the student was >= 95% or < 5% and refunded everything in between
+    ///      (e.g. teacher 95% / student 50% was refunded and is now paid), so that
+    ///      the contract settles every lesson the way the backend does. The
+    ///      student's attendance no longer decides the payout and is only reported
+    ///      in LessonResolved. backend/policy_check.py compares the deployed
+    ///      contract with the backend's decision table.
+    function paysTeacher(
+        uint8 teacherPct,
+        uint8, /* studentPct */
+        bool studentApproved
+    ) public pure returns (bool) {
+        return studentApproved || teacherPct >= ATTENDANCE_THRESHOLD_PCT;
+    }
+
     /// @notice Student can cancel a lesson before funding
     function cancelLesson(bytes32 lessonId) external {
         Lesson storage lesson = lessons[lessonId];
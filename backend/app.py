@@ -1,39 +1,388 @@
+import os
+import signal
+import sys
+import threading
+
 from flask import Flask, jsonify, request
-from contract import SmartContract
+from cache import TTLCache
+from contract import INITIAL_BALANCES, RESOLVED_STATUSES, SmartContract, new_lesson_id
+from fastjson import FastJSONProvider
+from indexes import parse_cursor
+from money import from_minor, to_minor
 from oracle import Oracle
+from oracle_client import AsyncOracleClient, HttpTransport, StubTransport
+from policy import OUTCOME_NAMES, TABLE as POLICY_TABLE, THRESHOLD_PCT
+from scheduler import ResolutionScheduler
+from settlement import is_duration, parse_batch
+from sharding import shard_initial_balances
+from stream import EventHub, stream
+from txid import content_lesson_id
 
 app = Flask(__name__)
+# jsonify() encodes with orjson when it is installed
+app.json = FastJSONProvider(app)
+
+# When started by router.py this process is shard SHARD_INDEX of SHARD_COUNT
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+
+# Live event stream for /api/events, fed by the contract as events are logged
+event_hub = EventHub(
+    queue_size=int(os.environ.get('EVENT_QUEUE_SIZE', 1000)),
+    max_subscribers=int(os.environ.get('EVENT_MAX_SUBSCRIBERS', 100))
+)
 
 # Initialize Singletons
-contract = SmartContract()
+# Both are safe to share across threads: SmartContract locks per lesson/wallet
+# and the oracle takes the scenario per call.
+contract = SmartContract(
+    event_log_capacity=int(os.environ.get('EVENT_LOG_CAPACITY', 10000)),
+    event_log_path=os.environ.get('EVENT_LOG_PATH', os.path.join('data', 'events.log')),
+    ledger_dir=os.environ.get('LEDGER_DIR', os.path.join('data', 'ledger')),
+    snapshot_every=int(os.environ.get('SNAPSHOT_EVERY', 100000)),
+    initial_balances=shard_initial_balances(INITIAL_BALANCES, SHARD_INDEX, SHARD_COUNT),
+    hub=event_hub
+)
 oracle = Oracle()
 
+# Concurrent attendance fetches for batch settlement. Uses the Meet stub
+# server when MEET_API_URL is set, the in-process scenario stub otherwise.
+ORACLE_CONCURRENCY = int(os.environ.get('ORACLE_CONCURRENCY', 32))
+ORACLE_TIMEOUT = float(os.environ.get('ORACLE_TIMEOUT', 5))
+if os.environ.get('MEET_API_URL'):
+    meet_transport = HttpTransport(os.environ['MEET_API_URL'], timeout=ORACLE_TIMEOUT, workers=ORACLE_CONCURRENCY)
+else:
+    meet_transport = StubTransport(oracle, latency=float(os.environ.get('ORACLE_LATENCY', 0)))
+# Attendance already fetched for a lesson/meeting is reused on retries and UI reruns
+attendance_cache = TTLCache(
+    maxsize=int(os.environ.get('ATTENDANCE_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('ATTENDANCE_CACHE_TTL', 300))
+)
+oracle_client = AsyncOracleClient(
+    meet_transport,
+    concurrency=ORACLE_CONCURRENCY,
+    timeout=ORACLE_TIMEOUT,
+    cache=attendance_cache
+)
+
+# Funded lessons with a scheduled_start are resolved automatically
+# SCHEDULER_LAG seconds after they end, in batches
+scheduler = ResolutionScheduler(
+    contract,
+    oracle_client,
+    lag=float(os.environ.get('SCHEDULER_LAG', 60)),
+    batch_size=int(os.environ.get('SCHEDULER_BATCH_SIZE', 1000)),
+    concurrency=int(os.environ.get('SCHEDULER_CONCURRENCY', 4)),
+    retry_delay=float(os.environ.get('SCHEDULER_RETRY_DELAY', 60))
+)
+scheduler.load(contract.lessons.values())
+scheduler.start()
+
+# With CHAIN_RPC_URL every resolution is also sent to SmartTutorEscrow.sol at
+# ESCROW_ADDRESS as resolveLesson(), signed with ORACLE_PRIVATE_KEY
+chain_submitter = None
+if os.environ.get('CHAIN_RPC_URL'):
+    from chain import ResolutionRelay, SettlementSubmitter, connect
+    w3, oracle_account = connect(os.environ['CHAIN_RPC_URL'], os.environ['ORACLE_PRIVATE_KEY'])
+    chain_submitter = SettlementSubmitter(
+        w3,
+        os.environ['ESCROW_ADDRESS'],
+        oracle_account,
+        max_in_flight=int(os.environ.get('CHAIN_MAX_IN_FLIGHT', 256)),
+        replace_after=float(os.environ.get('CHAIN_REPLACE_AFTER', 60)),
+        confirmations=int(os.environ.get('CHAIN_CONFIRMATIONS', 0))
+    )
+    chain_submitter.start()
+    chain_relay = ResolutionRelay(contract, chain_submitter, os.environ.get('CHAIN_CURSOR_PATH', os.path.join('data', 'chain.cursor')))
+    chain_relay.start()
+
+# The escrow contract's events, indexed into SQLite for /api/chain/events
+chain_indexer = None
+if os.environ.get('CHAIN_RPC_URL'):
+    from chain_indexer import ChainIndexer
+    chain_indexer = ChainIndexer(
+        w3,
+        os.environ['ESCROW_ADDRESS'],
+        os.environ.get('CHAIN_INDEX_PATH', os.path.join('data', 'chain.db')),
+        start_block=int(os.environ.get('CHAIN_START_BLOCK', 0)),
+        confirmations=int(os.environ.get('CHAIN_CONFIRMATIONS', 0))
+    )
+    chain_indexer.start()
+
+def state_cursor(params):
+    # (since, epoch) of the client's last state, either one None when not
+    # sent. Raises ValueError for values that aren't integers.
+    since = params.get('since')
+    epoch = params.get('epoch')
+    try:
+        return (int(since) if since is not None else None, int(epoch) if epoch is not None else None)
+    except TypeError:
+        raise ValueError("state cursor must be integers")
+
+def state_since(params):
+    # Incremental state when the client sends the `seq` (and `epoch`) of its
+    # last response, otherwise the full snapshot. `"state": false` skips it.
+    if params.get('state') is False:
+        return None
+    try:
+        since, epoch = state_cursor(params)
+    except ValueError:
+        # The request has already been carried out, so an unreadable cursor
+        # gets the full snapshot rather than an error
+        since = epoch = None
+    return contract.get_state(since=since, epoch=epoch)
+
+# Requests being handled, so shutdown() can let them finish
+in_flight = 0
+in_flight_done = threading.Condition()
+
+@app.before_request
+def request_started():
+    global in_flight
+    with in_flight_done:
+        in_flight += 1
+
+@app.teardown_request
+def request_finished(exc):
+    global in_flight
+    with in_flight_done:
+        in_flight -= 1
+        in_flight_done.notify_all()
+
+def shutdown(timeout=30):
+    # Graceful shutdown, once the server has stopped accepting requests:
+    # waits up to `timeout` seconds for requests in progress, lets the
+    # scheduler finish the batches it is settling and the chain submitter
+    # its transactions, then closes the journal and event log.
+    with in_flight_done:
+        in_flight_done.wait_for(lambda: in_flight == 0, timeout)
+    scheduler.stop(drain=True)
+    if chain_submitter is not None:
+        chain_relay.stop()
+        chain_submitter.stop(drain=True)
+    if chain_indexer is not None:
+        chain_indexer.stop()
+    contract.close()
+
 @app.route('/api/state', methods=['GET'])
 def get_state():
-    return jsonify(contract.get_state())
+    # Nothing changed since the client's copy: skip building and serializing the state
+    tag = contract.state_tag()
+    if request.if_none_match.contains(tag):
+        response = app.response_class(status=304)
+        response.set_etag(tag)
+        return response
+
+    try:
+        since, epoch = state_cursor(request.args)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid state cursor."}), 400
+    state = contract.get_state(since=since, epoch=epoch)
+    response = jsonify(state)
+    response.set_etag(f"{state['epoch']}-{state['seq']}")
+    return response
+
+@app.route('/api/logs', methods=['GET'])
+def get_logs():
+    # Historical events by sequence number, including ones spilled to disk
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', 1000)), 10000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid query parameters."}), 400
+    return jsonify({"logs": contract.logs.read(since, since + limit), "seq": len(contract.logs)})
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    # Server-Sent Events: one event per log entry (named after the contract
+    # events) followed by a `balances` event with the wallets it changed.
+    # `?since=<seq>` or a reconnect's Last-Event-ID replays missed entries first.
+    try:
+        if request.headers.get('Last-Event-ID') is not None:
+            next_seq = int(request.headers['Last-Event-ID']) + 1
+        elif request.args.get('since') is not None:
+            next_seq = int(request.args['since'])
+        else:
+            next_seq = None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid event cursor."}), 400
+
+    subscriber = event_hub.subscribe()
+    if subscriber is None:
+        return jsonify({"status": "error", "message": "Too many subscribers."}), 503
+    # Subscribed before reading the backlog, so nothing falls in between.
+    # Events in both are sent once, stream() skips seqs already sent.
+    try:
+        epoch = contract.epoch
+        seq = len(contract.logs)
+        backlog = []
+        if next_seq is None:
+            next_seq = seq
+        if seq - next_seq > event_hub.queue_size:
+            # Too far behind to replay, the client catches up with /api/state
+            backlog = None
+        elif 0 <= next_seq < seq:
+            backlog = contract.logs.read(next_seq)
+    except Exception:
+        event_hub.unsubscribe(subscriber)
+        raise
+    response = app.response_class(stream(event_hub, subscriber, backlog, epoch, next_seq), mimetype='text/event-stream')
+    # Also covers a client that disconnects before the stream is started
+    response.call_on_close(lambda: event_hub.unsubscribe(subscriber))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/chain', methods=['GET'])
+def get_chain():
+    # On-chain settlement submission, when CHAIN_RPC_URL is set
+    if chain_submitter is None:
+        return jsonify({"enabled": False})
+    return jsonify({
+        "enabled": True,
+        "in_flight": len(chain_submitter),
+        "next_nonce": chain_submitter.next_nonce(),
+        "confirmed": chain_submitter.confirmed,
+        "reverted": chain_submitter.reverted,
+        "replaced": chain_submitter.replaced,
+        "failed": chain_submitter.failed,
+        "relay": {
+            "submitted": chain_relay.submitted,
+            "skipped": chain_relay.skipped,
+            "retried": chain_relay.retried,
+            "failed": chain_relay.failed,
+            "errors": chain_relay.errors,
+            "last_error": chain_relay.last_error
+        }
+    })
+
+@app.route('/api/chain/events', methods=['GET'])
+def get_chain_events():
+    # Indexed on-chain events, oldest first. Optional `lesson_id`, `event`
+    # (e.g. LessonResolved) and `since_block`.
+    if chain_indexer is None:
+        return jsonify({"status": "error", "message": "Chain indexing is not enabled."}), 404
+    try:
+        since_block = int(request.args['since_block']) if 'since_block' in request.args else None
+        limit = min(int(request.args.get('limit', 1000)), 10000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid query parameters."}), 400
+    return jsonify({
+        "events": chain_indexer.query(request.args.get('lesson_id'), request.args.get('event'), since_block, limit),
+        "block": chain_indexer.cursor()
+    })
+
+@app.route('/api/policy', methods=['GET'])
+def get_policy():
+    # The compiled settlement policy: table[override][teacherPct][studentPct]
+    # is the outcome code
+    return jsonify({
+        "threshold_pct": THRESHOLD_PCT,
+        "outcomes": {code: name for code, name in OUTCOME_NAMES.items()},
+        "table": POLICY_TABLE.tolist()
+    })
+
+@app.route('/api/scheduler', methods=['GET'])
+def get_scheduler():
+    return jsonify({
+        "pending": len(scheduler),
+        "next_due": scheduler.next_due(),
+        "resolved": scheduler.resolved,
+        "failed": scheduler.failed
+    })
+
+@app.route('/api/tx/<tx_hash>', methods=['GET'])
+def get_transaction(tx_hash):
+    # Transaction ids embed their event's sequence number, so this is a direct read
+    entry = contract.logs.by_tx(tx_hash)
+    if entry is None:
+        return jsonify({"status": "error", "message": "Unknown transaction."}), 404
+    return jsonify(entry)
 
 @app.route('/api/reset', methods=['POST'])
 def reset():
     contract.reset()
+    attendance_cache.clear()
+    scheduler.clear()
     return jsonify({"message": "System reset successfully", "state": contract.get_state()})
 
 @app.route('/api/fund', methods=['POST'])
 def fund():
     data = request.json or {}
-    price = data.get('price', 30)
+    # Amounts in requests and responses are USD, the ledger keeps cents
+    price = to_minor(data.get('price', 30))
     lesson_title = data.get('lesson_title', 'Lesson')
-    success, message = contract.fund_lesson(price, lesson_title)
+    student = data.get('student', 'student')
+    teacher = data.get('teacher', 'teacher')
+    scheduled_start = data.get('scheduled_start')
+    duration_minutes = data.get('duration_minutes', 60)
+    if scheduled_start is not None and not is_duration(scheduled_start):
+        return jsonify({"status": "error", "message": "scheduled_start must be a Unix timestamp."}), 400
+    if not (is_duration(duration_minutes) and duration_minutes > 0):
+        return jsonify({"status": "error", "message": "duration_minutes must be a positive number."}), 400
+    lesson_id = data.get('lesson_id')
+    if not lesson_id and scheduled_start is not None:
+        # Derived from the booking, so a retried booking gets the same lessonId
+        try:
+            lesson_id = content_lesson_id(student, teacher, scheduled_start, data.get('nonce', 0))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    lesson_id = lesson_id or new_lesson_id()
+    success, message = contract.fund_lesson(
+        price,
+        lesson_title,
+        lesson_id=lesson_id,
+        student=student,
+        teacher=teacher,
+        scheduled_start=scheduled_start,
+        duration_minutes=duration_minutes
+    )
     if success:
-        return jsonify({"status": "success", "message": message, "state": contract.get_state()})
+        scheduler.schedule(contract.get_lesson(lesson_id))
+        return jsonify({"status": "success", "message": message, "lesson_id": lesson_id, "state": state_since(data)})
     else:
         return jsonify({"status": "error", "message": message}), 400
 
+@app.route('/api/lessons', methods=['GET'])
+def query_lessons():
+    # Lessons filtered by `student`, `teacher`, `status` and end time
+    # (`ended_after` inclusive, `ended_before` exclusive, Unix seconds),
+    # ordered by end time and served from the contract's indexes. Pass
+    # `next_cursor` back as `cursor` for the next page.
+    args = request.args
+    try:
+        limit = int(args.get('limit', 100))
+        ended_after = float(args['ended_after']) if 'ended_after' in args else None
+        ended_before = float(args['ended_before']) if 'ended_before' in args else None
+        cursor = parse_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid query parameters."}), 400
+    if not 1 <= limit <= 1000:
+        return jsonify({"status": "error", "message": "limit must be between 1 and 1000."}), 400
+    lessons, next_cursor = contract.query_lessons(
+        student=args.get('student'),
+        teacher=args.get('teacher'),
+        status=args.get('status'),
+        ended_after=ended_after,
+        ended_before=ended_before,
+        cursor=cursor,
+        limit=limit
+    )
+    return jsonify({"lessons": [lesson.to_dict() for lesson in lessons], "next_cursor": next_cursor})
+
+@app.route('/api/lessons/<lesson_id>', methods=['GET'])
+def get_lesson(lesson_id):
+    lesson = contract.get_lesson(lesson_id)
+    if lesson is None:
+        return jsonify({"status": "error", "message": "Unknown lesson."}), 404
+    return jsonify(lesson.to_dict())
+
 @app.route('/api/topup', methods=['POST'])
 def topup():
     data = request.json or {}
-    amount = data.get('amount', 100)
-    success, message = contract.topup_student(amount)
-    return jsonify({"status": "success", "message": message, "state": contract.get_state()})
+    amount = to_minor(data.get('amount', 100))
+    success, message = contract.topup_student(amount, data.get('wallet', 'student'))
+    return jsonify({"status": "success", "message": message, "state": state_since(data)})
 
 @app.route('/api/scenario', methods=['POST'])
 def set_scenario():
@@ -46,26 +395,146 @@ def set_scenario():
 def resolve():
     # Optional: Set scenario if provided
     data_req = request.json or {}
-    if 'scenario' in data_req:
-        oracle.set_scenario(data_req['scenario'])
+    scenario = data_req.get('scenario')
+    if scenario is not None:
+        oracle.set_scenario(scenario)
+
+    # Without a lessonId the most recently funded lesson is resolved
+    lesson_id = data_req.get('lesson_id') or contract.current_lesson_id
 
-    # 1. Oracle fetches data (Simulated)
-    data = oracle.get_meeting_data()
+    # Retried request for a settled lesson: answer with the stored outcome
+    # without asking the oracle again or touching balances
+    lesson = contract.get_lesson(lesson_id)
+    if lesson is not None and lesson.status in RESOLVED_STATUSES:
+        return jsonify({
+            "lesson_id": lesson_id,
+            "oracle_data": lesson.oracle_data,
+            "contract_outcome": lesson.outcome,
+            "status": lesson.status,
+            "replayed": True,
+            "state": state_since(data_req)
+        })
+
+    # 1. Oracle fetches data (Simulated), unless it is cached for this lesson
+    data = attendance_cache.get(lesson_id) if lesson_id else None
+    if data is None:
+        data = oracle.get_meeting_data(scenario)
+        if lesson_id:
+            attendance_cache.set(lesson_id, data)
     
     # 2. Oracle calls Smart Contract
     success, outcome = contract.resolve_lesson(
         teacher_duration=data['teacher_duration'],
         student_duration=data['student_duration'],
-        oracle_data=data
+        oracle_data=data,
+        lesson_id=lesson_id
     )
     
+    lesson = contract.get_lesson(lesson_id)
     response = {
+        "lesson_id": lesson_id,
         "oracle_data": data,
         "contract_outcome": outcome,
-        "state": contract.get_state()
+        "status": lesson.status if lesson is not None else None,
+        "state": state_since(data_req)
     }
     
     return jsonify(response)
 
+@app.route('/api/resolve/batch', methods=['POST'])
+def resolve_batch():
+    # Body: {"lessons": [[lesson_id, teacher_duration, student_duration], ...]}
+    # Records may also be objects with those keys. An object with a
+    # `meeting_code` instead of durations has its attendance fetched by the
+    # oracle, concurrently with the rest of the batch. The whole batch is
+    # checked before any lesson is settled; results come back in input order.
+    data_req = request.json or {}
+    error, items, required_duration = parse_batch(data_req)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+
+    results = [None] * len(items)
+    to_fetch = {}
+    for i, (lesson_id, _, _, meeting_code, _) in enumerate(items):
+        if meeting_code is not None:
+            to_fetch[i] = meeting_code
+
+    attendance = {}
+    if to_fetch:
+        attendance = oracle_client.get_meeting_data_many(set(to_fetch.values()), data_req.get('scenario'))
+
+    positions = []
+    records = []
+    for i, (lesson_id, teacher_duration, student_duration, meeting_code, student_override) in enumerate(items):
+        if meeting_code is not None:
+            data = attendance[meeting_code]
+            if isinstance(data, Exception):
+                results[i] = {"lesson_id": lesson_id, "success": False, "outcome": f"Oracle error: {data}"}
+                continue
+            teacher_duration, student_duration = data['teacher_duration'], data['student_duration']
+            student_override = student_override or data.get('student_override', False)
+        positions.append(i)
+        records.append((lesson_id, teacher_duration, student_duration, student_override))
+
+    for i, result in zip(positions, contract.resolve_many(records, required_duration=required_duration)):
+        results[i] = result
+    resolved = sum(1 for result in results if result['success'])
+
+    return jsonify({
+        "results": results,
+        "resolved": resolved,
+        "failed": len(results) - resolved,
+        "balances": {wallet: from_minor(amount) for wallet, amount in list(contract.balances.items())}
+    })
+
+# -----------------------------------------------------------------------------
+# Shard-internal endpoints used by router.py. Amounts are minor units.
+# -----------------------------------------------------------------------------
+
+@app.route('/api/shard/balances', methods=['GET'])
+def shard_balances():
+    # in_flight: amounts sent to other shards that haven't arrived yet
+    in_flight = {}
+    for wallet, amount, _ in list(contract.transfers_out.values()):
+        in_flight[wallet] = in_flight.get(wallet, 0) + amount
+    return jsonify({
+        "shard": SHARD_INDEX,
+        "epoch": contract.epoch,
+        "seq": len(contract.logs),
+        "balances": dict(contract.balances),
+        "in_flight": in_flight,
+        "tx_fee_bps": contract.tx_fee_bps
+    })
+
+@app.route('/api/shard/transfers', methods=['GET'])
+def shard_transfers():
+    # Transfers sent by this shard that the receiver hasn't confirmed yet
+    return jsonify({"transfers": dict(contract.transfers_out)})
+
+@app.route('/api/shard/transfer_out', methods=['POST'])
+def shard_transfer_out():
+    data = request.json
+    success, message = contract.transfer_out(data['wallet'], int(data['amount']), data['transfer_id'], data['target'])
+    return jsonify({"status": "success" if success else "error", "message": message}), 200 if success else 400
+
+@app.route('/api/shard/transfer_in', methods=['POST'])
+def shard_transfer_in():
+    data = request.json
+    success, message = contract.transfer_in(data['wallet'], int(data['amount']), data['transfer_id'])
+    return jsonify({"status": "success", "message": message})
+
+@app.route('/api/shard/transfer_done', methods=['POST'])
+def shard_transfer_done():
+    success, message = contract.transfer_done(request.json['transfer_id'])
+    return jsonify({"status": "success", "message": message})
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # Threaded development server. There is no debug reloader, which would
+    # start a second process on the same ledger. For production serve
+    # asgi:application with an ASGI server (see asgi.py). SIGTERM, e.g.
+    # from router.py, shuts down gracefully like Ctrl-C.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        app.run(port=int(os.environ.get('PORT', 5000)), threaded=True)
+    finally:
+        shutdown()
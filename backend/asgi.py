@@ -0,0 +1,101 @@
+import asyncio
+import os
+import threading
+
+from a2wsgi import WSGIMiddleware
+
+import app as backend
+
+# Production entry point: the Flask app served by an ASGI server, one
+# process per ledger (a shard, or the single backend):
+#
+#   uvicorn asgi:application --port 5000 --no-access-log
+#
+# Routes are the same WSGI views as app.py's, run by a2wsgi on a thread pool
+# since they block on the contract's locks. Event streams send each frame as
+# it is produced. The server drops frames for a client that went away, so a
+# stream is ended here when its client disconnects: the frame being
+# produced (at most one keepalive interval away) is the last, then the
+# stream is closed and unsubscribed. On shutdown the server stops accepting
+# connections and app.shutdown() drains the backend.
+#
+# Don't pass --workers above 1: every worker would open the same ledger.
+
+# One thread per possible event stream, plus room for ordinary requests
+THREADS = int(os.environ.get('ASGI_THREADS', backend.event_hub.max_subscribers + 32))
+
+DISCONNECTED = 'smarttutor.disconnected'
+
+
+def until_disconnected(iterable, disconnected):
+    # The response body, ending once `disconnected` is set
+    try:
+        for chunk in iterable:
+            if disconnected.is_set():
+                return
+            yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+def wsgi_app(environ, start_response):
+    return until_disconnected(backend.app(environ, start_response), environ['asgi.scope'][DISCONNECTED])
+
+
+wsgi = WSGIMiddleware(wsgi_app, workers=THREADS)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def http(scope, receive, send):
+    # The body is read up front, so the client's receive channel is left to
+    # watch for the disconnect
+    body = await read_body(receive)
+    if body is None:
+        return
+    disconnected = threading.Event()
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def replay():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def watch():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        await wsgi(dict(scope, **{DISCONNECTED: disconnected}), replay, send)
+    finally:
+        watcher.cancel()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Importing app.py already recovered the ledger and started its threads
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(wsgi.executor, backend.shutdown)
+            wsgi.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        await http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await lifespan(receive, send)
@@ -0,0 +1,136 @@
+import csv
+import json
+import sys
+from collections import deque
+from datetime import datetime
+
+from oracle_client import STUDENT_EMAIL, TEACHER_EMAIL
+
+# Streaming reader for Google Meet participant exports.
+#
+# Exports are JSON lines or CSV and one row is either a whole session
+#   {"meetingCode", "email", "startTime", "endTime"[, "role"]}
+# or a single join/leave event
+#   {"meetingCode", "email", "event": "join" | "leave", "timestamp"[, "role"]}
+# Timestamps are ISO 8601 or Unix seconds. Rows must be grouped by meeting
+# (as Meet exports are), so only the meeting being read is held in memory.
+
+
+def _timestamp(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def read_rows(path):
+    # Yields export rows as dicts, one line at a time
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def read_sessions(rows):
+    # Turns rows into (meeting_code, email, role, start, end) sessions. A
+    # participant can be joined more than once (e.g. a second device), so
+    # each leave is paired with their earliest open join. A join without a
+    # leave by the end of its meeting is dropped.
+    open_joins = {}
+    meeting = None
+    for row in rows:
+        meeting_code = row.get("meetingCode") or row.get("meeting_code")
+        if meeting_code != meeting:
+            open_joins = {}
+            meeting = meeting_code
+        email = row.get("email")
+        role = row.get("role")
+        event = row.get("event")
+        if event == "join":
+            open_joins.setdefault(email, deque()).append((_timestamp(row["timestamp"]), role))
+        elif event == "leave":
+            joins = open_joins.get(email)
+            if joins:
+                joined = joins.popleft()
+                yield meeting_code, email, role or joined[1], joined[0], _timestamp(row["timestamp"])
+        else:
+            yield meeting_code, email, role, _timestamp(row["startTime"]), _timestamp(row["endTime"])
+
+
+def merged_seconds(intervals):
+    # Length of the union of (start, end) intervals, so overlapping sessions
+    # (e.g. a second device or a reconnect before the old session timed out)
+    # are counted once
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        elif end > current_end:
+            current_end = end
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _summary(meeting_code, intervals, roles, teacher_email, student_email):
+    durations = {"teacher": 0.0, "student": 0.0}
+    for email, spans in intervals.items():
+        role = roles.get(email)
+        if role is None:
+            role = "teacher" if email == teacher_email else "student" if email == student_email else None
+        if role in durations:
+            durations[role] += merged_seconds(spans) / 60
+    return {
+        "meeting_code": meeting_code,
+        "teacher_duration": durations["teacher"],
+        "student_duration": durations["student"]
+    }
+
+
+def meeting_durations(sessions, teacher_email=TEACHER_EMAIL, student_email=STUDENT_EMAIL):
+    # Yields {"meeting_code", "teacher_duration", "student_duration"} (minutes)
+    # per meeting, as soon as the export moves on to the next meeting.
+    # Participants are matched by their `role` column when present, by email otherwise.
+    meeting = None
+    intervals = {}
+    roles = {}
+    for meeting_code, email, role, start, end in sessions:
+        if meeting_code != meeting:
+            if meeting is not None:
+                yield _summary(meeting, intervals, roles, teacher_email, student_email)
+            meeting = meeting_code
+            intervals = {}
+            roles = {}
+        intervals.setdefault(email, []).append((start, end))
+        if role:
+            roles[email] = role
+    if meeting is not None:
+        yield _summary(meeting, intervals, roles, teacher_email, student_email)
+
+
+def resolve_from_export(contract, path, lesson_id_for=None, batch_size=1000, required_duration=60):
+    # Streams an export into contract.resolve_many() in batches. lesson_id_for
+    # maps a meeting code to its lesson id (the meeting code itself by default).
+    # Yields the results of each batch.
+    batch = []
+    for summary in meeting_durations(read_sessions(read_rows(path))):
+        lesson_id = lesson_id_for(summary["meeting_code"]) if lesson_id_for else summary["meeting_code"]
+        batch.append((lesson_id, summary["teacher_duration"], summary["student_duration"]))
+        if len(batch) >= batch_size:
+            yield contract.resolve_many(batch, required_duration=required_duration)
+            batch = []
+    if batch:
+        yield contract.resolve_many(batch, required_duration=required_duration)
+
+
+if __name__ == '__main__':
+    # python3 attendance.py export.jsonl  -> one JSON line of durations per meeting
+    for summary in meeting_durations(read_sessions(read_rows(sys.argv[1]))):
+        print(json.dumps(summary))
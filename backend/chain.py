@@ -0,0 +1,572 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from events import LESSON_RESOLVED
+from txid import keccak256
+
+# Submits settlements to SmartTutorEscrow.sol as real transactions.
+#
+# The oracle account's nonces are assigned locally, so many transactions are
+# in flight at once and submit() never waits for a receipt. One confirmer
+# thread polls the account's mined nonce and picks up the receipts of
+# everything below it. A transaction still pending after `replace_after`
+# seconds is sent again with the same nonce and a higher gas price
+# (replacement). One that can't be sent at all is retried, and after
+# `max_attempts` its nonce is filled with a zero-value self-transfer so the
+# transactions after it are not stuck behind a gap.
+#
+# Works against any JSON-RPC node (anvil, Polygon) or an in-process
+# Web3(EthereumTesterProvider()).
+
+logger = logging.getLogger(__name__)
+
+
+class SubmissionFailed(Exception):
+    pass
+
+
+class Reverted(SubmissionFailed):
+    # Mined with status 0, e.g. "Lesson already resolved"
+    def __init__(self, receipt):
+        super().__init__(f"Transaction {receipt['transactionHash'].hex()} reverted")
+        self.receipt = receipt
+
+
+def selector(signature):
+    return keccak256(signature.encode())[:4]
+
+
+RESOLVE_LESSON = selector("resolveLesson(bytes32,uint8,uint8)")
+
+
+def encode_uint(value):
+    return int(value).to_bytes(32, "big")
+
+
+def encode_bytes32(lesson_id):
+    # 0x-prefixed hex lesson id -> 32 raw bytes
+    raw = bytes.fromhex(lesson_id[2:] if lesson_id.startswith("0x") else lesson_id)
+    if len(raw) != 32:
+        raise ValueError(f"lesson id is not bytes32: {lesson_id}")
+    return raw
+
+
+def is_bytes32(lesson_id):
+    # Whether a lesson id can be sent on-chain. Lessons funded with a
+    # free-form id (e.g. "L1") only exist in the backend.
+    if not isinstance(lesson_id, str):
+        return False
+    try:
+        encode_bytes32(lesson_id)
+    except ValueError:
+        return False
+    return True
+
+
+def encode_resolve_lesson(lesson_id, teacher_pct, student_pct):
+    # Calldata of resolveLesson(lessonId, teacherPct, studentPct)
+    return RESOLVE_LESSON + encode_bytes32(lesson_id) + encode_uint(teacher_pct) + encode_uint(student_pct)
+
+
+RESOLVE_LESSONS = selector("resolveLessons(bytes32[],uint8[],uint8[])")
+LESSON_RESOLUTION_FAILED = keccak256(b"LessonResolutionFailed(bytes32,bytes)")
+
+ERROR_SELECTOR = selector("Error(string)")
+# Revert reason of a lesson that is already settled on-chain, e.g. by the
+# student's approvePayment(); sending it again can't succeed
+ALREADY_RESOLVED = "Lesson already resolved"
+
+# Upper bounds on the gas of a resolveLessons() transaction: the transaction
+# and call overhead, plus per lesson (worst case, payout to a teacher and
+# platform wallet that don't exist yet):
+#   self-call and argument copying                        ~3,000
+#   cold reads of the lesson's 5 slots and platformWallet ~12,600
+#   status/resolved write                                 ~3,000
+#   two value CALLs, each cold (2,600) + value (9,000)
+#   + new account (25,000)                                ~73,200
+#   LessonResolved event                                  ~2,000
+# ~94,000, and the try/catch forwards only 63/64 of the remaining gas.
+# Calldata is counted on top. tests/test_escrow.py measures the real cost.
+BATCH_BASE_GAS = 40000
+LESSON_GAS = 120000
+
+
+def encode_resolve_lessons(resolutions):
+    # Calldata of resolveLessons(lessonIds, teacherPct, studentPct) for a list
+    # of (lesson_id, teacher_pct, student_pct)
+    n = len(resolutions)
+    # Each array is its length followed by n words; the head holds their offsets
+    array_size = 32 * (n + 1)
+    head = encode_uint(96) + encode_uint(96 + array_size) + encode_uint(96 + 2 * array_size)
+    lesson_ids = b"".join(encode_bytes32(lesson_id) for lesson_id, _, _ in resolutions)
+    teacher_pcts = b"".join(encode_uint(teacher_pct) for _, teacher_pct, _ in resolutions)
+    student_pcts = b"".join(encode_uint(student_pct) for _, _, student_pct in resolutions)
+    return (
+        RESOLVE_LESSONS + head
+        + encode_uint(n) + lesson_ids
+        + encode_uint(n) + teacher_pcts
+        + encode_uint(n) + student_pcts
+    )
+
+
+def calldata_gas(data):
+    # Intrinsic gas of calldata: 4 per zero byte, 16 per other byte
+    zeros = data.count(0)
+    return 4 * zeros + 16 * (len(data) - zeros)
+
+
+def resolution_batches(resolutions, gas_limit=8000000):
+    # Packs (lesson_id, teacher_pct, student_pct) tuples into resolveLessons()
+    # calls of at most gas_limit gas each. Yields (resolutions, calldata, gas)
+    # per call.
+    empty_gas = BATCH_BASE_GAS + calldata_gas(encode_resolve_lessons([]))
+    batch = []
+    gas = empty_gas
+    for resolution in resolutions:
+        # The lesson's three words of calldata
+        lesson_gas = LESSON_GAS + calldata_gas(encode_bytes32(resolution[0]) + encode_uint(resolution[1]) + encode_uint(resolution[2]))
+        if batch and gas + lesson_gas > gas_limit:
+            yield batch, encode_resolve_lessons(batch), gas
+            batch = []
+            gas = empty_gas
+        batch.append(resolution)
+        gas += lesson_gas
+    if batch:
+        yield batch, encode_resolve_lessons(batch), gas
+
+
+def _word(data, offset):
+    return int.from_bytes(data[offset:offset + 32], "big")
+
+
+def revert_reason(data):
+    # Message of a require()/revert("...") (Error(string) revert data), None
+    # for anything else, e.g. running out of gas
+    if data[:4] != ERROR_SELECTOR:
+        return None
+    offset = 4 + _word(data, 4)
+    length = _word(data, offset)
+    return data[offset + 32:offset + 32 + length].decode("utf-8", "replace")
+
+
+def failed_resolutions(receipt):
+    # {lesson_id: revert reason or None} of the lessons a resolveLessons()
+    # transaction reported with LessonResolutionFailed
+    failed = {}
+    for log in receipt["logs"]:
+        if log["topics"] and bytes(log["topics"][0]) == LESSON_RESOLUTION_FAILED:
+            data = bytes(log["data"])
+            # The event's only data argument is `bytes reason`
+            offset = _word(data, 0)
+            reason = data[offset + 32:offset + 32 + _word(data, offset)]
+            failed["0x" + bytes(log["topics"][1]).hex()] = revert_reason(reason)
+    return failed
+
+
+def failed_lessons(receipt):
+    # Lesson ids a resolveLessons() transaction reported with LessonResolutionFailed
+    return list(failed_resolutions(receipt))
+
+
+class Submission:
+    __slots__ = ("nonce", "to", "data", "gas", "gas_price", "hashes", "sent_at", "attempts", "future")
+
+    def __init__(self, to, data, gas, future):
+        self.nonce = None
+        self.to = to
+        self.data = data
+        self.gas = gas
+        self.gas_price = 0
+        # Every hash sent with this nonce; any one of them may be mined
+        self.hashes = []
+        # 0 until a send has been accepted by the node
+        self.sent_at = 0
+        self.attempts = 0
+        self.future = future
+
+
+class SettlementSubmitter:
+    def __init__(self, w3, escrow_address, account, gas=200000, gas_price=None, max_gas_price=None, gas_bump=1.125,
+                 max_in_flight=256, replace_after=60.0, max_attempts=5, confirmations=0, poll_interval=1.0):
+        # `account` is an eth_account LocalAccount of the contract's oracle;
+        # transactions are signed locally. `gas_price` (wei) defaults to the
+        # node's price at each send. Replacements multiply the previous price
+        # by `gas_bump`, up to `max_gas_price`. At most `max_in_flight`
+        # transactions are unconfirmed at once; submit() blocks beyond that.
+        # A receipt counts once `confirmations` more blocks are on top of it.
+        self.w3 = w3
+        self.escrow_address = Web3.to_checksum_address(escrow_address)
+        self.account = account
+        self.gas = gas
+        self.gas_price = gas_price
+        self.max_gas_price = max_gas_price
+        self.gas_bump = gas_bump
+        self.replace_after = replace_after
+        self.max_attempts = max_attempts
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.chain_id = w3.eth.chain_id
+        self.confirmed = 0
+        self.reverted = 0
+        self.failed = 0
+        self.replaced = 0
+        # nonce -> Submission, for every transaction not yet confirmed
+        self._pending = {}
+        self._nonce = None
+        self._lock = threading.Lock()
+        # Sends go out in nonce order, so the node never sees a gap
+        self._send_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._thread is None:
+            self._nonce = self.w3.eth.get_transaction_count(self.account.address, "pending")
+            self._thread = threading.Thread(target=self._run, name="chain-confirmer", daemon=True)
+            self._thread.start()
+
+    def stop(self, drain=True):
+        # With `drain` waits until every transaction sent so far is confirmed
+        if drain:
+            while self._pending and self._thread is not None and self._thread.is_alive():
+                time.sleep(self.poll_interval)
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def next_nonce(self):
+        return self._nonce
+
+    def submit(self, lesson_id, teacher_pct, student_pct):
+        # Sends resolveLesson() and returns a Future of its receipt. The
+        # future fails with Reverted if the call reverts and with
+        # SubmissionFailed if it could not be sent.
+        return self.submit_call(encode_resolve_lesson(lesson_id, teacher_pct, student_pct))
+
+    def submit_batch(self, resolutions, gas_limit=8000000):
+        # Sends (lesson_id, teacher_pct, student_pct) tuples as resolveLessons()
+        # calls of at most gas_limit gas. Returns (resolutions, future) per
+        # transaction. A lesson that can't be resolved doesn't fail its
+        # future, see failed_resolutions().
+        return [(batch, self.submit_call(data, gas)) for batch, data, gas in resolution_batches(resolutions, gas_limit)]
+
+    def submit_call(self, data, gas=None):
+        # Sends a call with the given calldata to the escrow contract
+        future = Future()
+        self._slots.acquire()
+        submission = Submission(self.escrow_address, data, gas or self.gas, future)
+        with self._send_lock:
+            with self._lock:
+                submission.nonce = self._nonce
+                self._nonce += 1
+                self._pending[submission.nonce] = submission
+            self._send(submission)
+        return future
+
+    def _price(self, submission):
+        price = self.gas_price or self.w3.eth.gas_price
+        if submission.gas_price:
+            # Nodes only accept a replacement that pays at least 10% more
+            price = max(price, int(submission.gas_price * self.gas_bump) + 1)
+        if self.max_gas_price:
+            price = min(price, self.max_gas_price)
+        return price
+
+    def _at_max_price(self, submission):
+        return self.max_gas_price is not None and submission.gas_price >= self.max_gas_price
+
+    def _send(self, submission):
+        # One attempt at sending the submission at its nonce. Returns whether
+        # the node accepted it.
+        submission.attempts += 1
+        try:
+            gas_price = self._price(submission)
+            signed = self.account.sign_transaction({
+                "chainId": self.chain_id,
+                "nonce": submission.nonce,
+                "to": submission.to,
+                "value": 0,
+                "data": submission.data,
+                "gas": submission.gas,
+                "gasPrice": gas_price
+            })
+            raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+            tx_hash = signed.hash
+            try:
+                self.w3.eth.send_raw_transaction(raw)
+            except Exception as e:
+                message = str(e).lower()
+                # The node already has this exact transaction from an earlier try
+                if "already known" not in message and "known transaction" not in message:
+                    raise
+        except Exception as e:
+            if "nonce too low" in str(e).lower() and not submission.hashes:
+                # Something else used the nonce; the confirmer moves it on
+                submission.sent_at = 0
+            if submission.attempts >= self.max_attempts and not submission.future.done():
+                self._fail(submission, SubmissionFailed(str(e)))
+            return False
+        if submission.hashes:
+            self.replaced += 1
+        submission.gas_price = gas_price
+        submission.hashes.append(tx_hash)
+        submission.sent_at = time.monotonic()
+        # Only consecutive failed sends count towards max_attempts
+        submission.attempts = 0
+        return True
+
+    def _fail(self, submission, error):
+        # Gives up on the submission's call but keeps its nonce pending as a
+        # zero-value self-transfer, which later nonces can be mined after
+        self.failed += 1
+        submission.future.set_exception(error)
+        submission.to = self.account.address
+        submission.data = b""
+        submission.gas = 21000
+        submission.attempts = 0
+
+    def _receipt(self, submission):
+        # Receipt of whichever of the submission's transactions was mined
+        for tx_hash in reversed(submission.hashes):
+            try:
+                return self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return None
+
+    def _run(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self._poll()
+            except Exception:
+                # RPC unavailable: try again next round
+                continue
+
+    def _poll(self):
+        mined = self.w3.eth.get_transaction_count(self.account.address, "latest")
+        head = self.w3.eth.block_number
+        with self._lock:
+            pending = sorted(self._pending.items())
+        now = time.monotonic()
+
+        for nonce, submission in pending:
+            if nonce < mined:
+                receipt = self._receipt(submission)
+                if receipt is None:
+                    # Mined by a transaction that isn't ours: send again at a new nonce
+                    self._resubmit(submission)
+                    continue
+                if receipt["blockNumber"] + self.confirmations > head:
+                    continue
+                self._settle(submission, receipt)
+            elif not submission.sent_at or (now - submission.sent_at >= self.replace_after and not self._at_max_price(submission)):
+                with self._send_lock:
+                    self._send(submission)
+
+    def _settle(self, submission, receipt):
+        with self._lock:
+            del self._pending[submission.nonce]
+        if not submission.future.done():
+            if receipt["status"] == 1:
+                self.confirmed += 1
+                submission.future.set_result(receipt)
+            else:
+                self.reverted += 1
+                submission.future.set_exception(Reverted(receipt))
+        self._slots.release()
+
+    def _resubmit(self, submission):
+        with self._send_lock:
+            with self._lock:
+                del self._pending[submission.nonce]
+                if submission.future.done():
+                    # A filler whose nonce got used anyway
+                    self._slots.release()
+                    return
+                submission.nonce = self._nonce
+                self._nonce += 1
+                self._pending[submission.nonce] = submission
+            submission.gas_price = 0
+            submission.hashes = []
+            submission.attempts = 0
+            self._send(submission)
+
+
+class ResolutionRelay:
+    # Follows the contract's event log and submits the LessonResolved entries
+    # on-chain with their teacherPct/studentPct, batched with resolveLessons().
+    # The next seq to submit is kept in `cursor_path` with the log's
+    # transaction id prefix, so after a restart the relay continues where it
+    # stopped, and starts over when the log was reset.
+    #
+    # A lesson the backend paid out on the student's override is sent as
+    # 100%/100%, like approvePayment() reports it, so the contract pays the
+    # teacher too. Lessons whose id isn't a bytes32 don't exist on-chain and
+    # are skipped. A batch that can't be submitted is logged and retried.
+    #
+    # Lessons that come back in LessonResolutionFailed (e.g. not funded
+    # on-chain yet, or out of gas), and every lesson of a transaction that
+    # failed or reverted, are sent again after `retry_delay` seconds, up to
+    # `max_retries` times. Lessons already resolved on-chain are not. Each
+    # error is logged and counted in `errors`; lessons given up on in `failed`.
+
+    def __init__(self, contract, submitter, cursor_path, poll_interval=0.5, batch_gas_limit=8000000, max_retries=3, retry_delay=30.0):
+        self.contract = contract
+        self.batch_gas_limit = batch_gas_limit
+        self.submitter = submitter
+        self.cursor_path = cursor_path
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.submitted = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed = 0
+        self.errors = 0
+        self.last_error = None
+        # [due time, attempt, resolution] of lessons to send again; filled by
+        # the confirmer's callbacks, submitted by the relay thread
+        self._retries = []
+        self._retries_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _load_cursor(self, logs):
+        try:
+            with open(self.cursor_path) as f:
+                prefix, seq = f.read().split()
+            if prefix == logs.tx_ids.prefix:
+                return int(seq)
+        except (OSError, ValueError):
+            pass
+        return logs.first_seq()
+
+    def _save_cursor(self, logs, seq):
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{logs.tx_ids.prefix} {seq}\n")
+        os.replace(tmp_path, self.cursor_path)
+
+    def start(self):
+        if self._thread is None:
+            directory = os.path.dirname(self.cursor_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="chain-relay", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def resolutions(self, entries):
+        # (lesson_id, teacher_pct, student_pct) to submit for a run of log entries
+        resolutions = []
+        for entry in entries:
+            if entry["event"] != LESSON_RESOLVED:
+                continue
+            if not is_bytes32(entry["lesson_id"]):
+                self.skipped += 1
+                logger.warning("not relaying lesson %r: its id is not a bytes32", entry["lesson_id"])
+                continue
+            if entry.get("studentApproved"):
+                resolutions.append((entry["lesson_id"], 100, 100))
+            else:
+                resolutions.append((entry["lesson_id"], entry["teacherPct"], entry["studentPct"]))
+        return resolutions
+
+    def _error(self, error):
+        self.errors += 1
+        self.last_error = str(error)
+        logger.error("relaying resolutions failed: %s", error)
+
+    def _submit(self, resolutions, attempt=0):
+        # Submits resolutions sent `attempt` times before
+        for batch, future in self.submitter.submit_batch(resolutions, self.batch_gas_limit):
+            future.add_done_callback(lambda future, batch=batch: self._done(future, batch, attempt))
+
+    def _done(self, future, batch, attempt):
+        error = future.exception()
+        if error is not None:
+            self._error(error)
+            self._retry(batch, attempt)
+            return
+        failed = failed_resolutions(future.result())
+        retry = []
+        for resolution in batch:
+            if resolution[0].lower() not in failed:
+                continue
+            reason = failed[resolution[0].lower()]
+            self._error(f"lesson {resolution[0]} was not resolved: {reason or 'no revert reason (out of gas?)'}")
+            if reason != ALREADY_RESOLVED:
+                retry.append(resolution)
+        self._retry(retry, attempt)
+
+    def _retry(self, resolutions, attempt):
+        if attempt >= self.max_retries:
+            self.failed += len(resolutions)
+            for resolution in resolutions:
+                logger.error("giving up on resolving lesson %s on-chain", resolution[0])
+            return
+        due = time.monotonic() + self.retry_delay
+        with self._retries_lock:
+            self._retries.extend([due, attempt + 1, resolution] for resolution in resolutions)
+
+    def _submit_retries(self):
+        now = time.monotonic()
+        with self._retries_lock:
+            due = [retry for retry in self._retries if retry[0] <= now]
+            self._retries = [retry for retry in self._retries if retry[0] > now]
+        by_attempt = {}
+        for _, attempt, resolution in due:
+            by_attempt.setdefault(attempt, []).append(resolution)
+        for attempt, resolutions in by_attempt.items():
+            try:
+                self._submit(resolutions, attempt)
+                self.retried += len(resolutions)
+            except Exception as e:
+                self._error(e)
+                with self._retries_lock:
+                    self._retries.extend([now + self.retry_delay, attempt, resolution] for resolution in resolutions)
+
+    def _run(self):
+        logs = None
+        while not self._stopped.is_set():
+            self._submit_retries()
+            if logs is not self.contract.logs:
+                # Started, or the contract was reset and has a new log
+                logs = self.contract.logs
+                seq = self._load_cursor(logs)
+            entries = logs.read(seq, seq + 1000)
+            if not entries:
+                self._stopped.wait(self.poll_interval)
+                continue
+            resolutions = self.resolutions(entries)
+            try:
+                if resolutions:
+                    self._submit(resolutions)
+            except Exception as e:
+                # The cursor stays put, so these entries are submitted again
+                self._error(e)
+                self._stopped.wait(self.poll_interval)
+                continue
+            self.submitted += len(resolutions)
+            seq += len(entries)
+            self._save_cursor(logs, seq)
+
+
+def connect(rpc_url, private_key):
+    # (Web3, LocalAccount) for a JSON-RPC endpoint and the oracle's key
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    return w3, w3.eth.account.from_key(private_key)
@@ -0,0 +1,296 @@
+import json
+import os
+import sqlite3
+import threading
+
+from web3 import Web3
+
+from events import LESSON_CANCELLED, LESSON_CREATED, LESSON_FUNDED, LESSON_RESOLVED
+from txid import keccak256
+
+# Follows SmartTutorEscrow.sol's lesson events into a local SQLite database,
+# so history queries don't rescan the chain.
+#
+# Logs are fetched with eth_getLogs over block ranges that adapt to the node:
+# a range the node refuses as too large (too many results, response too
+# large, timeout) is halved and retried, one that comes back small doubles
+# the next range. Other errors end the round and it is retried as a whole.
+# A refused size caps the ranges, and the cap is lifted again step by step
+# after `ceiling_recovery` ranges went through. Each
+# range is inserted in one SQLite transaction together with the new cursor
+# and a checkpoint of the range's last block hash. Before every range the
+# cursor block's hash is compared with the chain's; after a reorg the index
+# is rolled back to the newest checkpoint still on the chain and continues
+# from there.
+
+LESSON_RESOLUTION_FAILED = "LessonResolutionFailed"
+
+# Fragments of the errors nodes and providers return for an eth_getLogs range
+# that is too large; -32005 is the JSON-RPC "limit exceeded" code
+RANGE_ERRORS = (
+    "-32005", "more than", "too many", "too large", "too wide", "limited to", "block range", "response size",
+    "timeout", "timed out"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    lesson_id TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_by_lesson ON events (lesson_id, block_number, log_index);
+CREATE INDEX IF NOT EXISTS events_by_event ON events (event, block_number, log_index);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    block_number INTEGER PRIMARY KEY,
+    block_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _word(data, i):
+    return int.from_bytes(data[32 * i:32 * i + 32], "big")
+
+
+def _address(topic):
+    return Web3.to_checksum_address(topic[-20:])
+
+
+def _bytes_arg(data, i):
+    # Dynamic `bytes` argument whose offset is in word i
+    offset = _word(data, i)
+    length = int.from_bytes(data[offset:offset + 32], "big")
+    return "0x" + data[offset + 32:offset + 32 + length].hex()
+
+
+# topic0 -> (event name, decoder of its non-lesson fields from (topics, data))
+DECODERS = {
+    keccak256(b"LessonCreated(bytes32,address,address,uint256,uint256)"): (LESSON_CREATED, lambda topics, data: {
+        "student": _address(topics[2]), "teacher": _address(topics[3]),
+        "lessonPrice": _word(data, 0), "platformFee": _word(data, 1)
+    }),
+    keccak256(b"LessonFunded(bytes32,uint256)"): (LESSON_FUNDED, lambda topics, data: {
+        "totalAmount": _word(data, 0)
+    }),
+    keccak256(b"LessonResolved(bytes32,uint8,uint8,uint8)"): (LESSON_RESOLVED, lambda topics, data: {
+        "status": _word(data, 0), "teacherPct": _word(data, 1), "studentPct": _word(data, 2)
+    }),
+    keccak256(b"LessonCancelled(bytes32)"): (LESSON_CANCELLED, lambda topics, data: {}),
+    keccak256(b"LessonResolutionFailed(bytes32,bytes)"): (LESSON_RESOLUTION_FAILED, lambda topics, data: {
+        "reason": _bytes_arg(data, 0)
+    })
+}
+
+
+def _hex(value):
+    return "0x" + bytes(value).hex()
+
+
+def range_too_large(error):
+    # Whether an eth_getLogs error means the range should be smaller
+    if isinstance(error, TimeoutError):
+        return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(fragment in message for fragment in RANGE_ERRORS)
+
+
+class ChainIndexer:
+    def __init__(self, w3, escrow_address, db_path, start_block=0, confirmations=0, batch_blocks=1000, max_batch_blocks=100000,
+                 target_logs=5000, checkpoints=256, poll_interval=2.0, ceiling_recovery=50):
+        # Indexes blocks from start_block (e.g. the contract's deployment
+        # block) up to `confirmations` blocks behind the head. Ranges start
+        # at `batch_blocks` and stay below `max_batch_blocks`, and shrink when
+        # they return more than `target_logs` logs. The newest `checkpoints`
+        # range ends are kept for reorg rollback; a deeper reorg reindexes
+        # from start_block. A range size the node refused is not tried again
+        # until `ceiling_recovery` ranges have been indexed.
+        self.w3 = w3
+        self.escrow_address = Web3.to_checksum_address(escrow_address)
+        self.db_path = db_path
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.batch_blocks = batch_blocks
+        self.max_batch_blocks = max_batch_blocks
+        self.target_logs = target_logs
+        self.checkpoints = checkpoints
+        self.poll_interval = poll_interval
+        self.ceiling_recovery = ceiling_recovery
+        self.reorgs = 0
+        self._range_ceiling = max_batch_blocks
+        # Ranges indexed since the ceiling was last lowered or raised
+        self._ranges_below_ceiling = 0
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written only by the indexing thread; readers get their own connections
+        self._db = self._connect()
+        self._db.executescript(SCHEMA)
+        self._readers = threading.local()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        # WAL lets readers query while a range is being inserted
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def cursor(self):
+        # Last indexed block, for other threads
+        return self._cursor(self._reader())
+
+    def _cursor(self, db):
+        row = db.execute("SELECT value FROM meta WHERE key = 'cursor'").fetchone()
+        return int(row[0]) if row else self.start_block - 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chain-indexer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.sync()
+            except Exception:
+                # Node unavailable: try again next round
+                pass
+            self._stopped.wait(self.poll_interval)
+
+    def sync(self):
+        # Indexes up to the confirmed head. Returns the number of events added.
+        head = self.w3.eth.block_number - self.confirmations
+        added = 0
+        while not self._stopped.is_set():
+            self._check_reorg()
+            from_block = self._cursor(self._db) + 1
+            if from_block > head:
+                return added
+            to_block = min(head, from_block + self.batch_blocks - 1)
+            try:
+                added += self._index_range(from_block, to_block)
+            except Exception as e:
+                if to_block == from_block or not range_too_large(e):
+                    raise
+                # Ranges don't grow back to a size the node refused for a while
+                self.batch_blocks = max(1, (to_block - from_block + 1) // 2)
+                self._range_ceiling = self.batch_blocks
+                self._ranges_below_ceiling = 0
+                continue
+            self._ranges_below_ceiling += 1
+            if self._ranges_below_ceiling >= self.ceiling_recovery and self._range_ceiling < self.max_batch_blocks:
+                # The node's limit may have been temporary (load, timeouts)
+                self._range_ceiling = min(self.max_batch_blocks, self._range_ceiling * 2)
+                self._ranges_below_ceiling = 0
+        return added
+
+    def _block_hash(self, number):
+        return _hex(self.w3.eth.get_block(number)["hash"])
+
+    def _index_range(self, from_block, to_block):
+        end_hash = self._block_hash(to_block)
+        logs = self.w3.eth.get_logs({
+            "address": self.escrow_address,
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [[_hex(topic) for topic in DECODERS]]
+        })
+        # The end block changed while the logs were fetched: they may be from either fork
+        if self._block_hash(to_block) != end_hash:
+            raise RuntimeError(f"block {to_block} was reorganized during indexing")
+
+        rows = []
+        for log in logs:
+            topics = [bytes(topic) for topic in log["topics"]]
+            event, decode = DECODERS[topics[0]]
+            rows.append((
+                log["blockNumber"], log["logIndex"], _hex(log["transactionHash"]), event,
+                _hex(topics[1]), json.dumps(decode(topics, bytes(log["data"])), separators=(",", ":"))
+            ))
+
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)", rows)
+            db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", (to_block, end_hash))
+            db.execute(
+                "DELETE FROM checkpoints WHERE block_number NOT IN "
+                "(SELECT block_number FROM checkpoints ORDER BY block_number DESC LIMIT ?)",
+                (self.checkpoints,)
+            )
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('cursor', ?)", (str(to_block),))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        # Grow ranges that come back small, shrink ones that come back large
+        if len(logs) > self.target_logs:
+            self.batch_blocks = max(1, self.batch_blocks // 2)
+        elif len(logs) < self.target_logs // 4:
+            self.batch_blocks = min(self.max_batch_blocks, self._range_ceiling, self.batch_blocks * 2)
+        return len(rows)
+
+    def _check_reorg(self):
+        # Rolls back to the newest checkpoint that is still on the chain
+        db = self._db
+        checkpoints = db.execute("SELECT block_number, block_hash FROM checkpoints ORDER BY block_number DESC").fetchall()
+        if not checkpoints or self._block_hash(checkpoints[0][0]) == checkpoints[0][1]:
+            return
+        self.reorgs += 1
+        keep = self.start_block - 1
+        for number, block_hash in checkpoints[1:]:
+            if self._block_hash(number) == block_hash:
+                keep = number
+                break
+        db.execute("BEGIN")
+        try:
+            db.execute("DELETE FROM events WHERE block_number > ?", (keep,))
+            db.execute("DELETE FROM checkpoints WHERE block_number > ?", (keep,))
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('cursor', ?)", (str(keep),))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _reader(self):
+        db = getattr(self._readers, "db", None)
+        if db is None:
+            db = self._readers.db = self._connect()
+        return db
+
+    def query(self, lesson_id=None, event=None, since_block=None, limit=1000):
+        # Indexed events, oldest first, filtered by lesson and/or event name
+        clauses, params = [], []
+        if lesson_id is not None:
+            clauses.append("lesson_id = ?")
+            params.append(lesson_id.lower())
+        if event is not None:
+            clauses.append("event = ?")
+            params.append(event)
+        if since_block is not None:
+            clauses.append("block_number >= ?")
+            params.append(since_block)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT block_number, log_index, tx_hash, event, lesson_id, fields FROM events {where} "
+            "ORDER BY block_number, log_index LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [
+            dict(json.loads(fields), event=event, lesson_id=lesson_id, block_number=block_number, log_index=log_index, tx_hash=tx_hash)
+            for block_number, log_index, tx_hash, event, lesson_id, fields in rows
+        ]
@@ -1,129 +1,665 @@
-import time
+import os
+import threading
 
-class SmartContract:
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        # Initial Balances (Mock USD)
-        self.balances = {
-            "student": 100,
-            "teacher": 0,
-            "contract": 0,
-            "platform": 0
-        }
+from events import EventLog, NEW_TX, LESSON_FUNDED, LESSON_RESOLVED, WALLET_TOPPED_UP, WALLET_TRANSFERRED
+from indexes import LessonIndexes
+from ledger import Journal, load_snapshot, read_journal, write_snapshot
+from money import fee, format_minor, from_minor
+from settlement import SETTLEMENT_FIELDS, STUDENT_OVERRIDE, TEACHER_NO_SHOW, is_duration, outcome_message, settle, settle_arrays
+from txid import TxIds
+
+# Final lesson states. Resolving a lesson that is already in one is a no-op
+# that returns the stored outcome, so retried requests are idempotent.
+RESOLVED_STATUSES = ("COMPLETED", "REFUNDED")
+
+# Locks are striped by hash so independent lessons/wallets rarely share one,
+# without allocating a lock per record.
+LOCK_STRIPES = 64
+
+# Opening balances (Mock USD, in cents), keyed by wallet
+INITIAL_BALANCES = {
+    "student": 10000,
+    "teacher": 0,
+    "contract": 0,
+    "platform": 0
+}
+
+
+class Lesson:
+    # Mirrors the `Lesson` struct in SmartTutorEscrow.sol. __slots__ keeps each
+    # record small so tens of thousands of open lessons stay cheap. `price` is
+    # in minor units. `scheduled_start` is a Unix timestamp, None for lessons
+    # booked without one.
+    __slots__ = ("lesson_id", "student", "teacher", "title", "price", "status", "oracle_data", "outcome", "scheduled_start", "duration_minutes")
+
+    def __init__(self, lesson_id, student, teacher, title, price, scheduled_start=None, duration_minutes=60):
+        self.lesson_id = lesson_id
+        self.student = student
+        self.teacher = teacher
+        self.title = title
+        self.price = price
         self.status = "CREATED" # CREATED, FUNDED, COMPLETED, REFUNDED
-        self.lesson_price = 30
-        self.platform_fee_percent = 0.02
+        self.oracle_data = None
+        self.outcome = None
+        self.scheduled_start = scheduled_start
+        self.duration_minutes = duration_minutes
+
+    def end_time(self):
+        # Unix time the lesson is over, None without a scheduled start
+        if self.scheduled_start is None:
+            return None
+        return self.scheduled_start + self.duration_minutes * 60
+
+    def to_dict(self):
+        return {
+            "lesson_id": self.lesson_id,
+            "student": self.student,
+            "teacher": self.teacher,
+            "title": self.title,
+            "price": from_minor(self.price),
+            "status": self.status,
+            "oracle_data": self.oracle_data,
+            "outcome": self.outcome,
+            "scheduled_start": self.scheduled_start,
+            "duration_minutes": self.duration_minutes
+        }
+
+
+def pct(value):
+    # Attendance percentage as the uint8 the contract's LessonResolved event carries
+    return max(0, min(100, int(value)))
+
+
+def new_lesson_id():
+    # Random bytes32-style identifier for lessons without a scheduled start.
+    # Booked lessons use txid.content_lesson_id(), derived from the booking.
+    return "0x" + os.urandom(32).hex()
+
+
+class SmartContract:
+    def __init__(self, event_log_capacity=10000, event_log_path=None, ledger_dir=None, snapshot_every=100000, sync_commits=True, initial_balances=None, hub=None):
+        # Older events beyond the in-memory capacity are spilled to event_log_path.
+        # With a ledger_dir every operation is journaled there and the state is
+        # recovered from it on startup. sync_commits makes each operation wait
+        # until its journal record is fsynced (shared with concurrent callers).
+        # initial_balances replaces INITIAL_BALANCES, e.g. for one shard's share.
+        # New events are pushed to `hub` (a stream.EventHub) as they are logged.
+        self.hub = hub
+        self.initial_balances = dict(initial_balances if initial_balances is not None else INITIAL_BALANCES)
+        self.event_log_capacity = event_log_capacity
+        self.event_log_path = event_log_path
+        self.ledger_dir = ledger_dir
+        self.snapshot_every = snapshot_every
+        self.sync_commits = sync_commits
+        self.logs = None
+        self.journal = None
+        self._snapshot_lsn = 0
+        # Background snapshot in progress, if any, started and joined under
+        # _snapshot_thread_lock. _snapshot_lock serializes snapshot() itself.
+        self._snapshot_thread = None
+        self._snapshot_thread_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._closed = False
+        self._lesson_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._wallet_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._counter_lock = threading.Lock()
+        # Random start so cursors from a previous process never look current
+        self.epoch = int.from_bytes(os.urandom(4), "big")
+        # With a ledger the event log is opened by _recover(), which may continue the existing one
+        self._reset(spill=not ledger_dir)
+        if ledger_dir:
+            self._recover()
+
+    def _lesson_lock(self, lesson_id):
+        return self._lesson_locks[hash(lesson_id) % LOCK_STRIPES]
+
+    def _wallet_lock(self, wallet):
+        return self._wallet_locks[hash(wallet) % LOCK_STRIPES]
+
+    def _credit(self, wallet, amount):
+        with self._wallet_lock(wallet):
+            self.balances[wallet] = self.balances.get(wallet, 0) + amount
+
+    def _debit(self, wallet, amount):
+        # Check-and-debit in one critical section so two fundings can't both pass the check
+        with self._wallet_lock(wallet):
+            balance = self.balances.get(wallet, 0)
+            if balance < amount:
+                return False
+            self.balances[wallet] = balance - amount
+            return True
+
+    def _count_open(self, delta):
+        with self._counter_lock:
+            self.open_lessons += delta
+
+    def _lock_all(self):
+        # Lock order is always lesson stripes, then wallet stripes, then the counter
+        locks = self._lesson_locks + self._wallet_locks + [self._counter_lock]
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    def _unlock_all(self, locks):
+        for lock in reversed(locks):
+            lock.release()
+
+    def reset(self, tx_prefix=None):
+        # The new event log's transaction id prefix is journaled, so replay
+        # gives its events the same ids (tx_prefix is passed by replay)
+        tx_ids = TxIds(prefix=tx_prefix)
+        locks = self._lock_all()
+        try:
+            lsn = self._journal({"op": "reset", "tx_prefix": tx_ids.prefix})
+            self._reset(tx_ids)
+            if self.hub is not None:
+                self.hub.publish_reset(self.epoch)
+        finally:
+            self._unlock_all(locks)
+        self._durable(lsn)
+
+    def _reset(self, tx_ids=None, spill=True):
+        self.balances = dict(self.initial_balances)
+        # lessonId -> Lesson, like `mapping(bytes32 => Lesson) lessons`
+        self.lessons = {}
+        # By student, teacher, status and end time, see query_lessons()
+        self.indexes = LessonIndexes()
+        self.open_lessons = 0
+        # Most recently funded lesson, used when callers don't pass a lessonId
+        self.current_lesson_id = None
+        self.lesson_price = 3000
+        # Fee rates in basis points: 2% platform fee, 0.1% transaction fee
+        self.platform_fee_bps = 200
         # TODO: Fix this hardcoded value
-        self.tx_fee_percent = 0.001 
-        self.logs = []
-        self.last_oracle_data = None
-        self.last_outcome = None
+        self.tx_fee_bps = 10
+        # Route single resolutions through the NumPy kernel as well
+        self.vectorized = False
+        if self.logs is not None:
+            self.logs.close()
+        self.logs = EventLog(self.event_log_capacity, self.event_log_path if spill else None, tx_ids=tx_ids, listener=self._publish)
+        # Bumped on every reset so clients holding an old cursor get a full snapshot
+        self.epoch += 1
         self.transactions = []
+        # Cross-shard transfers: sent ones until the receiver confirms
+        # (transfer_id -> [wallet, amount, target shard]), received ids forever
+        self.transfers_out = {}
+        self.transfers_in = set()
+
+    def _event(self, event, message, tx_hash=None, lesson_id=None, wallets=(), **fields):
+        # `wallets` lists the balances this entry changed. Balances are always
+        # updated before the entry is appended, which is what lets
+        # get_state(since=...) report balance changes from the log alone.
+        # Entries are appended while the locks of the state they describe are
+        # held, so a snapshot's event_seq covers exactly the journaled operations.
+        entry = {"event": event, "message": message, "tx_hash": tx_hash, "wallets": list(wallets)}
+        if lesson_id is not None:
+            entry["lesson_id"] = lesson_id
+        entry.update(fields)
+        return entry
+
+    def _publish(self, entries):
+        # Called by the event log, in seq order, with every batch of new entries
+        if self.hub is not None:
+            wallets = {wallet for entry in entries for wallet in entry["wallets"]}
+            self.hub.publish(self.epoch, entries, {wallet: from_minor(self.balances.get(wallet, 0)) for wallet in wallets})
+
+    def log(self, message, tx_hash=None, lesson_id=None, wallets=(), event=None, **fields):
+        self.logs.append(self._event(event, message, tx_hash, lesson_id, wallets, **fields))
+
+    def get_lesson(self, lesson_id):
+        return self.lessons.get(lesson_id)
+
+    # -------------------------------------------------------------------------
+    # Write-ahead journal, snapshots and recovery
+    # -------------------------------------------------------------------------
+
+    # Records are appended while holding the locks of the state they change.
+    # Credits are journaled before they are applied and debits after, so any
+    # operation that depended on an earlier credit comes later in the journal
+    # and replay reproduces the same balances.
+
+    def _journal(self, record):
+        if self.journal is None:
+            return None
+        lsn = self.journal.append(record)
+        if lsn - self._snapshot_lsn >= self.snapshot_every:
+            with self._snapshot_thread_lock:
+                running = self._snapshot_thread is not None and self._snapshot_thread.is_alive()
+                if not running and not self._closed:
+                    self._snapshot_thread = threading.Thread(target=self.snapshot, name="ledger-snapshot", daemon=True)
+                    self._snapshot_thread.start()
+        return lsn
+
+    def _durable(self, lsn):
+        if lsn is not None and self.sync_commits:
+            self.journal.wait(lsn)
+
+    def snapshot(self):
+        # Consistent copy of balances and lessons, taken with every lock held so
+        # it matches the journal exactly up to the returned lsn. Older journal
+        # segments are dropped once the snapshot is on disk.
+        with self._snapshot_lock:
+            if self.journal is None:
+                return None
+            return self._snapshot()
+
+    def _snapshot(self):
+        locks = self._lock_all()
+        try:
+            snapshot = {
+                "balances": dict(self.balances),
+                "lessons": [
+                    [
+                        lesson.lesson_id, lesson.student, lesson.teacher, lesson.title, lesson.price, lesson.status,
+                        lesson.oracle_data, lesson.outcome, lesson.scheduled_start, lesson.duration_minutes
+                    ]
+                    for lesson in self.lessons.values()
+                ],
+                "open_lessons": self.open_lessons,
+                "current_lesson_id": self.current_lesson_id,
+                "lesson_price": self.lesson_price,
+                "transfers_out": dict(self.transfers_out),
+                "transfers_in": list(self.transfers_in),
+                "event_seq": len(self.logs),
+                "tx_prefix": self.logs.tx_ids.prefix
+            }
+            # The event log segment must hold every event up to event_seq
+            # before the snapshot that points at it is written
+            self.logs.sync()
+            snapshot["lsn"] = self.journal.rotate()
+        finally:
+            self._unlock_all(locks)
 
-    def log(self, message, tx_hash=None):
-        self.logs.append({"message": message, "tx_hash": tx_hash})
+        write_snapshot(self.ledger_dir, snapshot)
+        self._snapshot_lsn = snapshot["lsn"]
+        return snapshot["lsn"]
 
-    def topup_student(self, amount):
-        self.balances["student"] += amount
-        self.log(f"Student wallet topped up by ${amount:.2f}.")
+    def _recover(self):
+        # Latest snapshot plus the journal records after it. Replay goes through
+        # the normal methods with journaling still off. The event log continues
+        # from the snapshot's event_seq with the same transaction ids, and
+        # replay appends the events of the journal records after it again.
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        lsn = 0
+        snapshot = load_snapshot(self.ledger_dir)
+        self.logs.close()
+        if snapshot is None:
+            self.logs = EventLog(self.event_log_capacity, self.event_log_path, tx_ids=self.logs.tx_ids, listener=self._publish)
+        else:
+            self.balances = snapshot["balances"]
+            for lesson_id, student, teacher, title, price, status, oracle_data, outcome, *schedule in snapshot["lessons"]:
+                lesson = Lesson(lesson_id, student, teacher, title, price, *schedule)
+                lesson.status = status
+                lesson.oracle_data = oracle_data
+                lesson.outcome = outcome
+                self.lessons[lesson_id] = lesson
+                self.indexes.add(lesson)
+            self.open_lessons = snapshot["open_lessons"]
+            self.current_lesson_id = snapshot["current_lesson_id"]
+            self.lesson_price = snapshot["lesson_price"]
+            self.transfers_out = snapshot.get("transfers_out", {})
+            self.transfers_in = set(snapshot.get("transfers_in", ()))
+            tx_ids = TxIds(prefix=snapshot["tx_prefix"]) if "tx_prefix" in snapshot else None
+            self.logs = EventLog(
+                self.event_log_capacity, self.event_log_path, start_seq=snapshot["event_seq"],
+                tx_ids=tx_ids, listener=self._publish, resume=True
+            )
+            lsn = snapshot["lsn"]
+        self._snapshot_lsn = lsn
+
+        for record in read_journal(self.ledger_dir, lsn):
+            self._replay(record)
+            lsn = record["lsn"]
+
+        self.journal = Journal(self.ledger_dir, lsn + 1)
+        if snapshot is None:
+            # Record the event log's id prefix right away, so ids handed out
+            # before the first periodic snapshot still resolve after a restart
+            self.snapshot()
+
+    def _replay(self, record):
+        op = record["op"]
+        if op == "topup":
+            self.topup_student(record["amount"], record["wallet"])
+        elif op == "fund":
+            self.fund_lesson(
+                record["price"], record["title"], record["lesson_id"], record["student"], record["teacher"],
+                record.get("scheduled_start"), record.get("duration_minutes", 60)
+            )
+        elif op == "resolve":
+            self.resolve_lesson(
+                record["teacher_duration"], record["student_duration"], record["oracle_data"],
+                record["required_duration"], record["lesson_id"]
+            )
+        elif op == "resolve_many":
+            self._replay_group(record["records"], record["required_duration"])
+        elif op == "transfer_out":
+            self.transfer_out(record["wallet"], record["amount"], record["transfer_id"], record["target"])
+        elif op == "transfer_in":
+            self.transfer_in(record["wallet"], record["amount"], record["transfer_id"])
+        elif op == "transfer_done":
+            self.transfer_done(record["transfer_id"])
+        elif op == "reset":
+            self.reset(record.get("tx_prefix"))
+
+    def close(self):
+        # A snapshot still being written would otherwise keep deleting journal
+        # segments after the ledger has been handed to someone else
+        with self._snapshot_thread_lock:
+            self._closed = True
+            thread = self._snapshot_thread
+        if thread is not None:
+            thread.join()
+        with self._snapshot_lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+        self.logs.close()
+
+    # -------------------------------------------------------------------------
+    # Lesson lifecycle
+    # -------------------------------------------------------------------------
+
+    # Amounts passed to and returned by these methods are integer minor units
+
+    def topup_student(self, amount, wallet="student"):
+        with self._wallet_lock(wallet):
+            lsn = self._journal({"op": "topup", "wallet": wallet, "amount": amount})
+            self.balances[wallet] = self.balances.get(wallet, 0) + amount
+            self.log(f"Student wallet topped up by ${format_minor(amount)}.", wallets=(wallet,), event=WALLET_TOPPED_UP, amount=amount)
+        self._durable(lsn)
         return True, "Top-up successful."
 
-    def fund_lesson(self, price=30, lesson_title="Lesson"):
-        if self.status not in ["CREATED", "COMPLETED", "REFUNDED"]:
-            return False, "Contract already funded."
-        
-        # Reset state for new lesson if previous was completed
-        if self.status in ["COMPLETED", "REFUNDED"]:
-            self.status = "CREATED"
-            self.last_oracle_data = None
-            self.last_outcome = None
-        
-        self.lesson_price = price
-        tx_fee = price * self.tx_fee_percent
+    # Cross-shard transfers move a wallet's funds from one shard to another in
+    # three journaled steps: transfer_out on the source, transfer_in on the
+    # target, transfer_done on the source. Every step is idempotent per
+    # transfer_id, so after a crash the router simply repeats the steps of
+    # every transfer still listed in transfers_out.
+
+    def transfer_out(self, wallet, amount, transfer_id, target):
+        with self._wallet_lock(wallet):
+            if transfer_id in self.transfers_out:
+                return True, "Transfer already sent."
+            balance = self.balances.get(wallet, 0)
+            if balance < amount:
+                return False, f"Insufficient funds. Need ${format_minor(amount)}."
+            self.balances[wallet] = balance - amount
+            lsn = self._journal({"op": "transfer_out", "wallet": wallet, "amount": amount, "transfer_id": transfer_id, "target": target})
+            self.transfers_out[transfer_id] = [wallet, amount, target]
+            self.log(f"Moved ${format_minor(amount)} of {wallet} to shard {target}.", wallets=(wallet,), event=WALLET_TRANSFERRED, amount=-amount, transferId=transfer_id)
+        self._durable(lsn)
+        return True, "Transfer sent."
+
+    def transfer_in(self, wallet, amount, transfer_id):
+        with self._wallet_lock(wallet):
+            if transfer_id in self.transfers_in:
+                return True, "Transfer already received."
+            lsn = self._journal({"op": "transfer_in", "wallet": wallet, "amount": amount, "transfer_id": transfer_id})
+            self.transfers_in.add(transfer_id)
+            self.balances[wallet] = self.balances.get(wallet, 0) + amount
+            self.log(f"Received ${format_minor(amount)} for {wallet} from another shard.", wallets=(wallet,), event=WALLET_TRANSFERRED, amount=amount, transferId=transfer_id)
+        self._durable(lsn)
+        return True, "Transfer received."
+
+    def transfer_done(self, transfer_id):
+        lsn = None
+        with self._counter_lock:
+            if self.transfers_out.pop(transfer_id, None) is not None:
+                lsn = self._journal({"op": "transfer_done", "transfer_id": transfer_id})
+        self._durable(lsn)
+        return True, "Transfer confirmed."
+
+    def fund_lesson(self, price=3000, lesson_title="Lesson", lesson_id=None, student="student", teacher="teacher", scheduled_start=None, duration_minutes=60):
+        if lesson_id is None:
+            lesson_id = new_lesson_id()
+
+        tx_fee = fee(price, self.tx_fee_bps)
         total_deduction = price + tx_fee
 
-        if self.balances["student"] < total_deduction:
-            return False, f"Insufficient funds. Need ${total_deduction:.2f}."
+        # The lesson lock makes the CREATED -> FUNDED transition atomic per lesson
+        with self._lesson_lock(lesson_id):
+            lesson = self.lessons.get(lesson_id)
+            if lesson is not None and lesson.status != "CREATED":
+                return False, "Lesson already funded."
+
+            if not self._debit(student, total_deduction):
+                return False, f"Insufficient funds. Need ${format_minor(total_deduction)}."
+
+            lsn = self._journal({
+                "op": "fund", "lesson_id": lesson_id, "price": price, "title": lesson_title,
+                "student": student, "teacher": teacher, "scheduled_start": scheduled_start, "duration_minutes": duration_minutes
+            })
 
-        self.balances["student"] -= total_deduction
-        self.balances["contract"] += price
-        self.status = "FUNDED"
-        
-        tx_hash = f"0x{abs(hash(str(time.time()) + 'fund'))}"
-        self.log(f"Student funded '{lesson_title}' (${price:.2f} - ${tx_fee:.2f} fee). Funds locked in Escrow.", tx_hash)
+            self._credit("contract", price)
+            if lesson is None:
+                lesson = Lesson(lesson_id, student, teacher, lesson_title, price, scheduled_start, duration_minutes)
+                lesson.status = "FUNDED"
+                self.lessons[lesson_id] = lesson
+                self.indexes.add(lesson)
+            else:
+                lesson.status = "FUNDED"
+                self.indexes.moved([(lesson, "CREATED")])
+            self._count_open(1)
+            self.current_lesson_id = lesson_id
+            self.lesson_price = price
+            self.log(f"Student funded '{lesson_title}' (${format_minor(price)} - ${format_minor(tx_fee)} fee). Funds locked in Escrow.", NEW_TX, lesson_id, (student, "contract"), event=LESSON_FUNDED, totalAmount=price)
+
+        self._durable(lsn)
         return True, "Lesson funded successfully."
 
-    def resolve_lesson(self, teacher_duration, student_duration, oracle_data=None, required_duration=60):
-        if self.status != "FUNDED":
-            return False, "Contract not in funded state."
-
-        self.last_oracle_data = oracle_data
-
-        # Logic from the prompt
-        # Happy Path: Teacher >= 95% AND Student >= 95%
-        # Student No-Show: Student < 95%
-        # Teacher No-Show: Teacher < 95%
-        
-        min_threshold = required_duration * 0.95
-
-        payout_teacher = False
-        refund_student = False
-        
-        outcome = "Unknown"
-        
-        teacher_pct = (teacher_duration / required_duration) * 100
-        student_pct = (student_duration / required_duration) * 100
-
-        if teacher_duration >= min_threshold and student_duration >= min_threshold:
-            outcome = "Happy Path: Lesson Completed Successfully."
-            payout_teacher = True
-        elif teacher_duration < min_threshold:
-            outcome = f"Teacher No-Show: Student refunded. (Teacher attended {teacher_pct:.0f}%, which is less than the required minimum of 95%)"
-            refund_student = True
+    def _settle(self, lesson, result):
+        # The lesson's final status and outcome, the wallet credits to apply,
+        # the log message and the event's attendance percentages. Changes
+        # nothing, so callers compute it in full before touching the lesson.
+        code, teacher_pct, student_pct, teacher_payout, student_refund, platform_fee, tx_fee = result
+        outcome = outcome_message(code, teacher_pct, student_pct)
+
+        # Only this lesson's escrowed amount is released, other open lessons stay locked
+        escrowed = lesson.price
+
+        if code == TEACHER_NO_SHOW:
+            status = "REFUNDED"
+            credits = (("contract", -escrowed), (lesson.student, student_refund))
+            message = f"Oracle Resolution: {outcome} -> Refund ${format_minor(student_refund)} to Student (Tx Fee: ${format_minor(tx_fee)})."
         else:
-            outcome = f"Student No-Show: Teacher compensated. (Teacher was present {teacher_pct:.0f}% of the time, Student only attended {student_pct:.0f}%)"
-            payout_teacher = True
-        
-        self.last_outcome = outcome
-        tx_hash = f"0x{abs(hash(str(time.time()) + 'resolve'))}"
-
-        if payout_teacher:
-            contract_balance = self.balances["contract"]
-            
-            platform_fee = contract_balance * self.platform_fee_percent
-            gross_payout = contract_balance - platform_fee
-            
-            tx_fee = gross_payout * self.tx_fee_percent
-            net_payout = gross_payout - tx_fee
-            
-            self.balances["contract"] = 0
-            self.balances["teacher"] += net_payout
-            self.balances["platform"] += platform_fee
-            
-            self.status = "COMPLETED"
-            self.log(f"Oracle Resolution: {outcome} -> Payout ${net_payout:.2f} to Teacher (Fees: ${platform_fee:.2f} Platform, ${tx_fee:.2f} Tx).", tx_hash)
-        
-        elif refund_student:
-            gross_refund = self.balances["contract"]
-            tx_fee = gross_refund * self.tx_fee_percent
-            net_refund = gross_refund - tx_fee
-            
-            self.balances["contract"] = 0
-            self.balances["student"] += net_refund
-            
-            self.status = "REFUNDED"
-            self.log(f"Oracle Resolution: {outcome} -> Refund ${net_refund:.2f} to Student (Tx Fee: ${tx_fee:.2f}).", tx_hash)
+            status = "COMPLETED"
+            credits = (("contract", -escrowed), (lesson.teacher, teacher_payout), ("platform", platform_fee))
+            message = f"Oracle Resolution: {outcome} -> Payout ${format_minor(teacher_payout)} to Teacher (Fees: ${format_minor(platform_fee)} Platform, ${format_minor(tx_fee)} Tx)."
+
+        # studentApproved: paid out by the student's override, like the contract's Lesson.studentApproved
+        fields = {"teacherPct": pct(teacher_pct), "studentPct": pct(student_pct), "studentApproved": bool(code == STUDENT_OVERRIDE)}
+        return status, outcome, credits, message, fields
+
+    def resolve_lesson(self, teacher_duration, student_duration, oracle_data=None, required_duration=60, lesson_id=None):
+        if lesson_id is None:
+            lesson_id = self.current_lesson_id
+        lesson = self.lessons.get(lesson_id)
+        if lesson is None:
+            return False, "Unknown lesson."
+        if not (is_duration(required_duration) and required_duration > 0):
+            return False, "Invalid required duration."
+        if not (is_duration(teacher_duration) and is_duration(student_duration)):
+            return False, "Invalid attendance durations."
 
+        # The price never changes after funding, so settlement can be computed outside the lock
+        status, outcome, credits, message, pcts = self._settle(lesson, settle(
+            teacher_duration, student_duration, required_duration, lesson.price,
+            self.platform_fee_bps, self.tx_fee_bps, vectorized=self.vectorized,
+            override=bool(oracle_data and oracle_data.get("student_override"))
+        ))
+        # FUNDED -> COMPLETED/REFUNDED happens once under the lesson lock, so a
+        # concurrent resolve of the same lesson can never pay out twice
+        with self._lesson_lock(lesson_id):
+            if self.lessons.get(lesson_id) is lesson and lesson.status in RESOLVED_STATUSES:
+                return True, lesson.outcome
+            if self.lessons.get(lesson_id) is not lesson or lesson.status != "FUNDED":
+                return False, "Contract not in funded state."
+
+            lsn = self._journal({
+                "op": "resolve", "lesson_id": lesson_id, "teacher_duration": teacher_duration,
+                "student_duration": student_duration, "required_duration": required_duration, "oracle_data": oracle_data
+            })
+            lesson.oracle_data = oracle_data
+            lesson.status = status
+            lesson.outcome = outcome
+            self.indexes.moved([(lesson, "FUNDED")])
+            for wallet, amount in credits:
+                self._credit(wallet, amount)
+            self._count_open(-1)
+            self.log(
+                message, NEW_TX, lesson_id, [wallet for wallet, _ in credits], event=LESSON_RESOLVED,
+                status=status, **pcts
+            )
+
+        self._durable(lsn)
         return True, outcome
 
-    def get_state(self):
+    def resolve_many(self, records, required_duration=60):
+        # Settles a batch of (lesson_id, teacher_duration, student_duration[,
+        # student_override]) records in one pass. Fees and outcomes come from one settle_arrays()
+        # call, each lock stripe is taken once per batch, wallet credits are
+        # summed per stripe, the batch waits for one journal commit and each
+        # stripe's log entries are appended together. Returns one result dict per record,
+        # in order. Callers validate the records (see settlement.batch_record).
+        if not (is_duration(required_duration) and required_duration > 0):
+            raise ValueError("required_duration must be a positive number")
+        results = [None] * len(records)
+        lessons = [None] * len(records)
+        known = []
+        for i, record in enumerate(records):
+            lesson = self.lessons.get(record[0])
+            if lesson is None:
+                results[i] = {"lesson_id": record[0], "success": False, "outcome": "Unknown lesson."}
+            else:
+                lessons[i] = lesson
+                known.append(i)
+
+        columns = self._settle_columns(records, lessons, known, required_duration)
+
+        by_stripe = {}
+        for position, i in enumerate(known):
+            by_stripe.setdefault(hash(records[i][0]) % LOCK_STRIPES, []).append((position, i))
+
+        lsn = None
+        for stripe, items in by_stripe.items():
+            with self._lesson_locks[stripe]:
+                lsn = self._resolve_group(records, lessons, items, columns, required_duration, results) or lsn
+
+        self._durable(lsn)
+        return results
+
+    def _settle_columns(self, records, lessons, known, required_duration):
+        settled = settle_arrays(
+            [records[i][1] for i in known],
+            [records[i][2] for i in known],
+            [required_duration] * len(known),
+            [lessons[i].price for i in known],
+            self.platform_fee_bps,
+            self.tx_fee_bps,
+            [len(records[i]) > 3 and bool(records[i][3]) for i in known]
+        )
+        return [settled[key].tolist() for key in SETTLEMENT_FIELDS]
+
+    def _resolve_group(self, records, lessons, items, columns, required_duration, results):
+        # Settles the (position, index) items of one lock stripe. Caller holds
+        # the stripe lock. Credits are summed for the group and applied before
+        # the lock is released, so a snapshot never sees a settled lesson
+        # without its credits or its log entry. The group is journaled as one record, which
+        # lets replay sum the credits in the same order. Returns that lsn.
+        totals = {}
+        resolved = []
+        settled = []
+        entries = []
+        for position, i in items:
+            lesson_id, teacher_duration, student_duration = records[i][:3]
+            override = len(records[i]) > 3 and bool(records[i][3])
+            lesson = lessons[i]
+            if self.lessons.get(lesson_id) is lesson and lesson.status in RESOLVED_STATUSES:
+                results[i] = {"lesson_id": lesson_id, "success": True, "outcome": lesson.outcome, "status": lesson.status, "replayed": True}
+                continue
+            if self.lessons.get(lesson_id) is not lesson or lesson.status != "FUNDED":
+                results[i] = {"lesson_id": lesson_id, "success": False, "outcome": "Contract not in funded state."}
+                continue
+
+            status, outcome, credits, message, pcts = self._settle(lesson, [column[position] for column in columns])
+            entry = self._event(LESSON_RESOLVED, message, NEW_TX, lesson_id, [wallet for wallet, _ in credits], status=status, **pcts)
+
+            lesson.oracle_data = {"teacher_duration": teacher_duration, "student_duration": student_duration}
+            if override:
+                lesson.oracle_data["student_override"] = True
+            lesson.status = status
+            lesson.outcome = outcome
+            for wallet, amount in credits:
+                totals[wallet] = totals.get(wallet, 0) + amount
+            resolved.append([lesson_id, teacher_duration, student_duration, True] if override else [lesson_id, teacher_duration, student_duration])
+            settled.append(i)
+            entries.append(entry)
+            results[i] = {"lesson_id": lesson_id, "success": True, "outcome": outcome, "status": status}
+
+        lsn = None
+        if resolved:
+            lsn = self._journal({"op": "resolve_many", "records": resolved, "required_duration": required_duration})
+        self.indexes.moved([(lessons[i], "FUNDED") for i in settled])
+        for wallet, amount in totals.items():
+            self._credit(wallet, amount)
+        self._count_open(-len(resolved))
+        self.logs.extend(entries)
+        return lsn
+
+    def _replay_group(self, records, required_duration):
+        indexes = list(range(len(records)))
+        lessons = [self.lessons[record[0]] for record in records]
+        columns = self._settle_columns(records, lessons, indexes, required_duration)
+        self._resolve_group(records, lessons, list(enumerate(indexes)), columns, required_duration, [None] * len(records))
+
+    def query_lessons(self, student=None, teacher=None, status=None, ended_after=None, ended_before=None, cursor=None, limit=100):
+        # A page of lessons matching the filters, ordered by end time, and the
+        # cursor of the next page (see indexes.LessonIndexes.query)
+        return self.indexes.query(self.lessons, student, teacher, status, ended_after, ended_before, cursor, limit)
+
+    def state_tag(self):
+        # Every state change appends a log entry, so (epoch, log length)
+        # identifies the state exactly. Used as the HTTP ETag.
+        return f"{self.epoch}-{len(self.logs)}"
+
+    def get_state(self, since=None, epoch=None):
+        # Full snapshot by default. With `since` (the `seq` of an earlier
+        # response) only newer log entries and the balances they touched are
+        # returned. A stale epoch or cursor falls back to a full snapshot, and
+        # so does one more than the log's in-memory capacity behind, whose
+        # delta would be larger than the snapshot (older events are read
+        # from /api/logs). Amounts are converted to major units for the API.
+        current = self.lessons.get(self.current_lesson_id)
+        logs = self.logs
+        seq = len(logs)
+        incremental = (
+            since is not None and (epoch is None or epoch == self.epoch)
+            and logs.first_seq() <= since <= seq and seq - since <= logs.capacity
+        )
+
+        if incremental:
+            new_logs = logs.read(since, seq)
+            changed = set()
+            for entry in new_logs:
+                changed.update(entry["wallets"])
+            balances = {wallet: from_minor(self.balances.get(wallet, 0)) for wallet in changed}
+        else:
+            # Copies, so serializing the state can't race with concurrent updates.
+            # Only the in-memory tail of the log, older events are read by seq.
+            new_logs = logs.recent()
+            balances = {wallet: from_minor(amount) for wallet, amount in list(self.balances.items())}
+
         return {
-            "balances": self.balances,
-            "status": self.status,
-            "logs": self.logs,
-            "lesson_price": self.lesson_price,
-            "last_oracle_data": self.last_oracle_data,
-            "last_outcome": self.last_outcome
+            "balances": balances,
+            "status": current.status if current else "CREATED",
+            "logs": new_logs,
+            "epoch": self.epoch,
+            "seq": seq,
+            "incremental": incremental,
+            "lesson_id": self.current_lesson_id,
+            "lesson_price": from_minor(self.lesson_price),
+            "open_lessons": self.open_lessons,
+            "total_lessons": len(self.lessons),
+            "last_oracle_data": current.oracle_data if current else None,
+            "last_outcome": current.outcome if current else None
         }
@@ -0,0 +1,55 @@
+import os
+
+# Compiles and deploys SmartTutorEscrow.sol, for tests and local chains
+# (anvil, Web3(EthereumTesterProvider())). Requires py-solc-x and a solc
+# binary: one on PATH, or `python -m solcx.install 0.8.24`.
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SmartTutorEscrow.sol')
+SOLC_VERSION = '0.8.24'
+
+
+class SolcUnavailable(Exception):
+    pass
+
+
+def solc_binary():
+    # Path of a solc that can compile the contract; raises SolcUnavailable
+    try:
+        import solcx
+    except ImportError:
+        raise SolcUnavailable("py-solc-x is not installed (pip install py-solc-x)")
+    try:
+        return solcx.install.get_executable(SOLC_VERSION)
+    except solcx.exceptions.SolcNotInstalled:
+        pass
+    try:
+        # The active version, e.g. a solc found on PATH
+        return solcx.install.get_executable()
+    except solcx.exceptions.SolcNotInstalled:
+        raise SolcUnavailable(f"no solc found; put solc on PATH or run: python -m solcx.install {SOLC_VERSION}")
+
+
+def compile_escrow():
+    # (abi, bytecode) of SmartTutorEscrow
+    import solcx
+    solc = solc_binary()
+    with open(SOURCE_PATH) as f:
+        source = f.read()
+    output = solcx.compile_standard({
+        'language': 'Solidity',
+        'sources': {'SmartTutorEscrow.sol': {'content': source}},
+        'settings': {'outputSelection': {'*': {'SmartTutorEscrow': ['abi', 'evm.bytecode.object']}}}
+    }, solc_binary=solc)
+    compiled = output['contracts']['SmartTutorEscrow.sol']['SmartTutorEscrow']
+    return compiled['abi'], compiled['evm']['bytecode']['object']
+
+
+def deploy_escrow(w3, platform_wallet, oracle, deployer=None, compiled=None):
+    # Deploys SmartTutorEscrow from `deployer` (default: the node's first
+    # account) and returns it as a web3 contract
+    abi, bytecode = compiled or compile_escrow()
+    deployer = deployer or w3.eth.accounts[0]
+    factory = w3.eth.contract(abi=abi, bytecode=bytecode)
+    tx_hash = factory.constructor(platform_wallet, oracle).transact({'from': deployer})
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    return w3.eth.contract(address=receipt['contractAddress'], abi=abi)
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+
+from txid import TxIds, seq_from_tx
+
+# Event names follow the events emitted by SmartTutorEscrow.sol
+LESSON_CREATED = "LessonCreated"
+LESSON_FUNDED = "LessonFunded"
+LESSON_RESOLVED = "LessonResolved"
+LESSON_CANCELLED = "LessonCancelled"
+# Off-chain only: the mock wallets can be topped up
+WALLET_TOPPED_UP = "WalletToppedUp"
+# Off-chain only: funds moved between shards of a sharded deployment
+WALLET_TRANSFERRED = "WalletTransferred"
+
+# One file offset is kept per this many spilled events, so the on-disk index
+# stays tiny and a lookup scans at most this many lines
+INDEX_STRIDE = 1024
+
+# Placeholder tx_hash for entries that get a transaction id when appended
+NEW_TX = object()
+
+
+class EventLog:
+    # Append-only event log. The newest `capacity` events live in a fixed-size
+    # in-memory ring. With a `spill_path` every event is also written to an
+    # append-only JSON-lines segment file, so older ones can still be read
+    # back by sequence number and the log survives a restart. Without one,
+    # evicted events are dropped. Memory use is flat either way.
+
+    def __init__(self, capacity=10000, spill_path=None, start_seq=0, tx_ids=None, listener=None, resume=False):
+        # start_seq is the next sequence number. With resume=True the events
+        # already in the segment file up to start_seq are kept and readable
+        # again (ones after it are cut off, the caller appends them again),
+        # otherwise the segment starts empty and events before start_seq are
+        # not readable from this log. Entries appended with tx_hash=NEW_TX get
+        # an id from tx_ids that embeds their sequence number. listener(entries)
+        # is called with every batch of new entries, in seq order.
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._ring = [None] * capacity
+        self._start_seq = start_seq
+        self._next_seq = start_seq
+        # Oldest sequence number still held in the ring
+        self._ring_start = start_seq
+        self._index = []
+        self._segment = None
+        self._offset = 0
+        self._lock = threading.Lock()
+        # A new log gets a new id prefix, so ids stay unique across resets
+        self.tx_ids = tx_ids or TxIds()
+        self.listener = listener
+        if spill_path:
+            directory = os.path.dirname(spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if resume:
+                self._resume()
+            else:
+                # A fresh log starts a fresh segment
+                open(spill_path, "wb").close()
+                self._segment = open(spill_path, "a+b")
+
+    def _resume(self):
+        # Rebuilds the sparse index from the segment file and reloads the ring
+        # with its newest events. A segment that doesn't reach start_seq (or
+        # starts after it) can't be continued and is started over.
+        first_seq = None
+        seq = None
+        offset = 0
+        index = []
+        tail = []
+        with open(self.spill_path, "a+b") as f:
+            f.seek(0)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    # Torn last line from a crash mid-write
+                    break
+                if first_seq is None:
+                    first_seq = seq = entry["seq"]
+                if entry["seq"] != seq or seq >= self._next_seq:
+                    break
+                if (seq - first_seq) % INDEX_STRIDE == 0:
+                    index.append(offset)
+                offset += len(line)
+                if seq >= self._next_seq - self.capacity:
+                    tail.append(entry)
+                seq += 1
+            complete = seq == self._next_seq
+            f.truncate(offset if complete else 0)
+        self._segment = open(self.spill_path, "a+b")
+        if not complete:
+            return
+        self._start_seq = first_seq
+        self._index = index
+        self._offset = offset
+        for entry in tail:
+            self._ring[entry["seq"] % self.capacity] = entry
+        self._ring_start = tail[0]["seq"] if tail else self._next_seq
+
+    def __len__(self):
+        # Total number of events ever appended, i.e. the next sequence number
+        return self._next_seq
+
+    def sync(self):
+        # Flushes the segment file to disk
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+
+    def close(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _append(self, entry):
+        seq = self._next_seq
+        slot = seq % self.capacity
+        if self._ring[slot] is not None:
+            self._ring_start += 1
+        entry["seq"] = seq
+        if entry.get("tx_hash") is NEW_TX:
+            entry["tx_hash"] = self.tx_ids.format(seq)
+        if self._segment is not None:
+            self._write(seq, entry)
+        self._ring[slot] = entry
+        self._next_seq = seq + 1
+
+    def _write(self, seq, entry):
+        if (seq - self._start_seq) % INDEX_STRIDE == 0:
+            self._index.append(self._offset)
+        line = json.dumps(entry).encode() + b"\n"
+        self._segment.write(line)
+        self._offset += len(line)
+
+    def append(self, entry):
+        with self._lock:
+            self._append(entry)
+            if self.listener is not None:
+                self.listener([entry])
+        return entry["seq"]
+
+    def extend(self, entries):
+        with self._lock:
+            for entry in entries:
+                self._append(entry)
+            if self.listener is not None and entries:
+                self.listener(entries)
+
+    def first_seq(self):
+        # Oldest sequence number that can still be read
+        if self._segment is not None:
+            return self._start_seq
+        return self._ring_start
+
+    def read(self, since=0, until=None):
+        # Events with since <= seq < until, oldest first
+        with self._lock:
+            if until is None or until > self._next_seq:
+                until = self._next_seq
+            since = max(since, self._start_seq)
+            entries = []
+
+            if since < self._ring_start:
+                entries.extend(self._read_segment(since, min(until, self._ring_start)))
+                since = self._ring_start
+
+            for seq in range(since, until):
+                entries.append(self._ring[seq % self.capacity])
+            return entries
+
+    def by_tx(self, tx_id):
+        # The event a transaction id from this log points at, or None
+        if not self.tx_ids.owns(tx_id):
+            return None
+        entries = self.read(seq_from_tx(tx_id), seq_from_tx(tx_id) + 1)
+        return entries[0] if entries else None
+
+    def recent(self, limit=None):
+        # Events still held in memory, oldest first
+        with self._lock:
+            since = self._ring_start
+            if limit is not None:
+                since = max(since, self._next_seq - limit)
+            return [self._ring[seq % self.capacity] for seq in range(since, self._next_seq)]
+
+    def _read_segment(self, since, until):
+        if self._segment is None:
+            return []
+        self._segment.flush()
+        block = (since - self._start_seq) // INDEX_STRIDE
+        self._segment.seek(self._index[block])
+        entries = []
+        seq = self._start_seq + block * INDEX_STRIDE
+        while seq < until:
+            line = self._segment.readline()
+            if not line:
+                break
+            if seq >= since:
+                entries.append(json.loads(line))
+            seq += 1
+        # Writes always go to the end in append mode
+        return entries
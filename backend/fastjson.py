@@ -0,0 +1,55 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+# JSON encoding for responses and event frames. orjson is used when
+# installed, several times faster than the json module on the state and log
+# payloads; otherwise encoding falls back to json with the same output
+# apart from key order and whitespace.
+
+def _json_default(default):
+    # NumPy scalars as Python numbers, like orjson's OPT_SERIALIZE_NUMPY
+    def encode(obj):
+        if hasattr(obj, "dtype") and hasattr(obj, "item"):
+            return obj.item()
+        if default is None:
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+        return default(obj)
+    return encode
+
+
+def _json_dumps_bytes(obj, default=None):
+    return json.dumps(obj, default=_json_default(default), separators=(",", ":")).encode()
+
+
+try:
+    import orjson
+
+    # Integer-keyed dicts (e.g. outcome names) and NumPy scalars encode as-is
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps_bytes(obj, default=None):
+        try:
+            return orjson.dumps(obj, default=default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            # orjson only encodes 64-bit integers; on-chain amounts (uint256
+            # wei in /api/chain/events) go through json, which has no limit
+            return _json_dumps_bytes(obj, default)
+except ImportError:
+    dumps_bytes = _json_dumps_bytes
+
+def dumps(obj):
+    return dumps_bytes(obj).decode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Flask JSON provider (app.json) whose jsonify() encodes with orjson.
+    # Request bodies are still parsed by the json module, whose rules the
+    # request validation was written against.
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj, self.default).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, self.default), mimetype=self.mimetype)
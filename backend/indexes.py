@@ -0,0 +1,163 @@
+import sys
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+# Secondary indexes over SmartContract.lessons, so per-student, per-teacher,
+# per-status and end-time queries read only matching lessons instead of
+# scanning every record.
+#
+# Every index holds (end time, lesson_id) keys in sorted order. Lessons
+# without a scheduled start sort first, under UNSCHEDULED. Pages of a query
+# are resumed from the last key returned, so results don't shift when
+# lessons are added or change status between pages.
+
+UNSCHEDULED = float("-inf")
+# Lowest key of a lesson with a scheduled start
+_FIRST_SCHEDULED = (-sys.float_info.max,)
+
+
+class SortedKeys:
+    # Sorted set kept in chunks of up to 2 * CHUNK keys, so add() and
+    # discard() shift at most one chunk rather than the whole list:
+    # O(log n + CHUNK) per update even with millions of keys.
+    CHUNK = 512
+
+    def __init__(self):
+        self._chunks = []
+        # Largest key of each chunk, for bisecting to the right chunk
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        i = min(bisect_left(self._maxes, key), len(self._chunks) - 1)
+        chunk = self._chunks[i]
+        insort(chunk, key)
+        self._maxes[i] = chunk[-1]
+        self._len += 1
+        if len(chunk) > 2 * self.CHUNK:
+            self._chunks[i:i + 1] = [chunk[:self.CHUNK], chunk[self.CHUNK:]]
+            self._maxes[i:i + 1] = [chunk[self.CHUNK - 1], chunk[-1]]
+
+    def discard(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._chunks):
+            return
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, key)
+        if j == len(chunk) or chunk[j] != key:
+            return
+        del chunk[j]
+        self._len -= 1
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+
+    def irange(self, after=None, before=None):
+        # Keys k with after < k < before, in order. Either bound may be None.
+        if after is None:
+            i = j = 0
+        else:
+            i = bisect_right(self._maxes, after)
+            j = bisect_right(self._chunks[i], after) if i < len(self._chunks) else 0
+        for chunk in self._chunks[i:]:
+            for key in chunk[j:]:
+                if before is not None and key >= before:
+                    return
+                yield key
+            j = 0
+
+
+def lesson_key(lesson):
+    end_time = lesson.end_time()
+    return (UNSCHEDULED if end_time is None else end_time, lesson.lesson_id)
+
+
+def format_cursor(key):
+    return f"{key[0]!r}:{key[1]}"
+
+
+def parse_cursor(cursor):
+    # Raises ValueError for a malformed cursor
+    end_time, separator, lesson_id = cursor.partition(":")
+    if not separator or not lesson_id:
+        raise ValueError("invalid cursor")
+    return (float(end_time), lesson_id)
+
+
+class LessonIndexes:
+    # Lessons by student, by teacher, by status, and all lessons by end time.
+    # The contract updates them under the lesson's lock, in the same critical
+    # section as the change they reflect. The indexes' own lock is always
+    # taken last.
+
+    def __init__(self):
+        self.by_student = {}
+        self.by_teacher = {}
+        self.by_status = {}
+        self.by_end = SortedKeys()
+        self._lock = threading.Lock()
+
+    def _index(self, index, value):
+        keys = index.get(value)
+        if keys is None:
+            keys = index[value] = SortedKeys()
+        return keys
+
+    def add(self, lesson):
+        key = lesson_key(lesson)
+        with self._lock:
+            self._index(self.by_student, lesson.student).add(key)
+            self._index(self.by_teacher, lesson.teacher).add(key)
+            self._index(self.by_status, lesson.status).add(key)
+            self.by_end.add(key)
+
+    def moved(self, changes):
+        # changes: (lesson, old status) pairs, for lessons whose status changed
+        with self._lock:
+            for lesson, old_status in changes:
+                key = lesson_key(lesson)
+                self.by_status[old_status].discard(key)
+                self._index(self.by_status, lesson.status).add(key)
+
+    def query(self, lessons, student=None, teacher=None, status=None, ended_after=None, ended_before=None, cursor=None, limit=100):
+        # Up to `limit` lessons matching every given filter, ordered by end
+        # time, plus the cursor of the next page (None on the last page).
+        # Scans the smallest index among the filters. ended_after is
+        # inclusive, ended_before exclusive; either excludes unscheduled
+        # lessons. `lessons` is the contract's lessons mapping.
+        candidates = []
+        with self._lock:
+            for index, value in ((self.by_student, student), (self.by_teacher, teacher), (self.by_status, status)):
+                if value is not None:
+                    candidates.append(index.get(value, SortedKeys()))
+            keys = min(candidates, key=len) if candidates else self.by_end
+
+            after = cursor
+            if ended_after is not None or ended_before is not None:
+                lowest = _FIRST_SCHEDULED if ended_after is None else (ended_after,)
+                if after is None or after < lowest:
+                    after = lowest
+            before = (ended_before,) if ended_before is not None else None
+
+            page = []
+            last = None
+            for key in keys.irange(after, before):
+                lesson = lessons.get(key[1])
+                if lesson is None:
+                    continue
+                if (student is None or lesson.student == student) and (teacher is None or lesson.teacher == teacher) and (status is None or lesson.status == status):
+                    if len(page) == limit:
+                        return page, format_cursor(last)
+                    page.append(lesson)
+                    last = key
+            return page, None
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+
+# On-disk layout inside the ledger directory:
+#   journal-<first lsn>.log  write-ahead journal segments (JSON lines)
+#   snapshot.json            latest snapshot, tagged with the last lsn it covers
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_PREFIX = "journal-"
+
+
+def _segment_name(first_lsn):
+    return f"{JOURNAL_PREFIX}{first_lsn:020d}.log"
+
+
+def journal_segments(directory):
+    # (first lsn, path) of every journal segment, oldest first
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith(JOURNAL_PREFIX) and name.endswith(".log"):
+            segments.append((int(name[len(JOURNAL_PREFIX):-4]), os.path.join(directory, name)))
+    segments.sort()
+    return segments
+
+
+def read_journal(directory, after_lsn=0):
+    # Yields journal records with lsn > after_lsn in order. A torn last line
+    # from a crash mid-write ends that segment.
+    for _, path in journal_segments(directory):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record["lsn"] > after_lsn:
+                    yield record
+
+
+def load_snapshot(directory):
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return json.load(f)
+
+
+def write_snapshot(directory, snapshot):
+    # Written to a temp file and renamed, so a crash never leaves a half snapshot
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    # Segments that only hold records covered by the snapshot are no longer needed
+    segments = journal_segments(directory)
+    for (_, path), (next_first, _) in zip(segments, segments[1:]):
+        if next_first <= snapshot["lsn"] + 1:
+            os.remove(path)
+
+
+class Journal:
+    # Write-ahead journal with group commit. append() only buffers the record
+    # and hands out its lsn. A background thread writes whatever has
+    # accumulated and fsyncs once for the whole group, so concurrent callers
+    # waiting in wait() share a single fsync instead of paying one each.
+
+    def __init__(self, directory, next_lsn=1):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._last_lsn = next_lsn - 1
+        self._durable_lsn = next_lsn - 1
+        self._pending = []
+        self._closed = False
+        self._cond = threading.Condition()
+        # Held while writing to the current segment, so rotate() can swap it safely
+        self._io_lock = threading.Lock()
+        # Always start a new segment, the previous one may end in a torn line.
+        # A leftover segment starting at next_lsn holds nothing recoverable.
+        self._file = open(os.path.join(directory, _segment_name(next_lsn)), "wb")
+        self._flusher = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+        self._flusher.start()
+
+    @property
+    def last_lsn(self):
+        return self._last_lsn
+
+    def append(self, record):
+        with self._cond:
+            self._last_lsn += 1
+            record["lsn"] = self._last_lsn
+            self._pending.append(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            self._cond.notify_all()
+            return self._last_lsn
+
+    def wait(self, lsn):
+        # Blocks until the record with this lsn has been fsynced
+        with self._cond:
+            while self._durable_lsn < lsn and not self._closed:
+                self._cond.wait()
+
+    def _write_pending(self):
+        # Caller holds _io_lock
+        with self._cond:
+            batch, self._pending = self._pending, []
+            last_lsn = self._last_lsn
+        if batch:
+            self._file.write(b"".join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        with self._cond:
+            self._durable_lsn = max(self._durable_lsn, last_lsn)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            with self._io_lock:
+                self._write_pending()
+
+    def rotate(self):
+        # Flushes the current segment and starts a new one at the next lsn.
+        # Returns the last lsn of the closed segment.
+        with self._io_lock:
+            self._write_pending()
+            self._file.close()
+            last_lsn = self._durable_lsn
+            self._file = open(os.path.join(self.directory, _segment_name(last_lsn + 1)), "wb")
+            return last_lsn
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        with self._io_lock:
+            self._write_pending()
+            self._file.close()
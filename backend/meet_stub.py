@@ -0,0 +1,23 @@
+import os
+import time
+
+from flask import Flask, jsonify, request
+from oracle import Oracle
+
+# Local stand-in for the Google Meet participants API, for running the
+# oracle client against a real HTTP hop:
+#   MEET_API_URL=http://127.0.0.1:5001 python3 app.py
+app = Flask(__name__)
+
+oracle = Oracle()
+LATENCY = float(os.environ.get('MEET_STUB_LATENCY', 0.2))
+
+@app.route('/meetings/<meeting_code>/participants', methods=['GET'])
+def participants(meeting_code):
+    time.sleep(LATENCY)
+    raw_json = dict(oracle.get_meeting_data(request.args.get('scenario'))['raw_json'])
+    raw_json['meetingCode'] = meeting_code
+    return jsonify(raw_json)
+
+if __name__ == '__main__':
+    app.run(port=5001, threaded=True)
@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+# All amounts in the ledger are integers in minor units (cents for the mock
+# USD wallets, the same way the contract counts wei). Fee rates are basis
+# points. Fees round down like Solidity's integer division, so every total
+# is exact and reproducible.
+MINOR_UNITS = 100
+BPS = 10000
+
+
+def to_minor(amount):
+    # Major-unit amount from a request (e.g. 30 or "29.99") -> integer minor units
+    return int((Decimal(str(amount)) * MINOR_UNITS).to_integral_value())
+
+
+def from_minor(amount):
+    # Minor units -> major units for JSON responses
+    return amount / MINOR_UNITS
+
+
+def format_minor(amount):
+    # Minor units -> "12.34", without going through a float
+    sign = "-" if amount < 0 else ""
+    major, minor = divmod(abs(amount), MINOR_UNITS)
+    return f"{sign}{major}.{minor:02d}"
+
+
+def fee(amount, bps):
+    return amount * bps // BPS
@@ -7,11 +7,14 @@ class Oracle:
     def set_scenario(self, scenario_key):
         self.scenario = scenario_key
 
-    def get_meeting_data(self):
+    def get_meeting_data(self, scenario=None):
         # Simulating Google Meet API response
         # Returns duration in minutes
-        
-        if self.scenario == "happy_path":
+        # Passing the scenario explicitly avoids racing on the shared default
+        if scenario is None:
+            scenario = self.scenario
+
+        if scenario == "happy_path":
             return {
                 "teacher_duration": 60,
                 "student_duration": 60,
@@ -23,7 +26,7 @@ class Oracle:
                     ]
                 }
             }
-        elif self.scenario == "student_no_show":
+        elif scenario == "student_no_show":
             return {
                 "teacher_duration": 60,
                 "student_duration": 0,
@@ -34,7 +37,7 @@ class Oracle:
                     ]
                 }
             }
-        elif self.scenario == "teacher_no_show":
+        elif scenario == "teacher_no_show":
             return {
                 "teacher_duration": 0,
                 "student_duration": 60,
@@ -45,7 +48,23 @@ class Oracle:
                     ]
                 }
             }
-        elif self.scenario == "random":
+        elif scenario == "student_override":
+            # Both attend only 50%, but the student agrees to release payment
+            return {
+                "teacher_duration": 30,
+                "student_duration": 30,
+                "student_override": True,
+                "raw_json": {
+                    "meetingCode": "abc-defg-hij",
+                    "participants": [
+                        {"email": "teacher@uni.com", "durationSeconds": 1800},
+                        {"email": "student@uni.com", "durationSeconds": 1800}
+                    ],
+                    "student_override": True,
+                    "override_reason": "Student agreed to release funds to teacher"
+                }
+            }
+        elif scenario == "random":
             t_dur = random.randint(0, 60)
             s_dur = random.randint(0, 60)
             return {
@@ -0,0 +1,130 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+TEACHER_EMAIL = "teacher@uni.com"
+STUDENT_EMAIL = "student@uni.com"
+
+
+class TransportError(Exception):
+    pass
+
+
+def meeting_data_from_raw(raw_json, teacher_email=TEACHER_EMAIL, student_email=STUDENT_EMAIL):
+    # Meet-style participants response -> the dict Oracle.get_meeting_data() returns
+    durations = {teacher_email: 0, student_email: 0}
+    for participant in raw_json.get("participants", []):
+        email = participant.get("email")
+        if email in durations:
+            durations[email] += participant.get("durationSeconds", 0)
+    data = {
+        "teacher_duration": durations[teacher_email] / 60,
+        "student_duration": durations[student_email] / 60,
+        "raw_json": raw_json
+    }
+    if raw_json.get("student_override"):
+        data["student_override"] = True
+    return data
+
+
+class StubTransport:
+    # In-process stand-in for the Google Meet API. Serves the Oracle's
+    # scenario data with a configurable latency and failure rate.
+
+    def __init__(self, oracle, latency=0.0, failure_rate=0.0):
+        self.oracle = oracle
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    async def fetch(self, meeting_code, scenario=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise TransportError(f"Meet API unavailable for {meeting_code}")
+        raw_json = dict(self.oracle.get_meeting_data(scenario)["raw_json"])
+        raw_json["meetingCode"] = meeting_code
+        return raw_json
+
+
+class HttpTransport:
+    # Fetches participants over HTTP, e.g. from meet_stub.py or a real Meet
+    # proxy. requests is blocking, so calls run in a thread pool of `workers`
+    # threads (match the client's concurrency) and share one pooled Session.
+    # The pool is our own: asyncio.run() waits for its default executor to
+    # shut down, so a hung call there would block the caller. `timeout`
+    # bounds each connect/read, so worker threads are never stuck for good.
+
+    def __init__(self, base_url, timeout=5.0, workers=32):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="meet-http")
+
+    def _get(self, meeting_code, scenario):
+        params = {"scenario": scenario} if scenario else None
+        try:
+            response = self.session.get(f"{self.base_url}/meetings/{meeting_code}/participants", params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+        if response.status_code != 200:
+            raise TransportError(f"Meet API returned {response.status_code} for {meeting_code}")
+        return response.json()
+
+    async def fetch(self, meeting_code, scenario=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get, meeting_code, scenario)
+
+
+class AsyncOracleClient:
+    # Fetches attendance for many meetings concurrently. At most `concurrency`
+    # calls are in flight, each attempt is cut off after `timeout` seconds and
+    # failed attempts are retried with exponential backoff plus jitter.
+    # With a `cache` (see cache.TTLCache) results are kept per meeting code and
+    # repeat fetches are served from it.
+
+    def __init__(self, transport, concurrency=32, timeout=5.0, retries=3, backoff=0.1, cache=None):
+        self.transport = transport
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _fetch(self, semaphore, meeting_code, scenario):
+        if self.cache is not None:
+            data = self.cache.get(("meeting", meeting_code))
+            if data is not None:
+                return data
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    raw_json = await asyncio.wait_for(self.transport.fetch(meeting_code, scenario), self.timeout)
+                    data = meeting_data_from_raw(raw_json)
+                    if self.cache is not None:
+                        self.cache.set(("meeting", meeting_code), data)
+                    return data
+                except asyncio.TimeoutError:
+                    error = TransportError(f"Timed out after {self.timeout}s fetching {meeting_code}")
+                except TransportError as e:
+                    error = e
+                if attempt == self.retries:
+                    raise error
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+
+    async def fetch_many(self, meeting_codes, scenario=None):
+        # Returns {meeting_code: meeting data or the exception that ended its retries}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._fetch(semaphore, code, scenario) for code in meeting_codes),
+            return_exceptions=True
+        )
+        return dict(zip(meeting_codes, results))
+
+    def get_meeting_data_many(self, meeting_codes, scenario=None):
+        # Blocking entry point for synchronous callers such as the Flask views
+        return asyncio.run(self.fetch_many(list(meeting_codes), scenario))
@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import numpy as np
+
+# The settlement policy: which outcome a lesson gets from the attendance
+# percentages the oracle reports and the student's override. The backend
+# (settlement.py), the UI (through /api/policy) and SmartTutorEscrow.sol's
+# paysTeacher() all follow these rules. policy_check.py compares them.
+#
+# decide() states the rules once. They are compiled into a table of every
+# (override, teacherPct, studentPct) the contract can receive, percentages
+# being whole numbers 0-100 like its uint8 arguments, so settling a lesson
+# is one lookup and arrays of lessons are one fancy-indexing operation.
+
+# Outcome codes
+HAPPY_PATH = 0
+TEACHER_NO_SHOW = 1
+STUDENT_NO_SHOW = 2
+# The student released the payment regardless of attendance
+STUDENT_OVERRIDE = 3
+
+OUTCOME_NAMES = {
+    HAPPY_PATH: "Happy Path",
+    TEACHER_NO_SHOW: "Teacher No-Show",
+    STUDENT_NO_SHOW: "Student No-Show",
+    STUDENT_OVERRIDE: "Student Override"
+}
+
+# Minimum attendance, in percent of the lesson, for both sides
+THRESHOLD_PCT = 95
+
+
+def decide(teacher_pct, student_pct, override, threshold_pct=THRESHOLD_PCT):
+    # Student Override: paid out regardless of attendance
+    # Teacher No-Show: Teacher < 95%, the student is refunded
+    # Student No-Show: Teacher >= 95%, Student < 95%, the teacher is paid
+    # Happy Path: Teacher >= 95% AND Student >= 95%
+    if override:
+        return STUDENT_OVERRIDE
+    if teacher_pct < threshold_pct:
+        return TEACHER_NO_SHOW
+    if student_pct < threshold_pct:
+        return STUDENT_NO_SHOW
+    return HAPPY_PATH
+
+
+def pays_teacher(code):
+    # Every outcome but a teacher no-show releases the escrow to the teacher
+    return code != TEACHER_NO_SHOW
+
+
+@lru_cache(maxsize=None)
+def compile_table(threshold_pct=THRESHOLD_PCT):
+    # table[override, teacher_pct, student_pct] -> outcome code
+    table = np.empty((2, 101, 101), dtype=np.int8)
+    for override in (0, 1):
+        for teacher_pct in range(101):
+            for student_pct in range(101):
+                table[override, teacher_pct, student_pct] = decide(teacher_pct, student_pct, override, threshold_pct)
+    table.setflags(write=False)
+    return table
+
+
+TABLE = compile_table()
+
+
+def pct_index(pct):
+    # Attendance percentage -> whole percent 0-100, as the contract receives it
+    return max(0, min(100, int(pct)))
+
+
+def outcome(teacher_pct, student_pct, override=False, table=TABLE):
+    return int(table[int(bool(override)), pct_index(teacher_pct), pct_index(student_pct)])
+
+
+def outcomes(teacher_pcts, student_pcts, overrides=None, table=TABLE):
+    # Vectorized outcome(): arrays of percentages -> array of outcome codes
+    teacher = np.clip(np.asarray(teacher_pcts, dtype=np.float64), 0, 100).astype(np.intp)
+    student = np.clip(np.asarray(student_pcts, dtype=np.float64), 0, 100).astype(np.intp)
+    override = 0 if overrides is None else np.asarray(overrides, dtype=np.intp)
+    return table[override, teacher, student]
@@ -0,0 +1,104 @@
+import argparse
+import sys
+
+import numpy as np
+import requests
+
+from escrow import SolcUnavailable
+from policy import TABLE, pays_teacher
+from settlement import settle, settle_arrays
+from txid import keccak256
+
+# Differential check of the settlement policy. Every (override, teacherPct,
+# studentPct) the contract can receive is run through:
+#   - the compiled table (policy.TABLE)
+#   - the backend's scalar and vectorized settlement (settle, settle_arrays)
+#   - paysTeacher() of the real SmartTutorEscrow.sol, through eth_call: by
+#     default compiled and deployed on an in-process chain (needs py-solc-x,
+#     solc and web3[tester], see escrow.py), with --rpc/--escrow a deployed one
+# and any disagreement is printed. Exits 1 on a mismatch.
+#
+#   python3 policy_check.py
+#   python3 policy_check.py --rpc http://127.0.0.1:8545 --escrow 0x...
+
+PAYS_TEACHER = keccak256(b"paysTeacher(uint8,uint8,bool)")[:4]
+# Required duration used to turn percentages into durations: 1 minute = 1%
+REQUIRED = 100
+
+
+def cases():
+    return [(override, teacher_pct, student_pct) for override in (0, 1) for teacher_pct in range(101) for student_pct in range(101)]
+
+
+def local_escrow():
+    # SmartTutorEscrow compiled and deployed on a fresh in-process chain
+    from web3 import EthereumTesterProvider, Web3
+
+    from escrow import deploy_escrow
+    w3 = Web3(EthereumTesterProvider())
+    return deploy_escrow(w3, w3.eth.accounts[1], w3.eth.accounts[2])
+
+
+def contract_pays_teacher(escrow, inputs):
+    # paysTeacher() of a web3 contract for every input
+    pays = escrow.functions.paysTeacher
+    return [pays(teacher_pct, student_pct, bool(override)).call() for override, teacher_pct, student_pct in inputs]
+
+
+def rpc_pays_teacher(rpc_url, escrow, inputs, batch_size=500):
+    # paysTeacher() of the deployed contract for every input, via batched eth_call
+    session = requests.Session()
+    results = []
+    for start in range(0, len(inputs), batch_size):
+        batch = []
+        for i, (override, teacher_pct, student_pct) in enumerate(inputs[start:start + batch_size]):
+            data = PAYS_TEACHER + b"".join(value.to_bytes(32, "big") for value in (teacher_pct, student_pct, override))
+            batch.append({
+                "jsonrpc": "2.0", "id": start + i, "method": "eth_call",
+                "params": [{"to": escrow, "data": "0x" + data.hex()}, "latest"]
+            })
+        responses = sorted(session.post(rpc_url, json=batch, timeout=30).json(), key=lambda response: response["id"])
+        results.extend(int(response["result"], 16) == 1 for response in responses)
+    return results
+
+
+def check(rpc_url=None, escrow=None):
+    inputs = cases()
+    overrides = np.array([case[0] for case in inputs], dtype=bool)
+    teacher = np.array([case[1] for case in inputs], dtype=np.float64)
+    student = np.array([case[2] for case in inputs], dtype=np.float64)
+    vectorized = settle_arrays(teacher, student, np.full(len(inputs), REQUIRED, dtype=np.float64), np.full(len(inputs), 3000), 200, 10, overrides)
+    if rpc_url:
+        onchain = rpc_pays_teacher(rpc_url, escrow, inputs)
+    else:
+        onchain = contract_pays_teacher(local_escrow(), inputs)
+
+    mismatches = 0
+    for i, (override, teacher_pct, student_pct) in enumerate(inputs):
+        code = int(TABLE[override, teacher_pct, student_pct])
+        paid = pays_teacher(code)
+        checks = {
+            "settle": settle(teacher_pct, student_pct, REQUIRED, 3000, 200, 10, override=bool(override))[0] == code,
+            "settle_arrays": int(vectorized["code"][i]) == code,
+            "SmartTutorEscrow.paysTeacher": onchain[i] == paid
+        }
+        failed = [name for name, ok in checks.items() if not ok]
+        if failed:
+            mismatches += 1
+            print(f"override={override} teacherPct={teacher_pct} studentPct={student_pct}: table says {code}, {', '.join(failed)} disagree")
+    print(f"{len(inputs)} cases, {mismatches} mismatches")
+    return mismatches == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the settlement policy table with the backend and the contract")
+    parser.add_argument('--rpc', help="JSON-RPC URL of a node with SmartTutorEscrow deployed (default: deploy it in-process)")
+    parser.add_argument('--escrow', help="address of the deployed SmartTutorEscrow")
+    args = parser.parse_args()
+    if bool(args.rpc) != bool(args.escrow):
+        parser.error("--rpc and --escrow go together")
+    try:
+        ok = check(args.rpc, args.escrow)
+    except SolcUnavailable as e:
+        parser.error(f"can't compile SmartTutorEscrow.sol: {e}; or check a deployed contract with --rpc and --escrow")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,636 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from contract import new_lesson_id
+from fastjson import FastJSONProvider
+from indexes import UNSCHEDULED, format_cursor
+from money import fee, from_minor, to_minor
+from settlement import parse_batch
+from sharding import shard_for
+from stream import KEEPALIVE_SECONDS, sse_frame
+from txid import content_lesson_id, node_from_tx
+
+# Sharded deployment:
+#
+#   python3 router.py --shards 4
+#
+# starts 4 backend processes (app.py, one shard each, on ports 5100-5103)
+# and this router on port 5000. The router exposes the same /api/* as a
+# single backend and forwards each request to the shard owning its lessonId
+# (see sharding.py). Clients that know the shard count can also call the
+# shards directly with sharding.shard_for().
+#
+# State from several shards is merged: balances are summed and `seq`/`epoch`
+# become dot-separated per-shard cursors, which clients send back unchanged.
+# A merged state costs a call to every shard, so fund/topup/resolve answer
+# with the owning shard's own state delta unless the body asks for
+# `"merged": true`.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST_TIMEOUT = 30
+
+app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+SHARD_URLS = [url for url in os.environ.get('SHARD_URLS', '').split(',') if url]
+# Fan-out requests to the shards run in parallel
+pool = ThreadPoolExecutor(max_workers=32)
+# One pooled session per router thread, requests.Session isn't thread-safe
+_local = threading.local()
+# Most recently funded lesson across all shards, shared by the worker
+# processes (see serve()). Lesson ids are ASCII. Shared memory from the
+# platform's default context, which every start method can create.
+current_lesson = multiprocessing.Array('c', 256)
+
+
+def current_lesson_id():
+    return current_lesson.value.decode() or None
+
+def set_current_lesson_id(lesson_id):
+    current_lesson.value = (lesson_id or '').encode()[:256]
+
+
+def session():
+    shard_session = getattr(_local, 'session', None)
+    if shard_session is None:
+        shard_session = _local.session = requests.Session()
+    return shard_session
+
+def call(shard, method, path, **kwargs):
+    return session().request(method, SHARD_URLS[shard] + path, timeout=REQUEST_TIMEOUT, **kwargs)
+
+def fan_out(method, path, **kwargs):
+    return list(pool.map(lambda shard: call(shard, method, path, **kwargs), range(len(SHARD_URLS))))
+
+def relay(response):
+    return app.response_class(response.content, status=response.status_code, mimetype='application/json')
+
+def shard_of(lesson_id):
+    return shard_for(lesson_id, len(SHARD_URLS))
+
+# -----------------------------------------------------------------------------
+# Merged state
+# -----------------------------------------------------------------------------
+
+def _split_cursor(value):
+    # Per-shard integers of a dot-separated cursor. None when not sent or
+    # not one part per shard; ValueError when a part isn't an integer.
+    if value is None:
+        return None
+    parts = str(value).split('.')
+    return [int(part) for part in parts] if len(parts) == len(SHARD_URLS) else None
+
+def shard_balances():
+    # Minor-unit balances and fee rates of every shard
+    return [response.json() for response in fan_out('GET', '/api/shard/balances')]
+
+def summed_balances(infos, wallets=None):
+    totals = {}
+    for info in infos:
+        for wallet, amount in info['balances'].items():
+            if wallets is None or wallet in wallets:
+                totals[wallet] = totals.get(wallet, 0) + amount
+    return {wallet: from_minor(amount) for wallet, amount in totals.items()}
+
+def merged_state(params):
+    # Same shape as SmartContract.get_state(), built from every shard's state
+    if params.get('state') is False:
+        return None
+    try:
+        sinces = _split_cursor(params.get('since'))
+        epochs = _split_cursor(params.get('epoch'))
+    except ValueError:
+        # Like a shard's state_since(): the full state instead of an error
+        sinces = epochs = None
+
+    def fetch(shard):
+        query = {}
+        if sinces is not None:
+            query['since'] = sinces[shard]
+            if epochs is not None:
+                query['epoch'] = epochs[shard]
+        return call(shard, 'GET', '/api/state', params=query).json()
+
+    states = list(pool.map(fetch, range(len(SHARD_URLS))))
+    incremental = all(state['incremental'] for state in states)
+
+    logs = []
+    changed = set()
+    for state in states:
+        logs.extend(state['logs'])
+        changed.update(state['balances'])
+    # A wallet's total needs every shard's share, not only the shards that changed it
+    balances = {}
+    if changed or not incremental:
+        balances = summed_balances(shard_balances(), changed if incremental else None)
+
+    lesson_id = current_lesson_id()
+    owner = states[shard_of(lesson_id)] if lesson_id else states[0]
+    return {
+        "balances": balances,
+        "status": owner['status'],
+        "logs": logs,
+        "epoch": '.'.join(str(state['epoch']) for state in states),
+        "seq": '.'.join(str(state['seq']) for state in states),
+        "incremental": incremental,
+        "lesson_id": lesson_id,
+        "lesson_price": owner['lesson_price'],
+        "open_lessons": sum(state['open_lessons'] for state in states),
+        "total_lessons": sum(state['total_lessons'] for state in states),
+        "last_oracle_data": owner['last_oracle_data'],
+        "last_outcome": owner['last_outcome']
+    }
+
+def forwarded(data, shard):
+    # Request body for the shard that owns an operation. The shard answers
+    # with its own state since the client's cursor for it. With
+    # `"merged": true` the router builds the merged state after the call.
+    body = {key: value for key, value in data.items() if key not in ('since', 'epoch', 'merged')}
+    if data.get('merged') or data.get('state') is False:
+        body['state'] = False
+        return body
+    try:
+        sinces = _split_cursor(data.get('since'))
+        epochs = _split_cursor(data.get('epoch'))
+    except ValueError:
+        sinces = epochs = None
+    if sinces is not None:
+        body['since'] = sinces[shard]
+        if epochs is not None:
+            body['epoch'] = epochs[shard]
+    return body
+
+def with_state(data, shard, result):
+    # Fills in the `state` of a forwarded operation's result. The shard's
+    # own state is tagged with its index: its balances are that shard's
+    # share and its `seq`/`epoch` that shard's part of the merged cursor.
+    if data.get('merged') and data.get('state') is not False:
+        result['state'] = merged_state(data)
+    elif result.get('state') is not None:
+        result['state']['shard'] = shard
+    return result
+
+# -----------------------------------------------------------------------------
+# Cross-shard transfers
+# -----------------------------------------------------------------------------
+
+def complete_transfer(transfer_id, wallet, amount, source, target):
+    # Steps 2 and 3 of a transfer. Both are idempotent, so this is also how
+    # a transfer interrupted by a crash is finished.
+    call(target, 'POST', '/api/shard/transfer_in', json={"wallet": wallet, "amount": amount, "transfer_id": transfer_id}).raise_for_status()
+    call(source, 'POST', '/api/shard/transfer_done', json={"transfer_id": transfer_id}).raise_for_status()
+
+def transfer(wallet, amount, source, target):
+    transfer_id = uuid.uuid4().hex
+    response = call(source, 'POST', '/api/shard/transfer_out', json={
+        "wallet": wallet, "amount": amount, "transfer_id": transfer_id, "target": target
+    })
+    if response.status_code != 200:
+        return False
+    complete_transfer(transfer_id, wallet, amount, source, target)
+    return True
+
+def recover_transfers():
+    # Finishes transfers that were sent but never confirmed. Runs before the
+    # workers are forked, so it calls the shards one at a time rather than
+    # starting the pool's threads.
+    for source in range(len(SHARD_URLS)):
+        transfers = call(source, 'GET', '/api/shard/transfers').json()['transfers']
+        for transfer_id, (wallet, amount, target) in transfers.items():
+            complete_transfer(transfer_id, wallet, amount, source, target)
+
+def pull_funds(wallet, target, price):
+    # Moves enough of `wallet` to shard `target` to pay `price` plus the
+    # transaction fee. Takes at least half of each source shard's balance,
+    # so the following fundings on the target stay local. Returns False only
+    # when the wallet doesn't have enough on all shards together.
+    infos = shard_balances()
+    needed = price + fee(price, infos[target]['tx_fee_bps']) - infos[target]['balances'].get(wallet, 0)
+    if needed <= 0:
+        # Someone else already refilled it
+        return True
+    sources = sorted(
+        ((info['balances'].get(wallet, 0), shard) for shard, info in enumerate(infos) if shard != target),
+        reverse=True
+    )
+    in_flight = sum(info['in_flight'].get(wallet, 0) for info in infos)
+    if sum(balance for balance, _ in sources) + in_flight < needed:
+        return False
+    for balance, source in sources:
+        if needed <= 0:
+            break
+        amount = min(balance, max(needed, balance // 2))
+        if amount > 0 and transfer(wallet, amount, source, target):
+            needed -= amount
+    # A source drained concurrently is picked up by the caller's next attempt
+    return True
+
+# -----------------------------------------------------------------------------
+# API, same routes as app.py
+# -----------------------------------------------------------------------------
+
+@app.route('/api/state', methods=['GET'])
+def get_state():
+    try:
+        _split_cursor(request.args.get('since'))
+        _split_cursor(request.args.get('epoch'))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid state cursor."}), 400
+    return jsonify(merged_state(request.args))
+
+@app.route('/api/logs', methods=['GET'])
+def get_logs():
+    # Sequence numbers are per shard, so logs are read from one shard at a time
+    shard = int(request.args.get('shard', 0))
+    params = {key: value for key, value in request.args.items() if key != 'shard'}
+    return relay(call(shard, 'GET', '/api/logs', params=params))
+
+def _read_frames(response):
+    # Parses an SSE stream into {"event", "id", "data"} dicts, skipping comments
+    frame = {}
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            field, _, value = line.partition(': ')
+            if field in ('event', 'id', 'data'):
+                frame[field] = value
+        elif 'data' in frame:
+            yield frame
+            frame = {}
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    # One stream merged from every shard's /api/events. Event ids and the
+    # `seq`/`epoch` of `balances`, `reset` and `resync` events are
+    # dot-separated per-shard cursors, the `since` of /api/state. Balances
+    # are summed over shards. A reconnect's Last-Event-ID (or `?since=`)
+    # resumes every shard where it stopped.
+    infos = shard_balances()
+    try:
+        cursor = _split_cursor(request.headers.get('Last-Event-ID') or request.args.get('since'))
+        seqs = cursor or [info['seq'] for info in infos]
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid event cursor."}), 400
+    epochs = [info['epoch'] for info in infos]
+    # Each shard's share of every wallet, in minor units
+    shares = [dict(info['balances']) for info in infos]
+
+    # Bounded, so a slow client makes the shard streams lag and resync
+    # instead of growing this queue
+    frames = queue.Queue(maxsize=1000)
+    streams = []
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                frames.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(shard):
+        try:
+            response = requests.get(
+                f'{SHARD_URLS[shard]}/api/events', params={'since': seqs[shard]},
+                stream=True, timeout=(REQUEST_TIMEOUT, None)
+            )
+            streams.append(response)
+            if response.status_code != 200:
+                return
+            for frame in _read_frames(response):
+                if not put((shard, frame)):
+                    return
+        except Exception:
+            # The shard went away, or the stream was closed because the client did
+            pass
+        finally:
+            put((shard, None))
+
+    def cursors():
+        return '.'.join(str(seq) for seq in seqs), '.'.join(str(epoch) for epoch in epochs)
+
+    def merged():
+        try:
+            yield b"retry: 1000\n\n"
+            while True:
+                try:
+                    shard, frame = frames.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if frame is None:
+                    # A shard went away: end the stream, the client reconnects
+                    return
+                event = frame.get('event', 'message')
+                data = json.loads(frame['data'])
+                if event == 'balances':
+                    for wallet, amount in data['balances'].items():
+                        shares[shard][wallet] = to_minor(amount)
+                    seqs[shard], epochs[shard] = data['seq'], data['epoch']
+                    seq, epoch = cursors()
+                    totals = {wallet: from_minor(sum(share.get(wallet, 0) for share in shares)) for wallet in data['balances']}
+                    yield sse_frame('balances', {"epoch": epoch, "seq": seq, "balances": totals})
+                elif event in ('reset', 'resync'):
+                    seqs[shard], epochs[shard] = data['seq'], data['epoch']
+                    if event == 'reset':
+                        shares[shard] = dict(call(shard, 'GET', '/api/shard/balances').json()['balances'])
+                    seq, epoch = cursors()
+                    yield sse_frame(event, {"shard": shard, "epoch": epoch, "seq": seq})
+                else:
+                    seqs[shard] = int(frame['id']) + 1
+                    yield sse_frame(event, data, cursors()[0])
+        finally:
+            stopped.set()
+            for response in streams:
+                response.close()
+
+    for shard in range(len(SHARD_URLS)):
+        threading.Thread(target=read, args=(shard,), name=f'events-{shard}', daemon=True).start()
+    response = app.response_class(merged(), mimetype='text/event-stream')
+    response.call_on_close(stopped.set)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/scheduler', methods=['GET'])
+def get_scheduler():
+    # Every shard resolves its own scheduled lessons
+    infos = [response.json() for response in fan_out('GET', '/api/scheduler')]
+    due = [info['next_due'] for info in infos if info['next_due'] is not None]
+    return jsonify({
+        "pending": sum(info['pending'] for info in infos),
+        "next_due": min(due) if due else None,
+        "resolved": sum(info['resolved'] for info in infos),
+        "failed": sum(info['failed'] for info in infos)
+    })
+
+@app.route('/api/policy', methods=['GET'])
+def get_policy():
+    # Every shard settles with the same policy
+    return relay(call(0, 'GET', '/api/policy'))
+
+@app.route('/api/tx/<tx_hash>', methods=['GET'])
+def get_transaction(tx_hash):
+    # Transaction ids carry the node id of the shard that issued them
+    shard = node_from_tx(tx_hash)
+    if shard >= len(SHARD_URLS):
+        return jsonify({"status": "error", "message": "Unknown transaction."}), 404
+    return relay(call(shard, 'GET', f'/api/tx/{tx_hash}'))
+
+@app.route('/api/reset', methods=['POST'])
+def reset():
+    fan_out('POST', '/api/reset')
+    set_current_lesson_id(None)
+    return jsonify({"message": "System reset successfully", "state": merged_state({})})
+
+@app.route('/api/fund', methods=['POST'])
+def fund():
+    data = request.json or {}
+    student = data.get('student', 'student')
+    lesson_id = data.get('lesson_id')
+    if not lesson_id and data.get('scheduled_start') is not None:
+        try:
+            lesson_id = content_lesson_id(student, data.get('teacher', 'teacher'), data['scheduled_start'], data.get('nonce', 0))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    lesson_id = lesson_id or new_lesson_id()
+    shard = shard_of(lesson_id)
+    body = forwarded(data, shard)
+    body['lesson_id'] = lesson_id
+
+    # The student's funds may sit on other shards. Pull them over and retry,
+    # a few times in case concurrent fundings use them up first.
+    for _ in range(5):
+        response = call(shard, 'POST', '/api/fund', json=body)
+        if response.status_code == 200 or not response.json()['message'].startswith('Insufficient funds'):
+            break
+        if not pull_funds(student, shard, to_minor(data.get('price', 30))):
+            break
+
+    result = response.json()
+    if response.status_code == 200:
+        set_current_lesson_id(lesson_id)
+        with_state(data, shard, result)
+    return jsonify(result), response.status_code
+
+@app.route('/api/lessons', methods=['GET'])
+def query_lessons():
+    # Every shard's page, merged by end time. The cursor holds one cursor
+    # per shard, comma-separated: empty for "from the start", "-" once a
+    # shard has nothing more.
+    args = request.args.to_dict()
+    cursor = args.pop('cursor', None)
+    parts = cursor.split(',') if cursor else [''] * len(SHARD_URLS)
+    if len(parts) != len(SHARD_URLS):
+        return jsonify({"status": "error", "message": "Invalid query parameters."}), 400
+    limit = int(args.get('limit', 100)) if args.get('limit', '100').isdigit() else 0
+
+    def fetch(shard):
+        if parts[shard] == '-':
+            return None
+        params = dict(args, cursor=parts[shard]) if parts[shard] else args
+        return call(shard, 'GET', '/api/lessons', params=params)
+
+    responses = list(pool.map(fetch, range(len(SHARD_URLS))))
+    for response in responses:
+        if response is not None and response.status_code != 200:
+            return relay(response)
+
+    pages = [response.json() if response is not None else {"lessons": [], "next_cursor": None} for response in responses]
+    merged = sorted(
+        (lesson_key(lesson), shard, lesson)
+        for shard, page in enumerate(pages) for lesson in page['lessons']
+    )[:limit]
+    last = {}
+    for key, shard, _ in merged:
+        last[shard] = key
+    for shard, page in enumerate(pages):
+        if parts[shard] == '-':
+            continue
+        taken = sum(1 for _, owner, _ in merged if owner == shard)
+        if taken == len(page['lessons']) and page['next_cursor'] is None:
+            parts[shard] = '-'
+        elif shard in last:
+            parts[shard] = format_cursor(last[shard])
+    return jsonify({
+        "lessons": [lesson for _, _, lesson in merged],
+        "next_cursor": None if all(part == '-' for part in parts) else ','.join(parts)
+    })
+
+def lesson_key(lesson):
+    # indexes.lesson_key() for a lesson from the API
+    if lesson['scheduled_start'] is None:
+        return (UNSCHEDULED, lesson['lesson_id'])
+    return (lesson['scheduled_start'] + lesson['duration_minutes'] * 60, lesson['lesson_id'])
+
+@app.route('/api/lessons/<lesson_id>', methods=['GET'])
+def get_lesson(lesson_id):
+    return relay(call(shard_of(lesson_id), 'GET', f'/api/lessons/{lesson_id}'))
+
+@app.route('/api/topup', methods=['POST'])
+def topup():
+    data = request.json or {}
+    # Top-ups go to the wallet's home shard
+    shard = shard_of(data.get('wallet', 'student'))
+    response = call(shard, 'POST', '/api/topup', json=forwarded(data, shard))
+    return jsonify(with_state(data, shard, response.json())), response.status_code
+
+@app.route('/api/scenario', methods=['POST'])
+def set_scenario():
+    responses = fan_out('POST', '/api/scenario', json=request.json)
+    return relay(responses[0])
+
+@app.route('/api/resolve', methods=['POST'])
+def resolve():
+    data = request.json or {}
+    lesson_id = data.get('lesson_id') or current_lesson_id()
+    shard = shard_of(lesson_id) if lesson_id else 0
+    body = forwarded(data, shard)
+    body['lesson_id'] = lesson_id
+    response = call(shard, 'POST', '/api/resolve', json=body)
+    return jsonify(with_state(data, shard, response.json())), response.status_code
+
+@app.route('/api/resolve/batch', methods=['POST'])
+def resolve_batch():
+    # Each shard settles its part of the batch, all shards at once. The batch
+    # is checked here first, so no shard settles part of an invalid batch.
+    data = request.json or {}
+    error, records, _ = parse_batch(data)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    groups = [[] for _ in SHARD_URLS]
+    for i, (item, record) in enumerate(zip(data.get('lessons', []), records)):
+        groups[shard_of(record[0])].append((i, item))
+
+    def settle_group(shard):
+        if not groups[shard]:
+            return []
+        body = dict(data, lessons=[item for _, item in groups[shard]])
+        return call(shard, 'POST', '/api/resolve/batch', json=body).json()['results']
+
+    # Results in input order
+    results = [None] * len(records)
+    for shard, shard_results in enumerate(pool.map(settle_group, range(len(SHARD_URLS)))):
+        for (i, _), result in zip(groups[shard], shard_results):
+            results[i] = result
+    resolved = sum(1 for result in results if result['success'])
+
+    return jsonify({
+        "results": results,
+        "resolved": resolved,
+        "failed": len(results) - resolved,
+        "balances": summed_balances(shard_balances())
+    })
+
+# -----------------------------------------------------------------------------
+# Launcher
+# -----------------------------------------------------------------------------
+
+def start_shards(count, base_port, data_dir, asgi=False):
+    # One process per shard: a ledger is owned by exactly one process. With
+    # `asgi` shards are served by uvicorn (asgi.py) instead of app.py's
+    # development server.
+    processes = []
+    for shard in range(count):
+        shard_dir = os.path.join(data_dir, f'shard-{shard}')
+        env = dict(
+            os.environ,
+            SHARD_INDEX=str(shard),
+            SHARD_COUNT=str(count),
+            NODE_ID=str(shard),
+            PORT=str(base_port + shard),
+            LEDGER_DIR=os.path.join(shard_dir, 'ledger'),
+            EVENT_LOG_PATH=os.path.join(shard_dir, 'events.log')
+        )
+        if asgi:
+            command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(base_port + shard),
+                       '--no-access-log', '--timeout-graceful-shutdown', '30']
+        else:
+            command = [sys.executable, 'app.py']
+        processes.append(subprocess.Popen(command, cwd=BACKEND_DIR, env=env))
+    SHARD_URLS[:] = [f'http://127.0.0.1:{base_port + shard}' for shard in range(count)]
+    return processes
+
+def wait_for_shards(timeout=30):
+    deadline = time.monotonic() + timeout
+    for shard in range(len(SHARD_URLS)):
+        while True:
+            try:
+                call(shard, 'GET', '/api/shard/balances')
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+def serve(port, workers):
+    # `workers` router processes accept connections on one listening socket.
+    # They are forked before the router starts any thread, and each serves
+    # requests on threads with its own shard sessions and fan-out pool.
+    listener = socket.create_server(('127.0.0.1', port), backlog=1024)
+
+    def run():
+        make_server('127.0.0.1', port, app, threaded=True, fd=listener.fileno()).serve_forever()
+
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        # Workers inherit the listening socket and the shared state by forking
+        sys.stderr.write("router: fork is not available on this platform, serving with one process\n")
+        workers = 1
+    if workers <= 1:
+        run()
+        return
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=run, name=f'router-{worker}', daemon=True) for worker in range(workers)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    finally:
+        for child in children:
+            child.terminate()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded backend: router plus one process per shard")
+    parser.add_argument('--shards', type=int, default=os.cpu_count(), help="number of shard processes (default: CPU count)")
+    parser.add_argument('--port', type=int, default=5000, help="router port")
+    parser.add_argument('--base-port', type=int, default=5100, help="port of shard 0, shard i listens on base + i")
+    parser.add_argument('--data-dir', default='data', help="each shard keeps its ledger in <data-dir>/shard-<i>")
+    parser.add_argument('--shard-urls', help="comma-separated URLs of running shards, instead of starting them")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="router processes (default: CPU count)")
+    parser.add_argument('--asgi', action='store_true', help="serve shards with uvicorn (asgi.py) instead of app.py")
+    options = parser.parse_args()
+
+    processes = []
+    if options.shard_urls:
+        SHARD_URLS[:] = options.shard_urls.split(',')
+    else:
+        processes = start_shards(options.shards, options.base_port, options.data_dir, options.asgi)
+    try:
+        wait_for_shards()
+        recover_transfers()
+        serve(options.port, options.workers)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
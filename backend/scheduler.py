@@ -0,0 +1,157 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Automatic resolution of scheduled lessons.
+#
+# Funded lessons with a scheduledStart wait in a heap ordered by the time
+# they are due: scheduledStart + durationMinutes, plus `lag` seconds for the
+# meeting's attendance to become final. Scheduling is O(log n) and one
+# dispatcher thread serves every lesson. Due lessons are taken off the heap
+# in batches of up to `batch_size`. Each batch has its attendance fetched
+# concurrently by the oracle client and is settled with resolve_many(). At
+# most `concurrency` batches are in flight.
+#
+# Entries are never removed early. A lesson resolved by hand before it is
+# due is skipped when its entry comes up, since it is no longer FUNDED.
+
+
+class ResolutionScheduler:
+    def __init__(self, contract, oracle_client, lag=60.0, batch_size=1000, concurrency=4, retry_delay=60.0, scenario=None, clock=time.time):
+        # Attendance is fetched with the lesson_id as the meeting code.
+        # Lessons whose fetch fails are retried `retry_delay` seconds later.
+        # `scenario` is passed to the oracle (the stub transport's scenario).
+        self.contract = contract
+        self.oracle_client = oracle_client
+        self.lag = lag
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.scenario = scenario
+        self.clock = clock
+        self.resolved = 0
+        self.failed = 0
+        self._heap = []
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="scheduler")
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, lesson):
+        # Queues a funded lesson to be resolved once it is over
+        end_time = lesson.end_time()
+        if end_time is None:
+            return
+        self._push(end_time + self.lag, lesson.lesson_id)
+
+    def _push(self, due, lesson_id):
+        with self._cond:
+            heapq.heappush(self._heap, (due, lesson_id))
+            # Only a new earliest entry changes how long the dispatcher sleeps
+            if self._heap[0][1] == lesson_id:
+                self._cond.notify()
+
+    def load(self, lessons):
+        # Schedules every FUNDED lesson at once, e.g. after recovery. O(n).
+        entries = [
+            (lesson.end_time() + self.lag, lesson.lesson_id)
+            for lesson in lessons
+            if lesson.status == "FUNDED" and lesson.scheduled_start is not None
+        ]
+        with self._cond:
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            self._heap = []
+
+    def next_due(self):
+        # Unix time the next entry is due, None when nothing is scheduled
+        heap = self._heap
+        return heap[0][0] if heap else None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, drain=True):
+        # Stops taking due lessons. With `drain` waits for batches in flight.
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=drain)
+
+    def _take_due(self):
+        # Blocks until lessons are due, returns up to batch_size of them, or
+        # None once stopped
+        with self._cond:
+            while not self._stopped:
+                now = self.clock()
+                if self._heap and self._heap[0][0] <= now:
+                    batch = []
+                    while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                        batch.append(heapq.heappop(self._heap)[1])
+                    return batch
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            return None
+
+    def _run(self):
+        while True:
+            # Bounds the batches in flight before taking more off the heap
+            self._slots.acquire()
+            batch = self._take_due()
+            if batch is None:
+                self._slots.release()
+                return
+            self._pool.submit(self._run_batch, batch)
+
+    def _run_batch(self, lesson_ids):
+        try:
+            self.resolve(lesson_ids)
+        finally:
+            self._slots.release()
+
+    def resolve(self, lesson_ids):
+        # Fetches attendance for the lessons that are still FUNDED and
+        # settles them, one resolve_many() call per lesson duration. Returns
+        # the number of lessons resolved.
+        lessons = [self.contract.get_lesson(lesson_id) for lesson_id in lesson_ids]
+        lessons = [lesson for lesson in lessons if lesson is not None and lesson.status == "FUNDED"]
+        if not lessons:
+            return 0
+        attendance = self.oracle_client.get_meeting_data_many([lesson.lesson_id for lesson in lessons], self.scenario)
+
+        by_duration = {}
+        retry = []
+        for lesson in lessons:
+            data = attendance[lesson.lesson_id]
+            if isinstance(data, Exception):
+                retry.append(lesson.lesson_id)
+                continue
+            by_duration.setdefault(lesson.duration_minutes, []).append(
+                (lesson.lesson_id, data["teacher_duration"], data["student_duration"], data.get("student_override", False))
+            )
+
+        resolved = 0
+        for duration, records in by_duration.items():
+            results = self.contract.resolve_many(records, required_duration=duration)
+            resolved += sum(1 for result in results if result["success"] and not result.get("replayed"))
+
+        if retry:
+            due = self.clock() + self.retry_delay
+            for lesson_id in retry:
+                self._push(due, lesson_id)
+        with self._cond:
+            self.resolved += resolved
+            self.failed += len(retry)
+        return resolved
@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+
+from money import BPS, fee
+# Outcome codes shared by the scalar and vectorized settlement paths
+from policy import HAPPY_PATH, STUDENT_NO_SHOW, STUDENT_OVERRIDE, TEACHER_NO_SHOW, THRESHOLD_PCT, compile_table, outcome, outcomes
+
+ATTENDANCE_THRESHOLD = THRESHOLD_PCT / 100
+
+SETTLEMENT_FIELDS = ("code", "teacher_pct", "student_pct", "teacher_payout", "student_refund", "platform_fee", "tx_fee")
+
+
+def is_duration(value):
+    # Finite, non-negative number of minutes (bools are ints in Python, not durations)
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value >= 0
+
+
+def batch_record(item):
+    # One record of a batch resolution request, either
+    # [lesson_id, teacher_duration, student_duration] or an object with those
+    # keys, or with a `meeting_code` instead of durations.
+    # Objects may also set `student_override`.
+    # Returns (lesson_id, teacher_duration, student_duration, meeting_code, student_override),
+    # durations None when they are to be fetched. Raises ValueError.
+    student_override = False
+    if isinstance(item, dict):
+        student_override = item.get("student_override", False)
+        if not isinstance(student_override, bool):
+            raise ValueError("student_override must be true or false")
+        lesson_id = item.get("lesson_id")
+        meeting_code = item.get("meeting_code") if "teacher_duration" not in item else None
+        if meeting_code is not None:
+            if not isinstance(meeting_code, str):
+                raise ValueError("meeting_code must be a string")
+            durations = (None, None)
+        else:
+            durations = (item.get("teacher_duration"), item.get("student_duration"))
+    elif isinstance(item, (list, tuple)) and len(item) == 3:
+        lesson_id, durations, meeting_code = item[0], item[1:], None
+    else:
+        raise ValueError("expected [lesson_id, teacher_duration, student_duration] or an object")
+    if not isinstance(lesson_id, str) or not lesson_id:
+        raise ValueError("lesson_id must be a non-empty string")
+    if meeting_code is None and not all(is_duration(duration) for duration in durations):
+        raise ValueError("durations must be non-negative numbers")
+    return lesson_id, durations[0], durations[1], meeting_code, student_override
+
+
+def parse_batch(data):
+    # (error, records, required_duration) for a /api/resolve/batch body.
+    # error is None when every record is valid.
+    required_duration = data.get("required_duration", 60)
+    if not (is_duration(required_duration) and required_duration > 0):
+        return "required_duration must be a positive number.", None, None
+    lessons = data.get("lessons", [])
+    if not isinstance(lessons, list):
+        return "lessons must be a list.", None, None
+    records = []
+    for i, item in enumerate(lessons):
+        try:
+            records.append(batch_record(item))
+        except ValueError as e:
+            return f"Invalid record {i}: {e}.", None, None
+    return None, records, required_duration
+
+
+def outcome_message(code, teacher_pct, student_pct):
+    if code == HAPPY_PATH:
+        return "Happy Path: Lesson Completed Successfully."
+    elif code == STUDENT_OVERRIDE:
+        return f"Student Override: Student approved payment release. (Teacher: {teacher_pct:.0f}%, Student: {student_pct:.0f}%)"
+    elif code == TEACHER_NO_SHOW:
+        return f"Teacher No-Show: Student refunded. (Teacher attended {teacher_pct:.0f}%, which is less than the required minimum of {THRESHOLD_PCT}%)"
+    else:
+        return f"Student No-Show: Teacher compensated. (Teacher was present {teacher_pct:.0f}% of the time, Student only attended {student_pct:.0f}%)"
+
+
+def settle(teacher_duration, student_duration, required_duration, price, platform_fee_bps, tx_fee_bps, vectorized=False, override=False):
+    # Scalar settlement of one lesson. Amounts are integer minor units and fee
+    # rates basis points (see money.py). `override` is the student's release
+    # of the payment, which pays the teacher whatever the attendance.
+    # Returns (code, teacher_pct, student_pct, teacher_payout, student_refund, platform_fee, tx_fee)
+    if vectorized:
+        result = settle_arrays([teacher_duration], [student_duration], [required_duration], [price], platform_fee_bps, tx_fee_bps, [override])
+        return tuple(result[key][0].item() for key in SETTLEMENT_FIELDS)
+
+    # The outcome comes from the policy table (see policy.py)
+    teacher_pct = (teacher_duration / required_duration) * 100
+    student_pct = (student_duration / required_duration) * 100
+    code = outcome(teacher_pct, student_pct, override)
+
+    if code == TEACHER_NO_SHOW:
+        tx_fee = fee(price, tx_fee_bps)
+        return code, teacher_pct, student_pct, 0, price - tx_fee, 0, tx_fee
+
+    platform_fee = fee(price, platform_fee_bps)
+    gross_payout = price - platform_fee
+    tx_fee = fee(gross_payout, tx_fee_bps)
+    return code, teacher_pct, student_pct, gross_payout - tx_fee, 0, platform_fee, tx_fee
+
+
+def settle_arrays(teacher_durations, student_durations, required_durations, prices, platform_fee_bps, tx_fee_bps, overrides=None, threshold=ATTENDANCE_THRESHOLD):
+    # Vectorized settlement of many lessons in one call. Performs the same
+    # operations in the same order as settle(), durations in float64 and
+    # money in int64, so results are identical. `threshold` is the share of
+    # the lesson both sides must attend, in whole percents; simulate.py
+    # varies it.
+    # Returns a dict of arrays keyed by SETTLEMENT_FIELDS.
+    teacher = np.asarray(teacher_durations, dtype=np.float64)
+    student = np.asarray(student_durations, dtype=np.float64)
+    required = np.asarray(required_durations, dtype=np.float64)
+    price = np.asarray(prices, dtype=np.int64)
+
+    teacher_pct = (teacher / required) * 100
+    student_pct = (student / required) * 100
+    code = outcomes(teacher_pct, student_pct, overrides, compile_table(round(threshold * 100)))
+    refund = code == TEACHER_NO_SHOW
+
+    platform_fee = np.where(refund, 0, price * platform_fee_bps // BPS)
+    gross = price - platform_fee
+    tx_fee = gross * tx_fee_bps // BPS
+    net = gross - tx_fee
+
+    return {
+        "code": code,
+        "teacher_pct": teacher_pct,
+        "student_pct": student_pct,
+        "teacher_payout": np.where(refund, 0, net),
+        "student_refund": np.where(refund, net, 0),
+        "platform_fee": platform_fee,
+        "tx_fee": tx_fee
+    }
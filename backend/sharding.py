@@ -0,0 +1,24 @@
+import zlib
+
+# Sharded deployment: N backend processes, each owning the lessons whose
+# lessonId hashes to it. Python's hash() is salted per process, so routing
+# uses crc32, which every process (and every client) computes the same way.
+#
+# Wallet balances are partitioned too. Credits (payouts, refunds, fees) land
+# on the shard that settled the lesson and a wallet's total is the sum over
+# shards. Top-ups go to the wallet's home shard. Funding needs the student's
+# money on the lesson's shard; when it is short, the router moves funds over
+# with a transfer (see router.py), which is the only cross-shard operation.
+
+
+def shard_for(key, count):
+    # Shard index for a lessonId or wallet name
+    if count <= 1:
+        return 0
+    return zlib.crc32(str(key).encode()) % count
+
+
+def shard_initial_balances(balances, index, count):
+    # Each wallet's opening balance lives on its home shard only, so a
+    # sharded deployment starts with the same totals as a single process
+    return {wallet: amount if shard_for(wallet, count) == index else 0 for wallet, amount in balances.items()}
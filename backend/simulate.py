@@ -0,0 +1,200 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from money import BPS, from_minor, to_minor
+from settlement import ATTENDANCE_THRESHOLD, HAPPY_PATH, STUDENT_NO_SHOW, STUDENT_OVERRIDE, TEACHER_NO_SHOW, settle_arrays
+
+# Monte-Carlo simulation of lesson outcomes. Generates synthetic lessons from
+# an attendance model, settles them with settle_arrays() (the contract's own
+# kernel) and reports what teachers, students and the platform end up with:
+#
+#   python3 simulate.py --lessons 5000000 --threshold 0.9 0.95 0.97
+#
+# Every threshold is applied to the same generated lessons, so differences
+# between them come from the rule alone. Chunks of lessons are generated and
+# settled in worker processes. With --url the lessons are also funded and
+# settled on a running backend, as a load test.
+
+OUTCOMES = {
+    HAPPY_PATH: "happy_path",
+    TEACHER_NO_SHOW: "teacher_no_show",
+    STUDENT_NO_SHOW: "student_no_show",
+    STUDENT_OVERRIDE: "student_override"
+}
+
+TOTALS = ("volume", "teacher_payout", "student_refund", "platform_fee", "tx_fee")
+
+
+class AttendanceModel:
+    # Each participant independently misses the lesson (`*_no_show_rate`),
+    # leaves early after a uniformly random share of it (`partial_rate`), or
+    # attends all but up to `late_minutes`. A share `override_rate` of
+    # lessons has the student release the payment. Prices are uniform
+    # between `price` and `max_price`, in minor units.
+
+    def __init__(self, duration=60, teacher_no_show_rate=0.02, student_no_show_rate=0.05, partial_rate=0.05, late_minutes=2.0, override_rate=0.01, price=3000, max_price=None):
+        self.duration = duration
+        self.teacher_no_show_rate = teacher_no_show_rate
+        self.student_no_show_rate = student_no_show_rate
+        self.partial_rate = partial_rate
+        self.late_minutes = late_minutes
+        self.override_rate = override_rate
+        self.price = price
+        self.max_price = price if max_price is None else max_price
+
+    def _attendance(self, rng, n, no_show_rate):
+        draw = rng.random(n)
+        minutes = self.duration - rng.uniform(0, self.late_minutes, n)
+        partial = draw < no_show_rate + self.partial_rate
+        minutes[partial] = rng.uniform(0, self.duration, np.count_nonzero(partial))
+        minutes[draw < no_show_rate] = 0
+        return minutes
+
+    def generate(self, rng, n):
+        # (teacher_durations, student_durations, overrides, prices) arrays of n lessons
+        return (
+            self._attendance(rng, n, self.teacher_no_show_rate),
+            self._attendance(rng, n, self.student_no_show_rate),
+            rng.random(n) < self.override_rate,
+            rng.integers(self.price, self.max_price + 1, n, dtype=np.int64)
+        )
+
+
+def aggregate(settled, prices):
+    counts = np.bincount(settled["code"], minlength=len(OUTCOMES))
+    result = {name: int(counts[code]) for code, name in OUTCOMES.items()}
+    result["volume"] = int(prices.sum())
+    for key in TOTALS[1:]:
+        result[key] = int(settled[key].sum())
+    return result
+
+
+def run_chunk(model, n, seed, thresholds, platform_fee_bps, tx_fee_bps):
+    # Aggregates of n lessons, one dict per threshold
+    teacher, student, overrides, prices = model.generate(np.random.default_rng(seed), n)
+    required = np.full(n, model.duration, dtype=np.float64)
+    return [
+        aggregate(settle_arrays(teacher, student, required, prices, platform_fee_bps, tx_fee_bps, overrides, threshold), prices)
+        for threshold in thresholds
+    ]
+
+
+def simulate(model, lessons, thresholds=(ATTENDANCE_THRESHOLD,), platform_fee_bps=200, tx_fee_bps=10, workers=None, chunk_size=1000000, seed=None):
+    # Aggregates of `lessons` simulated lessons, one dict per threshold.
+    # The same seed gives the same results whatever the number of workers.
+    sizes = [chunk_size] * (lessons // chunk_size)
+    if lessons % chunk_size:
+        sizes.append(lessons % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    totals = [dict.fromkeys(list(OUTCOMES.values()) + list(TOTALS), 0) for _ in thresholds]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_chunk, model, n, s, thresholds, platform_fee_bps, tx_fee_bps) for n, s in zip(sizes, seeds)]
+        for future in futures:
+            for total, chunk in zip(totals, future.result()):
+                for key, value in chunk.items():
+                    total[key] += value
+    return totals
+
+
+def report(thresholds, totals, lessons, elapsed):
+    print(f"{lessons} lessons in {elapsed:.2f}s ({lessons / elapsed:,.0f} lessons/s)")
+    for threshold, total in zip(thresholds, totals):
+        print(f"\nthreshold {threshold:.0%}")
+        for name in OUTCOMES.values():
+            print(f"  {name:<18}{total[name]:>12}  {total[name] / lessons:7.2%}")
+        for key in TOTALS:
+            share = total[key] / total["volume"] if total["volume"] else 0
+            print(f"  {key:<18}{from_minor(total[key]):>15,.2f}  {share:7.2%}")
+
+
+def load_test(url, model, lessons, platform_fee_bps=200, tx_fee_bps=10, batch_size=1000, concurrency=16, seed=None):
+    # Funds and settles simulated lessons on a running backend (app.py or
+    # router.py), which settles at the default threshold, and checks the
+    # teacher's and platform's balances moved by what the simulation predicts.
+    # The fee rates must be the backend's.
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    rng = np.random.default_rng(seed)
+    before = session.get(f"{url}/api/state").json()["balances"]
+    expected = {"teacher_payout": 0, "platform_fee": 0}
+    funded = resolved = 0
+    started = time.perf_counter()
+
+    def fund(price):
+        response = session.post(f"{url}/api/fund", json={"price": from_minor(int(price))})
+        response.raise_for_status()
+        return response.json()["lesson_id"]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for start in range(0, lessons, batch_size):
+            n = min(batch_size, lessons - start)
+            teacher, student, overrides, prices = model.generate(rng, n)
+            # Funding takes the price plus the transaction fee
+            deposit = int((prices + prices * tx_fee_bps // BPS).sum())
+            session.post(f"{url}/api/topup", json={"amount": from_minor(deposit)}).raise_for_status()
+            lesson_ids = list(pool.map(fund, prices))
+            funded += n
+            records = [
+                {"lesson_id": lesson_id, "teacher_duration": float(t), "student_duration": float(s), "student_override": bool(o)}
+                for lesson_id, t, s, o in zip(lesson_ids, teacher, student, overrides)
+            ]
+            response = session.post(f"{url}/api/resolve/batch", json={"lessons": records, "required_duration": model.duration})
+            response.raise_for_status()
+            resolved += sum(1 for result in response.json()["results"] if result["success"])
+            settled = settle_arrays(teacher, student, np.full(n, model.duration, dtype=np.float64), prices, platform_fee_bps, tx_fee_bps, overrides)
+            for key in expected:
+                expected[key] += int(settled[key].sum())
+
+    elapsed = time.perf_counter() - started
+    after = session.get(f"{url}/api/state").json()["balances"]
+    print(f"{funded} funded, {resolved} resolved in {elapsed:.2f}s ({(funded + resolved) / elapsed:,.0f} operations/s)")
+    for wallet, key in (("teacher", "teacher_payout"), ("platform", "platform_fee")):
+        moved = to_minor(after[wallet]) - to_minor(before[wallet])
+        status = "ok" if moved == expected[key] else "MISMATCH"
+        print(f"  {wallet:<10}{from_minor(moved):>15,.2f}  expected {from_minor(expected[key]):,.2f}  {status}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte-Carlo simulation of lesson settlement")
+    parser.add_argument('--lessons', type=int, default=1000000, help="number of simulated lessons")
+    parser.add_argument('--threshold', type=float, nargs='+', default=[ATTENDANCE_THRESHOLD], help="attendance thresholds to compare (default: 0.95)")
+    parser.add_argument('--duration', type=float, default=60, help="lesson length in minutes")
+    parser.add_argument('--teacher-no-show', type=float, default=0.02, help="share of lessons the teacher misses")
+    parser.add_argument('--student-no-show', type=float, default=0.05, help="share of lessons the student misses")
+    parser.add_argument('--partial', type=float, default=0.05, help="share of participants who leave early")
+    parser.add_argument('--late', type=float, default=2.0, help="minutes a full attendee may miss")
+    parser.add_argument('--override', type=float, default=0.01, help="share of lessons the student releases regardless")
+    parser.add_argument('--price', type=float, default=30, help="lesson price")
+    parser.add_argument('--max-price', type=float, help="draw prices uniformly between --price and this")
+    parser.add_argument('--platform-fee-bps', type=int, default=200)
+    parser.add_argument('--tx-fee-bps', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=1000000, help="lessons per worker task")
+    parser.add_argument('--seed', type=int, help="random seed, for reproducible runs")
+    parser.add_argument('--url', help="also fund and settle the lessons on the backend at this URL")
+    args = parser.parse_args()
+
+    model = AttendanceModel(
+        duration=args.duration,
+        teacher_no_show_rate=args.teacher_no_show,
+        student_no_show_rate=args.student_no_show,
+        partial_rate=args.partial,
+        late_minutes=args.late,
+        override_rate=args.override,
+        price=to_minor(args.price),
+        max_price=to_minor(args.max_price) if args.max_price is not None else None
+    )
+    if args.url:
+        load_test(args.url.rstrip('/'), model, args.lessons, args.platform_fee_bps, args.tx_fee_bps, seed=args.seed)
+    else:
+        started = time.perf_counter()
+        totals = simulate(model, args.lessons, args.threshold, args.platform_fee_bps, args.tx_fee_bps, args.workers, args.chunk_size, args.seed)
+        report(args.threshold, totals, args.lessons, time.perf_counter() - started)
@@ -0,0 +1,163 @@
+import threading
+from collections import deque
+
+from fastjson import dumps
+
+# Server-Sent Events for /api/events. Every batch of new log entries is
+# encoded once, off the logging path, and handed to each subscriber's
+# bounded queue. A subscriber
+# that falls `queue_size` events behind has its queue dropped and gets a
+# `resync` event instead, carrying the seq to catch up from with
+# /api/state?since=<seq>. Publishers never block on slow consumers.
+
+KEEPALIVE_SECONDS = 15
+
+
+def sse_frame(event, data, event_id=None):
+    frame = f"event: {event}\ndata: {dumps(data)}\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n" + frame
+    return (frame + "\n").encode()
+
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._items = deque()
+        self._queued = 0
+        self._lagged = False
+        self._cond = threading.Condition()
+
+    def offer(self, item, count):
+        with self._cond:
+            if self._lagged:
+                return
+            if self._queued + count > self.queue_size:
+                # Slow consumer: drop what is queued rather than grow or block
+                self._items.clear()
+                self._queued = 0
+                self._lagged = True
+            else:
+                self._items.append(item)
+                self._queued += count
+            self._cond.notify()
+
+    def take(self, timeout=KEEPALIVE_SECONDS):
+        # (items, lagged). Waits up to `timeout` seconds for something to send.
+        with self._cond:
+            if not self._items and not self._lagged:
+                self._cond.wait(timeout)
+            items = list(self._items)
+            lagged = self._lagged
+            self._items.clear()
+            self._queued = 0
+            self._lagged = False
+            return items, lagged
+
+
+class EventHub:
+    # publish() is called under the event log's lock, so it only queues the
+    # entries. One dispatcher thread encodes them, in publish order, and
+    # fans the frames out, so logging never waits on JSON encoding.
+
+    def __init__(self, queue_size=1000, max_subscribers=100):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._pending_cond = threading.Condition()
+        self._dispatcher = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        # None when the subscriber limit is reached
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(self.queue_size)
+            self._subscribers.add(subscriber)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="event-hub", daemon=True)
+                self._dispatcher.start()
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _enqueue(self, item):
+        with self._pending_cond:
+            self._pending.append(item)
+            self._pending_cond.notify()
+
+    def publish(self, epoch, entries, balances):
+        # entries: new log entries, balances: current balances of the wallets
+        # they changed (major units)
+        if self._subscribers:
+            self._enqueue(("events", epoch, entries, balances))
+
+    def publish_reset(self, epoch):
+        if self._subscribers:
+            self._enqueue(("reset", epoch))
+
+    def _dispatch(self):
+        while True:
+            with self._pending_cond:
+                while not self._pending:
+                    self._pending_cond.wait()
+                items = list(self._pending)
+                self._pending.clear()
+            for item in items:
+                if item[0] == "reset":
+                    encoded = ("reset", sse_frame("reset", {"epoch": item[1], "seq": 0}), item[1])
+                    count = 1
+                else:
+                    _, epoch, entries, balances = item
+                    frames = [(entry["seq"], sse_frame(entry["event"] or "log", entry, entry["seq"])) for entry in entries]
+                    encoded = ("events", frames, sse_frame("balances", {"epoch": epoch, "seq": entries[-1]["seq"] + 1, "balances": balances}))
+                    count = len(frames)
+                for subscriber in list(self._subscribers):
+                    subscriber.offer(encoded, count)
+
+
+def stream(hub, subscriber, backlog, epoch, next_seq):
+    # Generator of SSE bytes for one subscriber: the backlog (events the
+    # client missed before connecting, None if too many to replay), then live
+    # events. `next_seq` is the first seq the client hasn't seen, used to
+    # skip live events that were already sent as backlog.
+    try:
+        yield b"retry: 1000\n\n"
+        if backlog is None:
+            yield sse_frame("resync", {"epoch": epoch, "seq": next_seq})
+            backlog = ()
+        for entry in backlog:
+            yield sse_frame(entry["event"] or "log", entry, entry["seq"])
+            next_seq = entry["seq"] + 1
+        while True:
+            items, lagged = subscriber.take()
+            if lagged:
+                yield sse_frame("resync", {"epoch": epoch, "seq": next_seq})
+                continue
+            if not items:
+                yield b": keepalive\n\n"
+                continue
+            for item in items:
+                if item[0] == "reset":
+                    _, frame, epoch = item
+                    next_seq = 0
+                    yield frame
+                    continue
+                _, frames, balances = item
+                sent = False
+                for seq, frame in frames:
+                    if seq >= next_seq:
+                        yield frame
+                        next_seq = seq + 1
+                        sent = True
+                if sent:
+                    yield balances
+    finally:
+        hub.unsubscribe(subscriber)
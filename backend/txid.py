@@ -0,0 +1,130 @@
+import os
+import struct
+import time
+
+# Transaction ids and content-addressed lesson ids, both bytes32-style hex
+# strings like on-chain hashes.
+#
+# A transaction id is laid out as
+#   node id (2 bytes) | instance (8 bytes) | zero padding | sequence (8 bytes)
+# The instance is the creation time in ms plus random bits, so ids never
+# repeat across processes, nodes or resets. The sequence is the event's
+# position in the event log, so an id points straight at its event.
+
+NODE_ID = int(os.environ.get("NODE_ID", 0))
+
+
+class TxIds:
+    def __init__(self, node_id=NODE_ID, prefix=None):
+        # `prefix` restores the ids of an existing log, e.g. after a restart
+        if prefix is None:
+            instance = (int(time.time() * 1000) << 16) | int.from_bytes(os.urandom(2), "big")
+            # Everything but the sequence is fixed, so it is formatted once
+            prefix = f"0x{node_id & 0xFFFF:04x}{instance & 0xFFFFFFFFFFFFFFFF:016x}{'0' * 28}"
+        self.prefix = prefix
+
+    def format(self, seq):
+        return "%s%016x" % (self.prefix, seq)
+
+    def owns(self, tx_id):
+        return tx_id.startswith(self.prefix) and len(tx_id) == len(self.prefix) + 16
+
+
+def seq_from_tx(tx_id):
+    # The event log sequence number embedded in a transaction id
+    return int(tx_id[-16:], 16)
+
+
+def node_from_tx(tx_id):
+    # The node (shard) that issued a transaction id
+    return int(tx_id[2:6], 16)
+
+
+# -----------------------------------------------------------------------------
+# Keccak-256, as used by Solidity's keccak256(). hashlib.sha3_256 uses
+# different padding and gives different digests. pycryptodome is used when
+# installed, otherwise the pure Python version below.
+# -----------------------------------------------------------------------------
+
+_ROUND_CONSTANTS = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008
+]
+_ROTATIONS = [
+    [0, 36, 3, 41, 18],
+    [1, 44, 10, 45, 2],
+    [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56],
+    [27, 20, 39, 8, 14]
+]
+_MASK = 0xFFFFFFFFFFFFFFFF
+_RATE = 136
+
+
+def _rotl(value, shift):
+    return ((value << shift) | (value >> (64 - shift))) & _MASK if shift else value
+
+
+def _keccak_f(state):
+    # state is a 5x5 list of 64-bit lanes, indexed state[x][y]
+    for round_constant in _ROUND_CONSTANTS:
+        c = [state[x][0] ^ state[x][1] ^ state[x][2] ^ state[x][3] ^ state[x][4] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rotl(c[(x + 1) % 5], 1) for x in range(5)]
+        state = [[state[x][y] ^ d[x] for y in range(5)] for x in range(5)]
+        b = [[0] * 5 for _ in range(5)]
+        for x in range(5):
+            for y in range(5):
+                b[y][(2 * x + 3 * y) % 5] = _rotl(state[x][y], _ROTATIONS[x][y])
+        state = [[b[x][y] ^ ((~b[(x + 1) % 5][y]) & b[(x + 2) % 5][y]) for y in range(5)] for x in range(5)]
+        state[0][0] ^= round_constant
+    return state
+
+
+def _keccak256_py(data):
+    padded = bytearray(data) + b"\x01"
+    padded += b"\x00" * (-len(padded) % _RATE)
+    padded[-1] |= 0x80
+    state = [[0] * 5 for _ in range(5)]
+    for offset in range(0, len(padded), _RATE):
+        lanes = struct.unpack_from("<17Q", padded, offset)
+        for i, lane in enumerate(lanes):
+            state[i % 5][i // 5] ^= lane
+        state = _keccak_f(state)
+    return struct.pack("<4Q", state[0][0], state[1][0], state[2][0], state[3][0])
+
+
+try:
+    from Crypto.Hash import keccak as _keccak
+
+    def keccak256(data):
+        return _keccak.new(digest_bits=256, data=data).digest()
+except ImportError:
+    keccak256 = _keccak256_py
+
+
+def _pack_address(value):
+    # 0x-prefixed 20-byte addresses pack as raw bytes, other wallet names as UTF-8
+    if isinstance(value, str) and value.startswith("0x") and len(value) == 42:
+        return bytes.fromhex(value[2:])
+    return str(value).encode()
+
+
+def content_lesson_id(student, teacher, scheduled_start, nonce=0):
+    # keccak256(abi.encodePacked(student, teacher, uint64 scheduledStart, uint256 nonce)):
+    # a bytes32 lessonId derived from the booking, so a retried booking gets
+    # the same id. SmartTutorEscrow.createLesson() takes the lessonId as an
+    # argument and doesn't derive it; clients pass this value. Raises
+    # ValueError for a start or nonce that doesn't fit its type.
+    if not (isinstance(scheduled_start, (int, float)) and not isinstance(scheduled_start, bool) and 0 <= scheduled_start < 2 ** 64):
+        raise ValueError("scheduled_start must be a Unix timestamp.")
+    if not (isinstance(nonce, int) and not isinstance(nonce, bool) and 0 <= nonce < 2 ** 256):
+        raise ValueError("nonce must be a non-negative integer.")
+    packed = (
+        _pack_address(student) + _pack_address(teacher)
+        + int(scheduled_start).to_bytes(8, "big") + int(nonce).to_bytes(32, "big")
+    )
+    return "0x" + keccak256(packed).hex()
@@ -0,0 +1,312 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmarks for the settlement hot paths.
+#
+#   python3 benchmarks/bench.py --scales 1,1000,100000 --output bench.json
+#   python3 benchmarks/bench.py --compare old.json --output new.json
+#
+# Every (case, scale) runs in its own subprocess so peak RSS is per case.
+# Results are written as JSON: one record per case with throughput,
+# p50/p99 latency in microseconds and peak RSS in KB.
+#
+# The serve.* cases start a real backend process, app.py's development
+# server (dev) or uvicorn with asgi.py (asgi), and load it over HTTP from
+# --http-clients keep-alive connections at once. Their throughput is over
+# wall time; peak RSS is the load generator's.
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+SCENARIOS = ("happy_path", "student_no_show", "teacher_no_show", "student_override", "random")
+
+
+def _funded_contract(n):
+    from contract import SmartContract
+    contract = SmartContract()
+    contract.topup_student(n * 10000)
+    for i in range(n):
+        contract.fund_lesson(3000, lesson_id=f"L{i}")
+    return contract
+
+
+def _timed(fn, n):
+    # Calls fn(i) n times and returns per-call latencies in ns
+    latencies = []
+    clock = time.perf_counter_ns
+    for i in range(n):
+        start = clock()
+        fn(i)
+        latencies.append(clock() - start)
+    return latencies
+
+
+def bench_fund_lesson(n, options):
+    from contract import SmartContract
+    contract = SmartContract()
+    contract.topup_student(n * 10000)
+    return _timed(lambda i: contract.fund_lesson(3000, lesson_id=f"L{i}"), n)
+
+
+def bench_resolve_lesson(n, options):
+    contract = _funded_contract(n)
+    return _timed(lambda i: contract.resolve_lesson(60, 60 if i % 2 else 0, lesson_id=f"L{i}"), n)
+
+
+def bench_resolve_many(n, options):
+    contract = _funded_contract(n)
+    records = [(f"L{i}", 60, 60 if i % 2 else 0) for i in range(n)]
+    # One batch, reported per lesson
+    latencies = _timed(lambda i: contract.resolve_many(records), 1)
+    return [latencies[0] // max(n, 1)] * n
+
+
+def bench_resolve_lesson_override(n, options):
+    contract = _funded_contract(n)
+    oracle_data = {"student_override": True}
+    return _timed(lambda i: contract.resolve_lesson(60, 0, oracle_data, lesson_id=f"L{i}"), n)
+
+
+def bench_resolve_many_override(n, options):
+    contract = _funded_contract(n)
+    records = [(f"L{i}", 60, 0, True) for i in range(n)]
+    latencies = _timed(lambda i: contract.resolve_many(records), 1)
+    return [latencies[0] // max(n, 1)] * n
+
+
+def bench_get_state(n, options):
+    contract = _funded_contract(n)
+    calls = min(n, options.max_calls)
+    return _timed(lambda i: contract.get_state(), calls)
+
+
+def bench_get_state_incremental(n, options):
+    contract = _funded_contract(n)
+    seq = len(contract.logs)
+    calls = min(n, options.max_calls)
+    return _timed(lambda i: contract.get_state(since=seq - 1, epoch=contract.epoch), calls)
+
+
+def _flask_client():
+    data_dir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["LEDGER_DIR"] = os.path.join(data_dir, "ledger")
+    os.environ["EVENT_LOG_PATH"] = os.path.join(data_dir, "events.log")
+    import app
+    return app, app.app.test_client()
+
+
+def bench_http_fund(n, options):
+    app, client = _flask_client()
+    calls = min(n, options.max_http)
+    client.post("/api/topup", json={"amount": calls * 100})
+    return _timed(lambda i: client.post("/api/fund", json={"price": 30, "lesson_id": f"L{i}"}), calls)
+
+
+def bench_http_resolve(n, options):
+    app, client = _flask_client()
+    calls = min(n, options.max_http)
+    client.post("/api/topup", json={"amount": calls * 100})
+    for i in range(calls):
+        client.post("/api/fund", json={"price": 30, "lesson_id": f"L{i}"})
+    return _timed(lambda i: client.post("/api/resolve", json={"lesson_id": f"L{i}"}), calls)
+
+
+def bench_http_state(n, options):
+    app, client = _flask_client()
+    app.contract.topup_student(n * 10000)
+    for i in range(n):
+        app.contract.fund_lesson(3000, lesson_id=f"L{i}")
+    calls = min(n, options.max_http)
+    return _timed(lambda i: client.get("/api/state"), calls)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _concurrent(request, calls, clients):
+    # Runs request(session, i) for i < calls over `clients` threads, each
+    # with its own keep-alive session. Returns (latencies in ns, wall ns).
+    import requests
+    local = threading.local()
+    clock = time.perf_counter_ns
+
+    def timed(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = clock()
+        request(session, i)
+        return clock() - start
+
+    start = clock()
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = list(pool.map(timed, range(calls)))
+    return latencies, clock() - start
+
+
+def _bench_serve(asgi, route):
+    def bench(n, options):
+        # The backend started the way router.py starts a shard
+        import requests
+
+        import router
+        (process,) = router.start_shards(1, _free_port(), tempfile.mkdtemp(prefix="bench-"), asgi=asgi)
+        try:
+            router.wait_for_shards()
+            url = router.SHARD_URLS[0]
+            session = requests.Session()
+            lessons = min(n, options.max_http)
+            session.post(f"{url}/api/topup", json={"amount": lessons * 100})
+            for i in range(lessons):
+                session.post(f"{url}/api/fund", json={"price": 30, "lesson_id": f"L{i}"})
+
+            def request(session, i):
+                if route == "state":
+                    response = session.get(f"{url}/api/state")
+                else:
+                    response = session.post(f"{url}/api/topup", json={"amount": 1})
+                response.raise_for_status()
+                response.content
+
+            return _concurrent(request, options.max_http, options.http_clients)
+        finally:
+            process.terminate()
+            process.wait()
+    return bench
+
+
+def _bench_oracle(scenario):
+    def bench(n, options):
+        from oracle import Oracle
+        oracle = Oracle()
+        return _timed(lambda i: oracle.get_meeting_data(scenario), n)
+    return bench
+
+
+CASES = {
+    "contract.fund_lesson": bench_fund_lesson,
+    "contract.resolve_lesson": bench_resolve_lesson,
+    "contract.resolve_many": bench_resolve_many,
+    "contract.resolve_lesson[student_override]": bench_resolve_lesson_override,
+    "contract.resolve_many[student_override]": bench_resolve_many_override,
+    "contract.get_state": bench_get_state,
+    "contract.get_state_incremental": bench_get_state_incremental,
+    "http.fund": bench_http_fund,
+    "http.resolve": bench_http_resolve,
+    "http.state": bench_http_state,
+}
+for _scenario in SCENARIOS:
+    CASES[f"oracle.get_meeting_data[{_scenario}]"] = _bench_oracle(_scenario)
+for _server, _asgi in (("dev", False), ("asgi", True)):
+    for _route in ("state", "topup"):
+        CASES[f"serve.{_server}.{_route}"] = _bench_serve(_asgi, _route)
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_case(name, scale, options):
+    latencies = CASES[name](scale, options)
+    if isinstance(latencies, tuple):
+        # Concurrent requests: throughput over wall time
+        latencies, total_ns = latencies
+    else:
+        total_ns = sum(latencies)
+    latencies.sort()
+    return {
+        "benchmark": name,
+        "scale": scale,
+        "ops": len(latencies),
+        "seconds": total_ns / 1e9,
+        "throughput": len(latencies) / (total_ns / 1e9) if total_ns else 0,
+        "p50_us": _percentile(latencies, 50) / 1000,
+        "p99_us": _percentile(latencies, 99) / 1000,
+        # ru_maxrss is in KB on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def run_isolated(name, scale, options):
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--case", name, "--scale", str(scale),
+        "--max-calls", str(options.max_calls), "--max-http", str(options.max_http),
+        "--http-clients", str(options.http_clients)
+    ]
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=BACKEND_DIR).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(old_path, results):
+    # Prints throughput change per case against an earlier run
+    with open(old_path) as f:
+        old = {(r["benchmark"], r["scale"]): r for r in json.load(f)["results"]}
+    for result in results:
+        before = old.get((result["benchmark"], result["scale"]))
+        if before and before["throughput"]:
+            change = (result["throughput"] / before["throughput"] - 1) * 100
+            print(f"{result['benchmark']:<45} n={result['scale']:<8} {change:+7.1f}% throughput")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Settlement hot path benchmarks")
+    parser.add_argument("--scales", default="1,1000,100000", help="comma-separated lesson counts (up to 1000000)")
+    parser.add_argument("--cases", default="", help="comma-separated case name prefixes, e.g. contract,http")
+    parser.add_argument("--max-calls", type=int, default=10000, help="cap on get_state calls per case")
+    parser.add_argument("--max-http", type=int, default=5000, help="cap on HTTP requests per case")
+    parser.add_argument("--http-clients", type=int, default=16, help="concurrent connections of the serve.* cases")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.case:
+        # Child process: run one case and print its result
+        print(json.dumps(run_case(options.case, options.scale, options)))
+        return
+
+    prefixes = [p for p in options.cases.split(",") if p]
+    names = [name for name in CASES if not prefixes or any(name.startswith(p) for p in prefixes)]
+    results = []
+    for scale in (int(s) for s in options.scales.split(",")):
+        for name in names:
+            result = run_isolated(name, scale, options)
+            results.append(result)
+            print(
+                f"{name:<45} n={scale:<8} {result['throughput']:>12.0f} ops/s  "
+                f"p50 {result['p50_us']:>9.1f}us  p99 {result['p99_us']:>9.1f}us  rss {result['peak_rss_kb'] / 1024:>7.1f}MB"
+            )
+
+    with open(options.output, "w") as f:
+        json.dump({
+            "meta": {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": results
+        }, f, indent=2)
+
+    if options.compare:
+        compare(options.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
+import os
+
+import requests
 import streamlit as st
-import time
-import random
 
 # Configuration
 MATIC_RATE = 8.09 # 1 USD = 8.09 MATIC (State of 12/09/2025: https://de.tradingview.com/symbols/MATICUSD/)
@@ -8,344 +9,169 @@ MATIC_RATE = 8.09 # 1 USD = 8.09 MATIC (State of 12/09/2025: https://de.tradingv
 st.set_page_config(page_title="Smart Contract Tutor", page_icon="👨🏼‍🏫", layout="wide")
 
 # ============================================
-# Smart Contract Logic (embedded)
-# ============================================
-class SmartContract:
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        # Initial Balances (Mock USD)
-        self.balances = {
-            "student": 100,
-            "teacher": 0,
-            "contract": 0,
-            "platform": 0
-        }
-        self.status = "CREATED" # CREATED, FUNDED, COMPLETED, REFUNDED
-        self.lesson_price = 30
-        self.platform_fee_percent = 0.02
-        self.tx_fee_percent = 0.001 
-        self.logs = []
-        self.last_oracle_data = None
-        self.last_outcome = None
-        self.transactions = []
-
-    def log(self, message, tx_hash=None):
-        self.logs.append({"message": message, "tx_hash": tx_hash})
-
-    def topup_student(self, amount):
-        self.balances["student"] += amount
-        self.log(f"Student wallet topped up by ${amount:.2f}.")
-        return True, "Top-up successful."
-
-    def fund_lesson(self, price=30, lesson_title="Lesson"):
-        if self.status not in ["CREATED", "COMPLETED", "REFUNDED"]:
-            return False, "Contract already funded."
-        
-        # Reset state for new lesson if previous was completed
-        if self.status in ["COMPLETED", "REFUNDED"]:
-            self.status = "CREATED"
-            self.last_oracle_data = None
-            self.last_outcome = None
-        
-        self.lesson_price = price
-        tx_fee = price * self.tx_fee_percent
-        total_deduction = price + tx_fee
-
-        if self.balances["student"] < total_deduction:
-            return False, f"Insufficient funds. Need ${total_deduction:.2f}."
-
-        self.balances["student"] -= total_deduction
-        self.balances["contract"] += price
-        self.status = "FUNDED"
-        
-        tx_hash = f"0x{abs(hash(str(time.time()) + 'fund'))}"
-        self.log(f"Student funded '{lesson_title}' (${price:.2f} - ${tx_fee:.2f} fee). Funds locked in Escrow.", tx_hash)
-        return True, "Lesson funded successfully."
-
-    def resolve_lesson(self, teacher_duration, student_duration, oracle_data=None, required_duration=60):
-        if self.status != "FUNDED":
-            return False, "Contract not in funded state."
-
-        self.last_oracle_data = oracle_data
-
-        min_threshold = required_duration * 0.95
-        student_override = oracle_data.get("student_override", False) if oracle_data else False
-
-        payout_teacher = False
-        refund_student = False
-        
-        outcome = "Unknown"
-        
-        teacher_pct = (teacher_duration / required_duration) * 100
-        student_pct = (student_duration / required_duration) * 100
-
-        # Check for student override first - student agrees to release payment regardless of attendance
-        if student_override:
-            outcome = f"Student Override: Student approved payment release. (Teacher: {teacher_pct:.0f}%, Student: {student_pct:.0f}%)"
-            payout_teacher = True
-        elif teacher_duration >= min_threshold and student_duration >= min_threshold:
-            outcome = "Happy Path: Lesson Completed Successfully."
-            payout_teacher = True
-        elif teacher_duration < min_threshold:
-            outcome = f"Teacher No-Show: Student refunded. (Teacher attended {teacher_pct:.0f}%, which is less than the required minimum of 95%)"
-            refund_student = True
-        else:
-            outcome = f"Student No-Show: Teacher compensated. (Teacher was present {teacher_pct:.0f}% of the time, Student only attended {student_pct:.0f}%)"
-            payout_teacher = True
-        
-        self.last_outcome = outcome
-        tx_hash = f"0x{abs(hash(str(time.time()) + 'resolve'))}"
-
-        if payout_teacher:
-            contract_balance = self.balances["contract"]
-            
-            platform_fee = contract_balance * self.platform_fee_percent
-            gross_payout = contract_balance - platform_fee
-            
-            tx_fee = gross_payout * self.tx_fee_percent
-            net_payout = gross_payout - tx_fee
-            
-            self.balances["contract"] = 0
-            self.balances["teacher"] += net_payout
-            self.balances["platform"] += platform_fee
-            
-            self.status = "COMPLETED"
-            self.log(f"Oracle Resolution: {outcome} -> Payout ${net_payout:.2f} to Teacher (Fees: ${platform_fee:.2f} Platform, ${tx_fee:.2f} Tx).", tx_hash)
-        
-        elif refund_student:
-            gross_refund = self.balances["contract"]
-            tx_fee = gross_refund * self.tx_fee_percent
-            net_refund = gross_refund - tx_fee
-            
-            self.balances["contract"] = 0
-            self.balances["student"] += net_refund
-            
-            self.status = "REFUNDED"
-            self.log(f"Oracle Resolution: {outcome} -> Refund ${net_refund:.2f} to Student (Tx Fee: ${tx_fee:.2f}).", tx_hash)
-
-        return True, outcome
-
-    def get_state(self):
-        return {
-            "balances": self.balances,
-            "status": self.status,
-            "logs": self.logs,
-            "lesson_price": self.lesson_price,
-            "last_oracle_data": self.last_oracle_data,
-            "last_outcome": self.last_outcome
-        }
-
-
-# ============================================
-# Oracle Logic (embedded)
-# ============================================
-class Oracle:
-    def __init__(self):
-        self.scenario = "happy_path" # Default
-
-    def set_scenario(self, scenario_key):
-        self.scenario = scenario_key
-
-    def get_meeting_data(self):
-        # Simulating Google Meet API response
-        # Returns duration in minutes
-        
-        if self.scenario == "happy_path":
-            return {
-                "teacher_duration": 60,
-                "student_duration": 60,
-                "raw_json": {
-                    "meetingCode": "abc-defg-hij",
-                    "participants": [
-                        {"email": "teacher@uni.com", "durationSeconds": 3600},
-                        {"email": "student@uni.com", "durationSeconds": 3600}
-                    ]
-                }
-            }
-        elif self.scenario == "student_no_show":
-            return {
-                "teacher_duration": 60,
-                "student_duration": 0,
-                "raw_json": {
-                    "meetingCode": "abc-defg-hij",
-                    "participants": [
-                        {"email": "teacher@uni.com", "durationSeconds": 3600}
-                    ]
-                }
-            }
-        elif self.scenario == "teacher_no_show":
-            return {
-                "teacher_duration": 0,
-                "student_duration": 60,
-                "raw_json": {
-                    "meetingCode": "abc-defg-hij",
-                    "participants": [
-                        {"email": "student@uni.com", "durationSeconds": 3600}
-                    ]
-                }
-            }
-        elif self.scenario == "student_override":
-            # Both attend only 50%, but student agrees to release payment
-            return {
-                "teacher_duration": 30,
-                "student_duration": 30,
-                "student_override": True,
-                "raw_json": {
-                    "meetingCode": "abc-defg-hij",
-                    "participants": [
-                        {"email": "teacher@uni.com", "durationSeconds": 1800},
-                        {"email": "student@uni.com", "durationSeconds": 1800}
-                    ],
-                    "student_override": True,
-                    "override_reason": "Student agreed to release funds to teacher"
-                }
-            }
-        elif self.scenario == "random":
-            t_dur = random.randint(0, 60)
-            s_dur = random.randint(0, 60)
-            return {
-                "teacher_duration": t_dur,
-                "student_duration": s_dur,
-                "raw_json": {
-                    "meetingCode": "abc-defg-hij",
-                    "participants": [
-                        {"email": "teacher@uni.com", "durationSeconds": t_dur * 60},
-                        {"email": "student@uni.com", "durationSeconds": s_dur * 60}
-                    ]
-                }
-            }
-        else:
-            # Default fallback
-            return {
-                "teacher_duration": 0,
-                "student_duration": 0,
-                "raw_json": {}
-            }
-
-
-# ============================================
-# Initialize Session State
+# Backend Client
 # ============================================
-if "contract" not in st.session_state:
-    st.session_state.contract = SmartContract()
-if "oracle" not in st.session_state:
-    st.session_state.oracle = Oracle()
-
-contract = st.session_state.contract
-oracle = st.session_state.oracle
-
-# Custom CSS (Dark Lovable Theme)
-st.markdown("""
-<style>
-    /* Global Font */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap');
-    
-    html, body, [class*="css"]  {
-        font-family: 'Inter', sans-serif;
-        color: #E2E8F0; /* Light Gray Text */
-    }
-
-    /* Main Background */
-    .stApp {
-        background-color: #1A1F2C; /* Dark Blue/Gray Background */
-    }
-    
-    /* Sidebar */
-    section[data-testid="stSidebar"] {
-        background-color: #11141D; /* Darker Sidebar */
-        border-right: 1px solid #2D3748;
-    }
-    
-    /* Sidebar Text */
-    section[data-testid="stSidebar"] .stMarkdown, 
-    section[data-testid="stSidebar"] label {
-        color: #A0AEC0;
-    }
-
-    /* Gradient Title */
-    .gradient-text {
-        background: linear-gradient(135deg, #9b87f5 0%, #D6BCFA 100%); /* Lighter Purple Gradient */
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-weight: 800;
-        font-size: 3em;
-        padding-bottom: 10px;
-    }
-
-    /* Buttons */
-    div.stButton > button {
-        background: linear-gradient(135deg, #9b87f5 0%, #7E69AB 100%);
-        color: white;
-        border: none;
-        border-radius: 12px;
-        padding: 0.6rem 1.2rem;
-        font-weight: 600;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.3);
-        transition: all 0.2s;
-    }
-    div.stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 10px 15px -3px rgba(155, 135, 245, 0.4);
-        color: white;
-        border: 1px solid #D6BCFA;
-    }
-    div.stButton > button:active {
-        transform: translateY(0);
-    }
-
-    /* Metrics */
-    div[data-testid="stMetricValue"] {
-        color: #D6BCFA !important; /* Light Purple */
-        font-weight: 700;
-        font-size: 2.2rem !important;
-    }
-    div[data-testid="stMetricLabel"] {
-        color: #94A3B8; /* Slate Gray */
-        font-weight: 500;
-    }
-    
-    /* Cards/Containers */
-    .stInfo, .stSuccess, .stWarning, .stError {
-        background-color: #2D3748; /* Dark Card Background */
-        color: #E2E8F0;
-        border-radius: 12px;
-        border: 1px solid #4A5568;
-    }
-    
-    /* Expander */
-    .streamlit-expanderHeader {
-        background-color: #2D3748;
-        border-radius: 8px;
-        color: #E2E8F0;
-    }
-    div[data-testid="stExpander"] {
-        background-color: #1A1F2C;
-        border: 1px solid #4A5568;
-        border-radius: 8px;
-    }
-    
-    /* Code Blocks */
-    code {
-        color: #D6BCFA;
-        background-color: #11141D;
-    }
-</style>
-""", unsafe_allow_html=True)
+# The UI drives backend/app.py (or the sharded router.py), so every session
+# sees the same ledger. Amounts are USD on the wire.
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:5000")
+REQUEST_TIMEOUT = 10
+# Log entries kept per browser session, older ones are dropped from view
+LOG_LIMIT = 10000
+
+
+def merge_state(state, update):
+    # Applies a state response to the session's copy. Incremental responses
+    # only carry new log entries and the balances they changed.
+    if state is None or not update.get("incremental"):
+        return update
+    merged = dict(update)
+    merged["balances"] = {**state["balances"], **update["balances"]}
+    merged["logs"] = (state["logs"] + update["logs"])[-LOG_LIMIT:]
+    return merged
+
+
+class BackendClient:
+    # One keep-alive connection pool shared by all browser sessions (see
+    # get_backend). Each call takes the session's cached state and returns
+    # it brought up to date, so a rerun costs one small request.
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _cursor(self, cached):
+        if cached is None:
+            return {}
+        return {"since": cached["state"]["seq"], "epoch": cached["state"]["epoch"]}
+
+    def refresh(self, cached):
+        # GET /api/state since the cached copy. 304 when nothing changed.
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        response = self.session.get(f"{self.base_url}/api/state", params=self._cursor(cached), headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return cached
+        response.raise_for_status()
+        return {"state": merge_state(cached and cached["state"], response.json()), "etag": response.headers.get("ETag")}
+
+    def policy(self):
+        response = self.session.get(f"{self.base_url}/api/policy", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path, cached, **body):
+        # Returns (response json, updated cache). The backend answers every
+        # action with the state changes since the cached copy.
+        body.update(self._cursor(cached))
+        # The sharded router otherwise answers with one shard's share only
+        body["merged"] = True
+        response = self.session.post(f"{self.base_url}{path}", json=body, timeout=REQUEST_TIMEOUT)
+        data = response.json()
+        if data.get("state") is not None:
+            cached = {"state": merge_state(cached and cached["state"], data["state"]), "etag": None}
+        return data, cached
+
+
+@st.cache_resource
+def get_backend():
+    return BackendClient(BACKEND_URL)
+
+backend = get_backend()
+
+# Lessons booked from this page are 60 minutes long (the backend's default)
+LESSON_MINUTES = 60
+
+
+@st.cache_resource
+def get_policy():
+    # The backend's compiled settlement policy (backend/policy.py):
+    # table[override][teacherPct][studentPct] is an outcome code
+    return backend.policy()
+
+
+def outcome_name(oracle_data):
+    # The policy's outcome for a lesson's attendance, as the contract sees it
+    policy = get_policy()
+    def pct(minutes):
+        return max(0, min(100, int(minutes / LESSON_MINUTES * 100)))
+    code = policy["table"][int(bool(oracle_data.get("student_override")))][pct(oracle_data["teacher_duration"])][pct(oracle_data["student_duration"])]
+    return policy["outcomes"][str(code)]
+
+# Custom CSS (Dark Lovable Theme). Base colors and font come from
+# .streamlit/config.toml, only what the theme can't express is injected here.
+st.markdown("""<style>
+.gradient-text{background:linear-gradient(135deg,#9b87f5 0%,#D6BCFA 100%);-webkit-background-clip:text;-webkit-text-fill-color:transparent;font-weight:800;font-size:3em;padding-bottom:10px}
+section[data-testid="stSidebar"]{border-right:1px solid #2D3748}
+div.stButton>button{background:linear-gradient(135deg,#9b87f5 0%,#7E69AB 100%);color:white;border:none;border-radius:12px;padding:.6rem 1.2rem;font-weight:600;box-shadow:0 4px 6px -1px rgba(0,0,0,.3);transition:all .2s}
+div.stButton>button:hover{transform:translateY(-2px);box-shadow:0 10px 15px -3px rgba(155,135,245,.4);color:white;border:1px solid #D6BCFA}
+div[data-testid="stMetricValue"]{color:#D6BCFA!important;font-weight:700;font-size:2.2rem!important}
+div[data-testid="stMetricLabel"]{color:#94A3B8;font-weight:500}
+div[data-testid="stExpander"]{border:1px solid #4A5568;border-radius:8px}
+code{color:#D6BCFA}
+</style>""", unsafe_allow_html=True)
+
+LOG_PAGE_SIZE = 50
+TX_EXPLORER_URL = "https://amoy.polygonscan.com/tx/0xe695d8b80f4d094672af19477bbc9ec536dff2bdf0b90df7c78c920c07c8d579"
 
 # --- Helper Functions ---
-def get_state():
-    return contract.get_state()
-
 def format_currency(amount):
-    matic_val = amount * MATIC_RATE
     return f"{amount:.2f} USD"
 
 def format_matic(amount):
     matic_val = amount * MATIC_RATE
     return f"~{matic_val:.2f} MATIC"
 
+# Button callbacks run before the next script run, so the page is drawn
+# once with the new state instead of sleeping and calling st.rerun()
+def call_backend(path, **body):
+    try:
+        data, st.session_state.ledger = backend.post(path, st.session_state.get("ledger"), **body)
+    except requests.RequestException as e:
+        st.session_state.backend_error = f"Backend request failed: {e}"
+        return None
+    return data
+
+def topup():
+    if call_backend("/api/topup", amount=100) is not None:
+        st.toast("Added 100 USD", icon="💰")
+
+# Each browser session works on its own lesson, kept in st.session_state.lesson
+# as {lesson_id, status, oracle_data, outcome, epoch}. The backend's "current
+# lesson" is whichever any session funded last.
+def fund(price, lesson_title, toast):
+    data = call_backend("/api/fund", price=price, lesson_title=lesson_title)
+    if data is None:
+        return
+    if data["status"] == "success":
+        st.session_state.lesson = {
+            "lesson_id": data["lesson_id"],
+            "status": "FUNDED",
+            "oracle_data": None,
+            "outcome": None,
+            "epoch": st.session_state.ledger["state"]["epoch"]
+        }
+        st.toast(toast, icon="✅")
+    else:
+        st.session_state.fund_error = data["message"]
+
+def resolve(scenario_key):
+    lesson = st.session_state.get("lesson")
+    if lesson is None:
+        return
+    data = call_backend("/api/resolve", scenario=scenario_key, lesson_id=lesson["lesson_id"])
+    if data is None:
+        return
+    if data.get("status") in ("COMPLETED", "REFUNDED"):
+        lesson.update(status=data["status"], oracle_data=data["oracle_data"], outcome=data["contract_outcome"])
+    else:
+        st.session_state.backend_error = data.get("contract_outcome", "Resolution failed.")
+
+def reset():
+    call_backend("/api/reset")
+    st.session_state.pop("lesson", None)
+    st.session_state.log_page = 1
+
 # --- Sidebar ---
 st.sidebar.title("Settings")
 
@@ -377,11 +203,7 @@ st.sidebar.markdown(
     unsafe_allow_html=True
 )
 
-if st.sidebar.button("Add 100 USD to Student"):
-    contract.topup_student(100)
-    st.toast("Added 100 USD", icon="💰")
-    time.sleep(0.5)
-    st.rerun()
+st.sidebar.button("Add 100 USD to Student", on_click=topup)
 
 st.sidebar.markdown("---")
 
@@ -398,13 +220,11 @@ scenario_map = {
     "Random": "random"
 }
 
-# Removed manual "Apply Scenario" button to avoid confusion. 
+# Removed manual "Apply Scenario" button to avoid confusion.
 # Scenario is now sent with the resolve request.
 
 st.sidebar.markdown("---")
-if st.sidebar.button("Reset System"):
-    contract.reset()
-    st.rerun()
+st.sidebar.button("Reset System", on_click=reset)
 
 # --- Main UI ---
 
@@ -416,11 +236,25 @@ st.markdown("### Trustless Payments via Smart Contract & Oracle")
 st.markdown(f"**Current Lesson:** {lesson_type}")
 st.markdown("**Teacher:** Alice (Verified)")
 
-# Fetch State
-state = get_state()
+# Fetch State: one request per rerun, only what changed since the last one
+try:
+    st.session_state.ledger = backend.refresh(st.session_state.get("ledger"))
+except requests.RequestException as e:
+    st.error(f"Backend not reachable at {BACKEND_URL}: {e}")
+    st.stop()
+state = st.session_state.ledger["state"]
+
+backend_error = st.session_state.pop("backend_error", None)
+if backend_error:
+    st.error(backend_error)
+
+# A reset (by any session) starts a new epoch and drops every lesson
+lesson = st.session_state.get("lesson")
+if lesson is not None and lesson["epoch"] != state["epoch"]:
+    lesson = st.session_state.lesson = None
 
 balances = state['balances']
-status = state['status']
+status = lesson["status"] if lesson else "CREATED"
 logs = state['logs']
 
 # 1. Wallet Display
@@ -451,7 +285,7 @@ c1, c2, c3 = st.columns(3)
 with c1:
     with st.container(border=True):
         st.markdown("#### 1. Agreement & Funding")
-        
+
         # Prominent Booking Card
         st.markdown(f"""
         <div style="
@@ -468,34 +302,24 @@ with c1:
             <div style="color: #A0AEC0; font-size: 0.75em;">60 Minutes • Live 1-on-1</div>
         </div>
         """, unsafe_allow_html=True)
-        
+
         if status == "CREATED":
-            if st.button(f"Fund Lesson ({lesson_price} USD)"):
-                success, message = contract.fund_lesson(lesson_price, lesson_type)
-                if success:
-                    st.toast("Funded Successfully!", icon="✅")
-                    time.sleep(1)
-                    st.rerun()
-                else:
-                    st.error(message)
+            st.button(f"Fund Lesson ({lesson_price} USD)", on_click=fund, args=(lesson_price, lesson_type, "Funded Successfully!"))
         elif status == "FUNDED":
             st.success("✅ Lesson Funded")
         elif status in ["COMPLETED", "REFUNDED"]:
             st.markdown("---")
-            if st.button("Start New Lesson"):
-                success, message = contract.fund_lesson(lesson_price, lesson_type)
-                if success:
-                    st.toast("New Lesson Funded!", icon="✅")
-                    time.sleep(1)
-                    st.rerun()
-                else:
-                    st.error(message)
+            st.button("Start New Lesson", on_click=fund, args=(lesson_price, lesson_type, "New Lesson Funded!"))
+
+        fund_error = st.session_state.pop("fund_error", None)
+        if fund_error:
+            st.error(fund_error)
 
 with c2:
     with st.container(border=True):
         st.markdown("#### 2. The Lesson")
         st.markdown("Simulating Google Meet session...")
-        
+
         if status == "FUNDED":
             st.markdown(f"[**Join Google Meet**](https://meet.google.com/fac-hbvx-pjz)")
             st.info("Waiting for lesson completion...")
@@ -505,31 +329,18 @@ with c2:
 with c3:
     with st.container(border=True):
         st.markdown("#### 3. Oracle Resolution")
-        
+
         # Always show Oracle Data if available
-        if state.get('last_oracle_data'):
+        if lesson and lesson["oracle_data"]:
             with st.expander("View Oracle API Response", expanded=True):
-                st.json(state['last_oracle_data'])
+                st.json(lesson["oracle_data"])
 
         if status == "FUNDED":
-            if st.button("Trigger Oracle Resolution"):
-                with st.spinner("Oracle querying Google Meet API..."):
-                    time.sleep(1.5) # Fake delay for effect
-                    # Set the scenario and get meeting data
-                    oracle.set_scenario(scenario_map[scenario])
-                    data = oracle.get_meeting_data()
-                    # Resolve the lesson via smart contract
-                    contract.resolve_lesson(
-                        teacher_duration=data['teacher_duration'],
-                        student_duration=data['student_duration'],
-                        oracle_data=data
-                    )
-                    time.sleep(1)
-                    st.rerun()
+            st.button("Trigger Oracle Resolution", on_click=resolve, args=(scenario_map[scenario],))
         elif status in ["COMPLETED", "REFUNDED"]:
-            outcome = state.get('last_outcome', 'Unknown')
-            
-            if "Happy Path" in outcome:
+            outcome = lesson["outcome"] or "Unknown"
+
+            if lesson["oracle_data"] and outcome_name(lesson["oracle_data"]) in ("Happy Path", "Student Override"):
                 st.success(f"✅ Contract Settled: {outcome}")
             else:
                 st.warning(f"⚠️ Contract Settled: {outcome}")
@@ -539,16 +350,26 @@ with c3:
 st.markdown("---")
 st.subheader("📜 Smart Contract Logs")
 
-for log in reversed(logs):
+# Newest first, one page at a time in a single table, so render time
+# doesn't grow with the history
+pages = max(1, -(-len(logs) // LOG_PAGE_SIZE))
+if st.session_state.get("log_page", 1) > pages:
+    st.session_state.log_page = pages
+page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="log_page")
+end = len(logs) - (page - 1) * LOG_PAGE_SIZE
+rows = []
+for log in reversed(logs[max(0, end - LOG_PAGE_SIZE):end]):
     # Handle both old string logs and new dict logs
     if isinstance(log, dict):
-        msg = log['message']
-        tx = log.get('tx_hash')
+        rows.append({"Event": f"> {log['message']}", "Transaction": TX_EXPLORER_URL if log.get('tx_hash') else None})
     else:
-        msg = log
-        tx = None
-        
-    st.code(f"> {msg}", language="text")
-    if tx:
-        st.markdown(f"[View Transaction on PolygonScan](https://amoy.polygonscan.com/tx/0xe695d8b80f4d094672af19477bbc9ec536dff2bdf0b90df7c78c920c07c8d579)")
-    st.markdown("---")
+        rows.append({"Event": f"> {log}", "Transaction": None})
+st.dataframe(
+    rows,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "Event": st.column_config.TextColumn(width="large"),
+        "Transaction": st.column_config.LinkColumn(display_text="View on PolygonScan")
+    }
+)
@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend modules import each other by name, as when run from backend/
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+# app.py builds its contract at import, so it gets a throwaway ledger
+APP_DATA_DIR = tempfile.mkdtemp(prefix='smarttutor-tests-')
+os.environ.setdefault('LEDGER_DIR', os.path.join(APP_DATA_DIR, 'ledger'))
+os.environ.setdefault('EVENT_LOG_PATH', os.path.join(APP_DATA_DIR, 'events.log'))
+
+
+@pytest.fixture
+def client():
+    import app
+    app.contract.reset()
+    return app.app.test_client()
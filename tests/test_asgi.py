@@ -0,0 +1,53 @@
+import socket
+import time
+
+import pytest
+import requests
+
+pytest.importorskip('uvicorn')
+pytest.importorskip('a2wsgi')
+import router
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # One backend under uvicorn that allows a single event stream
+    monkeypatch.setenv('EVENT_MAX_SUBSCRIBERS', '1')
+    (process,) = router.start_shards(1, free_port(), str(tmp_path), asgi=True)
+    try:
+        router.wait_for_shards()
+        yield router.SHARD_URLS[0]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_routes_are_served(server):
+    response = requests.post(f'{server}/api/topup', json={'amount': 5}, timeout=10)
+    assert response.status_code == 200
+    assert response.json()['status'] == 'success'
+    assert requests.get(f'{server}/api/state?since=abc', timeout=10).status_code == 400
+
+
+def test_a_disconnected_stream_is_unsubscribed(server):
+    stream = requests.get(f'{server}/api/events', stream=True, timeout=10)
+    assert next(stream.iter_content(None)).startswith(b'retry:')
+    assert requests.get(f'{server}/api/events', stream=True, timeout=10).status_code == 503
+    stream.close()
+
+    # The next frame the stream produces ends it
+    requests.post(f'{server}/api/topup', json={'amount': 5}, timeout=10)
+    deadline = time.monotonic() + 10
+    while True:
+        response = requests.get(f'{server}/api/events', stream=True, timeout=10)
+        response.close()
+        if response.status_code == 200:
+            break
+        assert time.monotonic() < deadline, 'stream was not unsubscribed'
+        time.sleep(0.1)
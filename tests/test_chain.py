@@ -0,0 +1,175 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('eth_tester')
+from eth_account import Account
+from web3 import EthereumTesterProvider, Web3
+
+from chain import (
+    ALREADY_RESOLVED, ERROR_SELECTOR, LESSON_RESOLUTION_FAILED, RESOLVE_LESSONS, ResolutionRelay, SettlementSubmitter,
+    encode_resolve_lessons, encode_uint, failed_resolutions
+)
+from contract import SmartContract
+from money import to_minor
+
+
+@pytest.fixture
+def w3():
+    return Web3(EthereumTesterProvider())
+
+
+@pytest.fixture
+def oracle(w3):
+    account = Account.create()
+    w3.eth.send_transaction({'from': w3.eth.accounts[0], 'to': account.address, 'value': 10 ** 20})
+    return account
+
+
+@pytest.fixture
+def submitter(w3, oracle):
+    # The calls go to an address without code, which accepts any calldata
+    submitter = SettlementSubmitter(w3, Account.create().address, oracle, poll_interval=0.02)
+    submitter.start()
+    yield submitter
+    submitter.stop(drain=False)
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def sent_calls(w3, submitter):
+    # Calldata of every transaction the submitter got mined, in nonce order
+    calls = []
+    for number in range(w3.eth.block_number + 1):
+        for tx in w3.eth.get_block(number, full_transactions=True)['transactions']:
+            if tx['from'] == submitter.account.address:
+                calls.append((tx['nonce'], bytes(tx['input'] if 'input' in tx else tx['data'])))
+    return [data for _, data in sorted(calls)]
+
+
+def test_submitter_pipelines_nonces(w3, submitter):
+    start = submitter.next_nonce()
+    futures = [submitter.submit('0x' + f'{i:064x}', 100, 100) for i in range(40)]
+    receipts = [future.result(timeout=30) for future in futures]
+    assert all(receipt['status'] == 1 for receipt in receipts)
+    assert w3.eth.get_transaction_count(submitter.account.address) == start + 40
+    wait_for(lambda: len(submitter) == 0)
+    assert submitter.confirmed == 40
+
+
+def resolved_ledger(tmp_path):
+    contract = SmartContract(event_log_path=str(tmp_path / 'events.log'))
+    contract.topup_student(to_minor(1000))
+    lessons = {'paid': '0x' + '01' * 32, 'override': '0x' + '02' * 32, 'local': 'L1'}
+    for lesson_id in lessons.values():
+        contract.fund_lesson(to_minor(10), lesson_id=lesson_id)
+    contract.resolve_lesson(60, 60, lesson_id=lessons['paid'])
+    contract.resolve_lesson(10, 0, {'student_override': True}, lesson_id=lessons['override'])
+    contract.resolve_lesson(60, 60, lesson_id=lessons['local'])
+    return contract, lessons
+
+
+def test_relay_skips_local_ids_and_sends_overrides_as_approvals(tmp_path, w3, submitter):
+    contract, lessons = resolved_ledger(tmp_path)
+    relay = ResolutionRelay(contract, submitter, str(tmp_path / 'chain.cursor'), poll_interval=0.02)
+    relay.start()
+    wait_for(lambda: relay.submitted == 2 and len(submitter) == 0 and submitter.confirmed == 1)
+    relay.stop()
+
+    assert relay.skipped == 1
+    assert relay.errors == 0
+    assert sent_calls(w3, submitter) == [encode_resolve_lessons([(lessons['paid'], 100, 100), (lessons['override'], 100, 100)])]
+    with open(tmp_path / 'chain.cursor') as f:
+        assert int(f.read().split()[1]) == len(contract.logs)
+
+
+def test_relay_retries_a_batch_that_could_not_be_submitted(tmp_path, w3, submitter, monkeypatch):
+    contract, lessons = resolved_ledger(tmp_path)
+    submit_batch = submitter.submit_batch
+    calls = []
+
+    def flaky(resolutions, gas_limit):
+        calls.append(resolutions)
+        if len(calls) == 1:
+            raise ConnectionError('node unavailable')
+        return submit_batch(resolutions, gas_limit)
+
+    monkeypatch.setattr(submitter, 'submit_batch', flaky)
+    relay = ResolutionRelay(contract, submitter, str(tmp_path / 'chain.cursor'), poll_interval=0.02)
+    relay.start()
+    wait_for(lambda: submitter.confirmed == 1)
+    relay.stop()
+
+    assert relay.errors == 1
+    assert relay.last_error == 'node unavailable'
+    assert calls[0] == calls[1]
+    assert [data[:4] for data in sent_calls(w3, submitter)] == [RESOLVE_LESSONS]
+
+
+def resolution_failed_log(lesson_id, reason):
+    # LessonResolutionFailed(lessonId, Error(reason)) as a receipt log
+    message = reason.encode()
+    error = ERROR_SELECTOR + encode_uint(32) + encode_uint(len(message)) + message.ljust(-(-len(message) // 32) * 32, b'\0')
+    data = encode_uint(32) + encode_uint(len(error)) + error.ljust(-(-len(error) // 32) * 32, b'\0')
+    return {'topics': [LESSON_RESOLUTION_FAILED, bytes.fromhex(lesson_id[2:])], 'data': data}
+
+
+class ScriptedSubmitter:
+    # Mines every batch at once; `failures` maps a lesson id to the revert
+    # reasons of its next attempts
+    def __init__(self, failures):
+        self.failures = failures
+        self.batches = []
+
+    def submit_batch(self, resolutions, gas_limit):
+        self.batches.append([resolution[0] for resolution in resolutions])
+        logs = [
+            resolution_failed_log(resolution[0], self.failures[resolution[0]].pop(0))
+            for resolution in resolutions if self.failures.get(resolution[0])
+        ]
+        future = Future()
+        future.set_result({'status': 1, 'logs': logs})
+        return [(resolutions, future)]
+
+
+def test_failed_resolutions_decodes_revert_reasons():
+    lesson_id = '0x' + 'ab' * 32
+    receipt = {'logs': [resolution_failed_log(lesson_id, 'Lesson not funded')]}
+    assert failed_resolutions(receipt) == {lesson_id: 'Lesson not funded'}
+
+
+def test_relay_retries_lessons_the_contract_could_not_resolve(tmp_path):
+    contract, lessons = resolved_ledger(tmp_path)
+    submitter = ScriptedSubmitter({
+        lessons['paid']: ['Lesson not funded', 'Lesson not funded'],
+        lessons['override']: [ALREADY_RESOLVED]
+    })
+    relay = ResolutionRelay(contract, submitter, str(tmp_path / 'chain.cursor'), poll_interval=0.02, retry_delay=0)
+    relay.start()
+    wait_for(lambda: len(submitter.batches) == 3)
+    time.sleep(0.1)
+    relay.stop()
+
+    # The lesson settled on-chain already is not sent again
+    assert submitter.batches == [[lessons['paid'], lessons['override']], [lessons['paid']], [lessons['paid']]]
+    assert relay.retried == 2
+    assert relay.failed == 0
+    assert relay.errors == 3
+
+
+def test_relay_gives_up_after_max_retries(tmp_path):
+    contract, lessons = resolved_ledger(tmp_path)
+    submitter = ScriptedSubmitter({lessons['paid']: ['Lesson not funded'] * 3})
+    relay = ResolutionRelay(contract, submitter, str(tmp_path / 'chain.cursor'), poll_interval=0.02, max_retries=2, retry_delay=0)
+    relay.start()
+    wait_for(lambda: relay.failed == 1)
+    relay.stop()
+
+    assert len(submitter.batches) == 3
+    assert relay.retried == 2
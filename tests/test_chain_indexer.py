@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+pytest.importorskip('web3')
+from chain_indexer import ChainIndexer
+
+
+class FakeEth:
+    # A chain of `block_number` empty blocks whose eth_getLogs refuses
+    # ranges of more than `max_range` blocks with `error`
+    def __init__(self, block_number, max_range=None, error=None):
+        self.block_number = block_number
+        self.max_range = max_range
+        self.error = error
+        self.ranges = []
+
+    def get_block(self, number):
+        return {'hash': number.to_bytes(32, 'big')}
+
+    def get_logs(self, params):
+        size = params['toBlock'] - params['fromBlock'] + 1
+        self.ranges.append(size)
+        if self.max_range is not None and size > self.max_range:
+            raise self.error
+        return []
+
+
+class FakeWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+def indexer(tmp_path, eth, **kwargs):
+    return ChainIndexer(FakeWeb3(eth), '0x' + '11' * 20, str(tmp_path / 'chain.db'), **kwargs)
+
+
+def test_a_range_the_node_refuses_shrinks_and_the_ceiling_recovers(tmp_path):
+    eth = FakeEth(1000, max_range=10, error=ValueError({'code': -32005, 'message': 'query returned more than 10000 results'}))
+    chain = indexer(tmp_path, eth, batch_blocks=16, max_batch_blocks=64, ceiling_recovery=5)
+    chain.sync()
+    assert chain.cursor() == 1000
+    # The refused size is only tried again every `ceiling_recovery` ranges
+    refused = [size for size in eth.ranges if size > 10]
+    assert len(refused) <= 1 + (len(eth.ranges) - len(refused)) // 5
+
+    # The node lifts its limit: ranges grow back to max_batch_blocks
+    eth.max_range = None
+    eth.block_number = 3000
+    chain.sync()
+    assert chain.cursor() == 3000
+    assert max(eth.ranges) == 64
+
+
+def test_other_errors_dont_shrink_ranges(tmp_path):
+    eth = FakeEth(1000, max_range=0, error=ConnectionError('connection refused'))
+    chain = indexer(tmp_path, eth, batch_blocks=16, max_batch_blocks=64)
+    with pytest.raises(ConnectionError):
+        chain.sync()
+    assert eth.ranges == [16]
+    assert chain.batch_blocks == 16
+    assert chain.cursor() == -1
+
+
+def test_cursor_is_read_from_other_threads(tmp_path):
+    chain = indexer(tmp_path, FakeEth(100))
+    chain.sync()
+    cursors = []
+    thread = threading.Thread(target=lambda: cursors.append(chain.cursor()))
+    thread.start()
+    thread.join()
+    assert cursors == [100]
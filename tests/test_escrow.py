@@ -0,0 +1,142 @@
+import time
+
+import pytest
+
+pytest.importorskip('eth_tester')
+from eth_account import Account
+from web3 import EthereumTesterProvider, Web3
+
+from chain import ALREADY_RESOLVED, ResolutionRelay, SettlementSubmitter, failed_resolutions, resolution_batches
+from contract import SmartContract
+from escrow import SolcUnavailable, compile_escrow, deploy_escrow
+from money import to_minor
+from policy import TABLE, pays_teacher
+from policy_check import contract_pays_teacher
+
+# Runs the real SmartTutorEscrow.sol on an in-process chain. Needs py-solc-x
+# and a solc binary; skipped without them.
+
+try:
+    COMPILED = compile_escrow()
+except SolcUnavailable as e:
+    pytest.skip(str(e), allow_module_level=True)
+
+PRICE = 10 ** 18
+FEE = 10 ** 17
+# LessonStatus.ResolvedPaid and ResolvedRefunded
+PAID = 2
+REFUNDED = 3
+# Attendance percentages around the thresholds, old and new
+BOUNDARIES = (0, 4, 5, 50, 94, 95, 99, 100)
+
+
+@pytest.fixture
+def w3():
+    return Web3(EthereumTesterProvider())
+
+
+@pytest.fixture
+def oracle(w3):
+    account = Account.create()
+    w3.eth.send_transaction({'from': w3.eth.accounts[0], 'to': account.address, 'value': 10 ** 20})
+    return account
+
+
+@pytest.fixture
+def escrow(w3, oracle):
+    # The platform wallet is a fresh account, so the first fee creates it
+    return deploy_escrow(w3, Account.create().address, oracle.address, compiled=COMPILED)
+
+
+@pytest.fixture
+def submitter(w3, escrow, oracle):
+    submitter = SettlementSubmitter(w3, escrow.address, oracle, poll_interval=0.02)
+    submitter.start()
+    yield submitter
+    submitter.stop(drain=False)
+
+
+def create_lesson(w3, escrow, number, fund=True):
+    # A lesson with its own teacher account that doesn't exist on-chain yet,
+    # the worst case for the payout's gas
+    lesson_id = '0x' + f'{number + 1:064x}'
+    student = w3.eth.accounts[1]
+    escrow.functions.createLesson(lesson_id, Account.create().address, PRICE, FEE, 0, 60).transact({'from': student})
+    if fund:
+        fund_lesson(w3, escrow, lesson_id)
+    return lesson_id
+
+
+def fund_lesson(w3, escrow, lesson_id):
+    escrow.functions.fundLesson(lesson_id).transact({'from': w3.eth.accounts[1], 'value': PRICE + FEE})
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def test_lesson_gas_is_an_upper_bound(w3, escrow, submitter):
+    lessons = [create_lesson(w3, escrow, i) for i in range(20)]
+    resolutions = [(lesson_id, 100, 100) for lesson_id in lessons]
+    ((_, _, gas),) = resolution_batches(resolutions)
+    ((_, future),) = submitter.submit_batch(resolutions, 8000000)
+    receipt = future.result(timeout=30)
+
+    # A lesson that ran out of gas would be reported as failed, not revert
+    assert failed_resolutions(receipt) == {}
+    assert receipt['gasUsed'] <= gas
+    assert [escrow.functions.lessons(lesson_id).call()[6] for lesson_id in lessons] == [PAID] * len(lessons)
+
+
+def test_resolving_twice_reports_the_lesson(w3, escrow, submitter):
+    lesson_id = create_lesson(w3, escrow, 0)
+    first = submitter.submit_batch([(lesson_id, 100, 100)], 8000000)[0][1].result(timeout=30)
+    second = submitter.submit_batch([(lesson_id, 100, 100)], 8000000)[0][1].result(timeout=30)
+
+    assert failed_resolutions(first) == {}
+    assert failed_resolutions(second) == {lesson_id: ALREADY_RESOLVED}
+
+
+def test_relay_retries_a_lesson_until_it_is_funded(tmp_path, w3, escrow, submitter):
+    lesson_id = create_lesson(w3, escrow, 0, fund=False)
+    contract = SmartContract(event_log_path=str(tmp_path / 'events.log'))
+    contract.topup_student(to_minor(1000))
+    contract.fund_lesson(to_minor(10), lesson_id=lesson_id)
+    contract.resolve_lesson(100, 100, lesson_id=lesson_id)
+
+    relay = ResolutionRelay(contract, submitter, str(tmp_path / 'chain.cursor'), poll_interval=0.02, retry_delay=0.5)
+    relay.start()
+    try:
+        wait_for(lambda: relay.errors == 1)
+        fund_lesson(w3, escrow, lesson_id)
+        wait_for(lambda: escrow.functions.lessons(lesson_id).call()[6] == PAID)
+    finally:
+        relay.stop()
+
+    assert relay.retried >= 1
+    assert relay.failed == 0
+
+
+def test_pays_teacher_matches_the_policy_table(escrow):
+    # policy_check.py runs every input; these are the ones around the thresholds
+    inputs = [(override, teacher, student) for override in (0, 1) for teacher in BOUNDARIES for student in BOUNDARIES]
+    expected = [pays_teacher(int(TABLE[case])) for case in inputs]
+    assert contract_pays_teacher(escrow, inputs) == expected
+
+
+@pytest.mark.parametrize('teacher_pct, student_pct, status', [
+    (100, 100, PAID),
+    # Refunded under the contract's earlier rules
+    (95, 50, PAID),
+    (100, 0, PAID),
+    (94, 100, REFUNDED),
+    (0, 0, REFUNDED)
+])
+def test_resolve_lesson_settles_like_the_backend(w3, escrow, submitter, teacher_pct, student_pct, status):
+    lesson_id = create_lesson(w3, escrow, 0)
+    receipt = submitter.submit(lesson_id, teacher_pct, student_pct).result(timeout=30)
+    assert receipt['status'] == 1
+    assert escrow.functions.lessons(lesson_id).call()[6] == status
@@ -0,0 +1,29 @@
+import json
+
+import numpy as np
+
+from fastjson import dumps
+
+WEI = 243 * 10 ** 18
+
+
+def test_integers_beyond_64_bits_are_encoded():
+    assert json.loads(dumps({"totalAmount": WEI, "teacherPct": np.int8(95), 3: "Student Override"})) == {
+        "totalAmount": WEI, "teacherPct": 95, "3": "Student Override"
+    }
+
+
+class Indexer:
+    def query(self, lesson_id, event, since_block, limit):
+        return [{"event": "LessonFunded", "lesson_id": "0x" + "01" * 32, "totalAmount": WEI, "block_number": 7, "log_index": 0}]
+
+    def cursor(self):
+        return 7
+
+
+def test_chain_events_with_wei_amounts(client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'chain_indexer', Indexer())
+    response = client.get('/api/chain/events')
+    assert response.status_code == 200
+    assert response.get_json()['events'][0]['totalAmount'] == WEI
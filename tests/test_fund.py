@@ -0,0 +1,29 @@
+import pytest
+
+from txid import content_lesson_id, keccak256
+
+
+def test_content_lesson_id_packs_the_booking():
+    student = "0x" + "11" * 20
+    teacher = "0x" + "22" * 20
+    packed = bytes.fromhex("11" * 20 + "22" * 20) + (1700000000).to_bytes(8, "big") + (7).to_bytes(32, "big")
+    assert content_lesson_id(student, teacher, 1700000000, 7) == "0x" + keccak256(packed).hex()
+
+
+@pytest.mark.parametrize("scheduled_start, nonce", [("tomorrow", 0), (-1, 0), (2 ** 64, 0), (1700000000, -1), (1700000000, "x"), (1700000000, 1.5)])
+def test_content_lesson_id_rejects_invalid_booking(scheduled_start, nonce):
+    with pytest.raises(ValueError):
+        content_lesson_id("student", "teacher", scheduled_start, nonce)
+
+
+@pytest.mark.parametrize("body", [{"scheduled_start": "tomorrow"}, {"scheduled_start": 1700000000, "nonce": "x"}])
+def test_fund_rejects_invalid_booking(client, body):
+    response = client.post('/api/fund', json=dict(body, price=1))
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+def test_fund_derives_lesson_id_from_booking(client):
+    response = client.post('/api/fund', json={"price": 1, "scheduled_start": 1700000000, "nonce": 3})
+    assert response.status_code == 200
+    assert response.get_json()['lesson_id'] == content_lesson_id("student", "teacher", 1700000000, 3)
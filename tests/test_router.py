@@ -0,0 +1,135 @@
+import socket
+import uuid
+
+import pytest
+
+import router
+from contract import INITIAL_BALANCES
+from money import fee, from_minor
+from sharding import shard_for
+
+SHARDS = 2
+
+
+def free_port_pair():
+    # A port whose successor is free as well, shard i listens on base + i
+    while True:
+        with socket.socket() as first:
+            first.bind(('127.0.0.1', 0))
+            base = first.getsockname()[1]
+            try:
+                with socket.socket() as second:
+                    second.bind(('127.0.0.1', base + 1))
+                    return base
+            except OSError:
+                continue
+
+
+@pytest.fixture(scope='module')
+def shards(tmp_path_factory):
+    processes = router.start_shards(SHARDS, free_port_pair(), str(tmp_path_factory.mktemp('shards')))
+    try:
+        router.wait_for_shards()
+        yield processes
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+@pytest.fixture
+def client(shards):
+    client = router.app.test_client()
+    client.post('/api/reset')
+    return client
+
+
+def balances(shard):
+    return router.call(shard, 'GET', '/api/shard/balances').json()
+
+
+def totals():
+    infos = [balances(shard) for shard in range(SHARDS)]
+    summed = {}
+    for info in infos:
+        for wallet, amount in info['balances'].items():
+            summed[wallet] = summed.get(wallet, 0) + amount
+    return summed, infos
+
+
+def lesson_on(shard):
+    while True:
+        lesson_id = '0x' + uuid.uuid4().hex * 2
+        if shard_for(lesson_id, SHARDS) == shard:
+            return lesson_id
+
+
+def test_transfer_moves_funds_once(client):
+    home = shard_for('student', SHARDS)
+    other = 1 - home
+    assert router.transfer('student', 2500, home, other)
+    assert balances(home)['balances']['student'] == INITIAL_BALANCES['student'] - 2500
+    assert balances(other)['balances']['student'] == 2500
+
+    # Every step is idempotent per transfer id, as recovery repeats them
+    transfer_id = uuid.uuid4().hex
+    body = {'wallet': 'student', 'amount': 1000, 'transfer_id': transfer_id, 'target': other}
+    for _ in range(2):
+        assert router.call(home, 'POST', '/api/shard/transfer_out', json=body).status_code == 200
+    for _ in range(2):
+        router.complete_transfer(transfer_id, 'student', 1000, home, other)
+    summed, infos = totals()
+    assert summed['student'] == INITIAL_BALANCES['student']
+    assert balances(other)['balances']['student'] == 3500
+    assert all(not info['in_flight'] for info in infos)
+
+
+def test_transfer_out_without_funds_fails(client):
+    home = shard_for('student', SHARDS)
+    assert not router.transfer('student', INITIAL_BALANCES['student'] + 1, home, 1 - home)
+    summed, infos = totals()
+    assert summed['student'] == INITIAL_BALANCES['student']
+
+
+def test_recover_transfers_finishes_half_done_transfer(client):
+    home = shard_for('student', SHARDS)
+    other = 1 - home
+    # The router stopped after step 1: the funds are in flight
+    router.call(home, 'POST', '/api/shard/transfer_out', json={
+        'wallet': 'student', 'amount': 4000, 'transfer_id': 'crashed', 'target': other
+    }).raise_for_status()
+    assert balances(home)['in_flight'] == {'student': 4000}
+
+    router.recover_transfers()
+    assert router.call(home, 'GET', '/api/shard/transfers').json()['transfers'] == {}
+    assert balances(home)['in_flight'] == {}
+    assert balances(other)['balances']['student'] == 4000
+    assert totals()[0]['student'] == INITIAL_BALANCES['student']
+
+
+def test_fund_pulls_funds_to_the_lessons_shard(client):
+    home = shard_for('student', SHARDS)
+    lesson_id = lesson_on(1 - home)
+    response = client.post('/api/fund', json={'price': 30, 'lesson_id': lesson_id})
+    assert response.status_code == 200, response.get_json()
+    summed, infos = totals()
+    # The lesson's shard holds the escrow, the transaction fee is gone
+    assert infos[1 - home]['balances']['contract'] == 3000
+    assert summed['student'] == INITIAL_BALANCES['student'] - 3000 - fee(3000, infos[1 - home]['tx_fee_bps'])
+    assert all(not info['in_flight'] for info in infos)
+
+
+def test_merged_state_sums_shards_and_continues_from_cursor(client):
+    state = client.get('/api/state').get_json()
+    assert not state['incremental']
+    assert state['balances'] == {wallet: from_minor(amount) for wallet, amount in INITIAL_BALANCES.items()}
+    assert len(state['seq'].split('.')) == SHARDS
+
+    client.post('/api/topup', json={'amount': 5, 'state': False})
+    delta = client.get(f"/api/state?since={state['seq']}&epoch={state['epoch']}").get_json()
+    assert delta['incremental']
+    assert [entry['event'] for entry in delta['logs']] == ['WalletToppedUp']
+    assert delta['balances'] == {'student': from_minor(INITIAL_BALANCES['student']) + 5}
+
+    assert client.get('/api/state?since=a.b').status_code == 400
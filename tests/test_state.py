@@ -0,0 +1,40 @@
+from contract import SmartContract
+
+
+def topups(contract, count):
+    for _ in range(count):
+        contract.topup_student(100)
+
+
+def test_incremental_state_returns_only_new_entries(tmp_path):
+    contract = SmartContract(event_log_capacity=50, event_log_path=str(tmp_path / 'events.log'))
+    seq = contract.get_state()['seq']
+    topups(contract, 3)
+    state = contract.get_state(since=seq, epoch=contract.epoch)
+    assert state['incremental']
+    assert len(state['logs']) == 3
+    assert set(state['balances']) == {'student'}
+
+
+def test_cursor_beyond_ring_capacity_gets_snapshot(tmp_path):
+    contract = SmartContract(event_log_capacity=50, event_log_path=str(tmp_path / 'events.log'))
+    topups(contract, 2000)
+    state = contract.get_state(since=0, epoch=contract.epoch)
+    assert not state['incremental']
+    assert len(state['logs']) <= 50
+    # Exactly one ring behind is still a delta
+    state = contract.get_state(since=state['seq'] - 50, epoch=contract.epoch)
+    assert state['incremental']
+    assert len(state['logs']) == 50
+
+
+def test_state_rejects_invalid_cursor(client):
+    assert client.get('/api/state?since=abc').status_code == 400
+    assert client.get('/api/state?since=0&epoch=x').status_code == 400
+    assert client.get('/api/state?since=0').status_code == 200
+
+
+def test_operation_with_invalid_cursor_returns_snapshot(client):
+    response = client.post('/api/topup', json={'amount': 1, 'since': 'abc'})
+    assert response.status_code == 200
+    assert response.get_json()['state']['incremental'] is False